@@ -0,0 +1,518 @@
+from __future__ import print_function
+import argparse, collections, functools, hashlib, itertools, json, os, re, shutil, sys, tempfile, threading, time, types
+from driveDownloader import DriveDownloader, MB
+
+# Fake Drive v3 service serving in-memory files. Every service instance owns one
+# connection throttled to bandwidth bytes/s with a fixed per-request latency,
+# which is how a single Drive HTTP connection behaves from EC2.
+class FakeDriveService(object):
+
+    def __init__(self, store, bandwidth, latency=0.05):
+        self.store = store
+        self.http = FakeHttp(store, bandwidth, latency)
+
+    def files(self):
+        return FakeFiles(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(callback)
+
+class FakeBatch(object):
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for requestId, request in self.requests:
+            response = request.execute()
+            if self.callback is not None:
+                self.callback(requestId, response, None)
+
+class FakeDriveStore(object):
+
+    def __init__(self):
+        self.files = {}
+        self.names = {}
+        # the md5Checksum Drive reports for each file
+        self.md5s = {}
+        self.deleted = []
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def add(self, name, content, mimeType='image/tiff'):
+        with self.lock:
+            fileId = 'fake{0}'.format(next(self._ids))
+            self.files[fileId] = content
+            self.names[fileId] = (name, mimeType)
+            self.md5s[fileId] = hashlib.md5(content).hexdigest()
+        return fileId
+
+class FakeHttp(object):
+
+    def __init__(self, store, bandwidth, latency):
+        self.store = store
+        self.bandwidth = bandwidth
+        self.latency = latency
+
+    def request(self, uri, method='GET', headers=None, body=None):
+        content = self.store.files[uri.split('/')[-1]]
+        status = 200
+        if headers and 'range' in headers:
+            start, end = headers['range'].split('=')[1].split('-')
+            content = content[int(start):int(end)+1]
+            status = 206
+        time.sleep(self.latency + len(content)/float(self.bandwidth))
+        return FakeResponse(status), content
+
+class FakeResponse(object):
+
+    def __init__(self, status):
+        self.status = status
+
+class FakeRequest(object):
+
+    def __init__(self, http, uri, result=None):
+        self.http = http
+        self.uri = uri
+        self.headers = {}
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+class FakeFiles(object):
+
+    def __init__(self, service):
+        self.service = service
+        self.store = service.store
+
+    def get_media(self, fileId):
+        return FakeRequest(self.service.http, 'fake://drive/' + fileId)
+
+    def get(self, fileId, fields=None):
+        return FakeRequest(self.service.http, None, {'id': fileId, 'size': str(len(self.store.files[fileId])), 'md5Checksum': self.store.md5s[fileId]})
+
+    def delete(self, fileId):
+        with self.store.lock:
+            self.store.files.pop(fileId, None)
+            self.store.names.pop(fileId, None)
+            self.store.deleted.append(fileId)
+        return FakeRequest(self.service.http, None, '')
+
+    # answers the stored files matching the query, one page at a time
+    def list(self, pageSize=100, q=None, fields=None, pageToken=None):
+        with self.store.lock:
+            files = [{'id': i, 'name': n, 'mimeType': m, 'size': str(len(self.store.files[i])), 'md5Checksum': self.store.md5s[i]}
+                     for i, (n, m) in sorted(self.store.names.items()) if _matches(q, n, m)]
+        start = int(pageToken or 0)
+        result = {'files': files[start:start+pageSize]}
+        if start + pageSize < len(files):
+            result['nextPageToken'] = str(start + pageSize)
+        return FakeRequest(self.service.http, None, result)
+
+# answer True when a Drive file satisfies a query made of mimeType = / != and
+# name contains terms joined by and, the only ones the pipeline uses
+def _matches(q, name, mimeType):
+    for term in (q or '').split(' and '):
+        term = term.strip()
+        if not term:
+            continue
+        field, op, value = re.match(r"(\w+)\s*(!=|=|contains)\s*'(.*)'", term).groups()
+        value = value.replace('*', '').replace("\\'", "'")
+        if field == 'mimeType' and (mimeType == value) != (op == '='):
+            return False
+        if field == 'name' and value not in name:
+            return False
+    return True
+
+# answer a fake Drive holding count shards of sizeMB each, named like GEE exports
+def fakeShards(count, sizeMB):
+    store = FakeDriveStore()
+    content = os.urandom(sizeMB*MB)
+    items = []
+    for i in range(count):
+        name = 'SWIR{0}-Latest-Change-Between-2024-and-2023L8CONUS-{1:010d}-0000000000.tif'.format(i % 5 or '', i)
+        fileId = store.add(name, content)
+        items.append({'id': fileId, 'name': name, 'size': str(len(content)), 'md5Checksum': store.md5s[fileId]})
+    return store, items
+
+# time the download engine with the given settings against a fresh fake Drive
+def benchDownload(count, sizeMB, bandwidth, latency, **settings):
+    store, items = fakeShards(count, sizeMB)
+    workDir = tempfile.mkdtemp()
+    try:
+        downloader = DriveDownloader(lambda: FakeDriveService(store, bandwidth, latency), workDir, **settings)
+        started = time.time()
+        done, errors = downloader.downloadAll(items)
+        if errors:
+            raise errors[0][1]
+        elapsed = time.time() - started
+        assert len(store.deleted) == count
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return elapsed, count*sizeMB/elapsed
+
+# write one synthetic uint8 change shard on the EPSG:5070 30 m grid with its upper left corner at (x, y)
+def syntheticShard(path, width, height, x=0.0, y=0.0, seed=0, srs='EPSG:5070'):
+    import numpy as np
+    from osgeo import gdal, osr
+    target = osr.SpatialReference()
+    target.SetFromUserInput(srs)
+    rng = np.random.default_rng(seed)
+    ds = gdal.GetDriverByName('GTiff').Create(path, width, height, 1, gdal.GDT_Byte, ['TILED=YES', 'COMPRESS=DEFLATE'])
+    ds.SetGeoTransform((x, 30.0, 0.0, y, 0.0, -30.0))
+    ds.SetProjection(target.ExportToWkt())
+    # mostly unchanged pixels around 128 with patches of change
+    data = np.clip(rng.normal(128, 12, (height, width)), 0, 255).astype(np.uint8)
+    data[height//4:height//2, width//4:width//2] = 200
+    ds.GetRasterBand(1).WriteArray(data)
+    ds = None
+    return path
+
+# write count synthetic uint8 change shards side by side on one EPSG:5070 30 m grid
+# @return the shard paths
+def syntheticShards(workDir, count, width, height, srs='EPSG:5070'):
+    return [syntheticShard(os.path.join(workDir, 'SWIR{0}-Latest-Change-Between-2024-and-2023L8CONUS-{1:010d}-0000000000.tif'.format(i % 5 or '', i)),
+                           width, height, i*width*30.0, 0.0, i, srs) for i in range(count)]
+
+# time mosaicking synthetic shards with a full warp and with the VRT fast path
+def benchMosaic(count, width, height):
+    from mosaicExecutor import warp
+    workDir = tempfile.mkdtemp()
+    try:
+        shards = syntheticShards(workDir, count, width, height)
+        timings = []
+        for mode in ('warp', 'auto'):
+            started = time.time()
+            warp(shards, os.path.join(workDir, mode + '.tif'), mode=mode)
+            timings.append((mode, time.time() - started))
+        return timings
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# time translating synthetic shards with a gdal_translate process per raster, the way
+# the pipeline used to, and in process to COG
+def benchTranslate(count, width, height):
+    import subprocess
+    from gdalTranslate import translateToCOG
+    workDir = tempfile.mkdtemp()
+    try:
+        shards = syntheticShards(workDir, count, width, height)
+        started = time.time()
+        for i, shard in enumerate(shards):
+            subprocess.check_call(['gdal_translate', '-q', shard, os.path.join(workDir, 'subprocess{0}.tif'.format(i)), '-co', 'TILED=YES',
+                                   '-co', 'COPY_SRC_OVERVIEWS=YES', '-co', 'COMPRESS=DEFLATE', '-co', 'BIGTIFF=YES'])
+        timings = [('subprocess', time.time() - started)]
+        started = time.time()
+        for i, shard in enumerate(shards):
+            translateToCOG(shard, os.path.join(workDir, 'cog{0}.tif'.format(i)))
+        timings.append(('in-process cog', time.time() - started))
+        return timings
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# Fake ee module. Exports submitted through batch.Export run on a timer: READY for
+# a quarter of their runtime, then RUNNING, then COMPLETED, at which point their files
+# appear on the fake Drive. data.getTaskList reports them like GEE does.
+# @param
+#     [store] - the FakeDriveStore exports land in
+#     [exportSeconds] - runtime of the first export, later ones take up to twice as long
+#     [filesFor] - callable answering the (name, content, mimeType) files of an export config
+class FakeEE(object):
+
+    def __init__(self, store, exportSeconds, filesFor, clock=time.time):
+        self.store = store
+        self.exportSeconds = exportSeconds
+        self.filesFor = filesFor
+        self.clock = clock
+        self.tasks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+        self.data = types.SimpleNamespace(getTaskList=self.getTaskList)
+        exports = types.SimpleNamespace(toDrive=self._toDrive)
+        self.batch = types.SimpleNamespace(Export=types.SimpleNamespace(image=exports, table=exports))
+
+    def ServiceAccountCredentials(self, account, keyFile):
+        return None
+
+    def Initialize(self, credentials=None, **kwargs):
+        pass
+
+    def _toDrive(self, **config):
+        return FakeTask(self, 'FAKE{0:04d}'.format(next(self._ids)), config)
+
+    def _start(self, task):
+        with self.lock:
+            count = len(self.tasks)
+            task.created = self.clock()
+            task.runtime = self.exportSeconds*(1 + (count % 5)/4.0)
+            self.tasks[task.id] = task
+
+    # answer every started task, landing the files of those that completed since the last call
+    def getTaskList(self):
+        now = self.clock()
+        answer = []
+        with self.lock:
+            tasks = list(self.tasks.values())
+        for task in tasks:
+            elapsed = now - task.created
+            status = {'id': task.id, 'description': task.config.get('description', ''), 'task_type': 'EXPORT_IMAGE',
+                      'creation_timestamp_ms': int(task.created*1000), 'update_timestamp_ms': int(min(now, task.created + task.runtime)*1000)}
+            if elapsed < task.runtime/4.0:
+                status['state'] = 'READY'
+            else:
+                status['start_timestamp_ms'] = int((task.created + task.runtime/4.0)*1000)
+                if elapsed < task.runtime:
+                    status.update(state='RUNNING', progress=elapsed/task.runtime)
+                else:
+                    status['state'] = 'COMPLETED'
+                    if not task.landed:
+                        for name, content, mimeType in self.filesFor(task.config):
+                            self.store.add(name, content, mimeType)
+                        task.landed = True
+            answer.append(status)
+        return answer
+
+class FakeTask(object):
+
+    def __init__(self, ee, taskId, config):
+        self.ee = ee
+        self.id = taskId
+        self.config = config
+        self.landed = False
+
+    def start(self):
+        self.ee._start(self)
+
+# fileDimensions of the export scripts, the size of every file GEE writes to Drive
+FILE_DIMENSIONS = {'latest': (75264, 55808), 'yearly': (35840, 56320)}
+BENCH_INDICES = ['SWIR', 'NDMI', 'NDVI']
+# the four CONUS exports of each latest change index
+LATEST_PARTS = ['', '1', '2', '4']
+BENCH_STATES = ['LA', 'AR', 'MS', 'KY', 'TN', 'OK', 'VA', 'SC', 'NC', 'GA', 'AL', 'TX', 'FL', 'PR', 'VI']
+
+# answer the image exports the export scripts submit for a run, as (description, slot)
+# where slot places the export side by side with the others on one grid, and the CSV exports
+def benchExports(yearly, states=3):
+    if yearly:
+        product = 'SWIR-Custom-Change-Between-2024-and-2023'
+        images = [(product + 'L8CONUS', 0), (product + 'L8PRVI', 1)]
+        images += [(product + state + 'L8', 2 + i) for i, state in enumerate(BENCH_STATES[:states])]
+    else:
+        product = '-Latest-Change-Between-2024-and-2023'
+        images = [(index + part + product + 'L8CONUS', slot) for index in BENCH_INDICES for slot, part in enumerate(LATEST_PARTS)]
+        images += [(index + product + 'L8PRVI', len(LATEST_PARTS)) for index in BENCH_INDICES]
+        product = 'SWIR' + product
+    return images, [product + kind + 'L8' for kind in ('scenesBegin', 'scenesEnd')]
+
+# answer the files each export lands on Drive: shardsPerExport synthetic shards of the
+# export's fileDimensions scaled by scale, named the way GEE names shards, or a small CSV
+def benchFiles(workDir, yearly, scale, shardsPerExport, states=3):
+    fullWidth, fullHeight = FILE_DIMENSIONS['yearly' if yearly else 'latest']
+    width, height = max(256, int(fullWidth*scale)), max(256, int(fullHeight*scale))
+    images, tables = benchExports(yearly, states)
+    contents = {}
+    files = {}
+    for description, slot in images:
+        files[description] = []
+        for j in range(shardsPerExport):
+            column = slot*shardsPerExport + j
+            if column not in contents:
+                path = syntheticShard(os.path.join(workDir, 'shard.tif'), width, height, column*width*30.0, 0.0, column)
+                with open(path, 'rb') as f:
+                    contents[column] = f.read()
+                os.remove(path)
+            files[description].append(('{0}-0000000000-{1:010d}.tif'.format(description, j*fullWidth), contents[column], 'image/tiff'))
+    for description in tables:
+        files[description] = [(description + '.csv', b'system:index,date\n0,2024-01-01\n', 'text/csv')]
+    return images, tables, files
+
+# run pipeline.main end to end against a fake GEE, a fake Drive and a moto S3 server,
+# with exports landing synthetic shards
+# @return [('end to end', seconds)] followed by the seconds of each stage and phase from the run metrics
+def benchPipeline(yearly=False, scale=0.05, shardsPerExport=2, states=3, exportSeconds=5.0, bandwidth=50*MB, latency=0.05,
+                  pollSeconds=1.0, outputMode='local'):
+    import boto3
+    from moto.server import ThreadedMotoServer
+    from taskTracker import TaskTracker
+    workDir = tempfile.mkdtemp()
+    downloadDir, outputDir = os.path.join(workDir, 'download') + '/', os.path.join(workDir, 'output') + '/'
+    os.makedirs(downloadDir)
+    os.makedirs(outputDir)
+    store = FakeDriveStore()
+    images, tables, files = benchFiles(workDir, yearly, scale, shardsPerExport, states)
+    fakeEE = FakeEE(store, exportSeconds, lambda config: files[config['description']])
+    # the pipeline reads its settings from userConfig, which never exists on a benchmark machine
+    config = types.ModuleType('userConfig')
+    config.__dict__.update(AWS_ACCESS_KEY_ID='benchmark', AWS_SECRET_ACCESS_KEY='benchmark', downloadDir=downloadDir,
+                           outputGeoTIFFDir=outputDir, ids_file=os.path.join(workDir, 'ids.txt'), drive_key_file=None,
+                           credentials_file=None, geeService_account='benchmark', geeServiceAccountCredentials=None)
+    sys.modules['userConfig'] = config
+    try:
+        import ee
+    except ImportError:
+        sys.modules['ee'] = fakeEE
+    sys.modules.pop('pipeline', None)
+    import pipeline
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    argv = sys.argv
+    try:
+        host, port = server.get_host_and_port()
+        endpoint = 'http://{0}:{1}'.format(host, port)
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        s3 = boto3.client('s3', endpoint_url=endpoint, aws_access_key_id='benchmark', aws_secret_access_key='benchmark')
+        s3.create_bucket(Bucket='data.southfact.com')
+        # submit the exports the way the export scripts do
+        ids = []
+        for description, slot in images:
+            task = fakeEE.batch.Export.image.toDrive(description=description, scale=30, fileDimensions=list(FILE_DIMENSIONS['yearly' if yearly else 'latest']))
+            task.start()
+            ids.append(task.id)
+        for description in tables:
+            task = fakeEE.batch.Export.table.toDrive(description=description, fileFormat='CSV')
+            task.start()
+            ids.append(task.id)
+        with open(config.ids_file, 'w') as f:
+            f.write(''.join(',{0}'.format(i) for i in ids))
+        pipeline.ee = fakeEE
+        pipeline.build = lambda *args, **kwargs: FakeDriveService(store, bandwidth, latency)
+        pipeline.ServiceAccountCredentials = types.SimpleNamespace(from_json_keyfile_name=lambda *args, **kwargs: None)
+        pipeline.TaskTracker = functools.partial(TaskTracker, minDelay=pollSeconds, maxDelay=pollSeconds)
+        pipeline._s3Client = None
+        manifestPath, metricsPath = os.path.join(workDir, 'manifest.json'), os.path.join(workDir, 'metrics.jsonl')
+        sys.argv = ['pipeline.py', '-manifest', manifestPath, '-metrics', metricsPath, '-log', os.path.join(workDir, 'pipeline.log'),
+                    '-s3Endpoint', endpoint, '-outputMode', outputMode]
+        if yearly:
+            sys.argv += ['-yearly', '-year', '2024', '-bucket', '2024-2023/']
+        started = time.time()
+        pipeline.main()
+        timings = [('end to end', time.time() - started)]
+        # the manifest is only removed once every output was verified in S3
+        if os.path.exists(manifestPath):
+            raise RuntimeError('the pipeline run was not fully published, see ' + os.path.join(workDir, 'pipeline.log'))
+        with open(metricsPath) as f:
+            records = [json.loads(line) for line in f]
+        timings += [(r['stage'], r['seconds']) for r in records if r.get('summary') and r['stage'] not in ('phase', 'run')]
+        timings += [('phase ' + r['name'], r['seconds']) for r in records if r['stage'] == 'phase' and not r.get('summary')]
+        return timings
+    finally:
+        sys.argv = argv
+        server.stop()
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# time polygonizing a synthetic change raster as one tile in one process and tiled across a pool
+def benchPolygonize(width, height):
+    import polygonizer
+    workDir = tempfile.mkdtemp()
+    try:
+        raster = syntheticShard(os.path.join(workDir, 'change.tif'), width, height)
+        timings = []
+        for label, settings in (('single tile', dict(tileSize=max(width, height), workers=1)), ('tiled', dict())):
+            started = time.time()
+            polygonizer.polygonize(raster, os.path.join(workDir, label.replace(' ', '') + '.fgb'), vectorFormat='fgb', **settings)
+            timings.append((label, time.time() - started))
+        return timings
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# time publishing count files of sizeMB to a moto S3 one part at a time and with the pooled publisher
+def benchUpload(count, sizeMB):
+    import boto3
+    from moto import mock_aws
+    from s3Publisher import S3Publisher
+    workDir = tempfile.mkdtemp()
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    try:
+        content = os.urandom(sizeMB*MB)
+        paths = []
+        for i in range(count):
+            paths.append(os.path.join(workDir, 'upload{0}.tif'.format(i)))
+            with open(paths[-1], 'wb') as f:
+                f.write(content)
+        timings = []
+        with mock_aws():
+            client = boto3.client('s3')
+            client.create_bucket(Bucket='data.southfact.com')
+            for label, settings in (('sequential', dict(workers=1, objectConcurrency=1)), ('pooled', dict())):
+                publisher = S3Publisher('data.southfact.com', label + '/', client=client, **settings)
+                started = time.time()
+                assert all(publisher.publish(paths))
+                timings.append((label, time.time() - started))
+        return timings
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# compare timings with a baseline of label to seconds
+# @return a line for every label slower than its baseline by more than tolerance
+def regressions(timings, baseline, tolerance):
+    return ['{0}: {1:.2f} s against {2:.2f} s'.format(label, seconds, baseline[label])
+            for label, seconds in timings if label in baseline and seconds > baseline[label]*(1 + tolerance)]
+
+STAGES = ['download', 'mosaic', 'translate', 'polygonize', 'upload', 'pipeline']
+
+def parseCmdLine():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline stages against fake services.')
+    parser.add_argument('stage', choices=STAGES, help="stage to benchmark, pipeline runs pipeline.main end to end")
+    parser.add_argument('-files',help="number of shards", type=int, default=15)
+    parser.add_argument('-sizeMB',help="size of each shard in MB", type=int, default=64)
+    parser.add_argument('-bandwidthMB',help="bandwidth of one fake Drive connection in MB/s", type=float, default=50)
+    parser.add_argument('-latency',help="seconds of latency per fake Drive request", type=float, default=0.05)
+    parser.add_argument('-shardPixels',help="width and height in pixels of each synthetic shard", type=int, default=4096)
+    parser.add_argument('-yearly',help="in the pipeline benchmark, run the yearly change products", action='store_true')
+    parser.add_argument('-scale',help="in the pipeline benchmark, size of the synthetic shards relative to the export fileDimensions", type=float, default=0.05)
+    parser.add_argument('-shardsPerExport',help="in the pipeline benchmark, number of shards each export writes", type=int, default=2)
+    parser.add_argument('-states',help="in the yearly pipeline benchmark, number of state exports", type=int, default=3)
+    parser.add_argument('-exportSeconds',help="in the pipeline benchmark, runtime of a fake export", type=float, default=5)
+    parser.add_argument('-outputMode',help="in the pipeline benchmark, the pipeline -outputMode", choices=['local', 's3'], default='local')
+    parser.add_argument('-baseline',help="JSON file of label to seconds; the benchmark fails when a label is slower by more than -tolerance")
+    parser.add_argument('-tolerance',help="allowed slowdown against the baseline, as a fraction", type=float, default=0.25)
+    parser.add_argument('-saveBaseline',help="write the timings of this run to the -baseline file", action='store_true')
+    return parser.parse_args()
+
+def main():
+    args = parseCmdLine()
+    if args.stage == 'download':
+        bandwidth = args.bandwidthMB*MB
+        # the old loop: one file at a time, one connection, 100 MB chunks
+        configs = [('sequential', dict(workers=1, rangeWorkers=1, chunkSize=100*MB)),
+                   ('pooled', dict(workers=4, rangeWorkers=1, chunkSize=64*MB)),
+                   ('pooled+ranged', dict(workers=4, rangeWorkers=4, chunkSize=16*MB, rangeThreshold=32*MB))]
+        timings = []
+        for label, settings in configs:
+            elapsed, rate = benchDownload(args.files, args.sizeMB, bandwidth, args.latency, **settings)
+            print('{0:<15} {1:8.2f} s {2:8.1f} MB/s'.format(label, elapsed, rate), flush=True)
+            timings.append((label, elapsed))
+    elif args.stage == 'mosaic':
+        timings = [('vrt' if mode == 'auto' else mode, elapsed) for mode, elapsed in benchMosaic(args.files, args.shardPixels, args.shardPixels)]
+    elif args.stage == 'translate':
+        timings = benchTranslate(args.files, args.shardPixels, args.shardPixels)
+    elif args.stage == 'polygonize':
+        timings = benchPolygonize(args.shardPixels, args.shardPixels)
+    elif args.stage == 'upload':
+        timings = benchUpload(args.files, args.sizeMB)
+    else:
+        timings = benchPipeline(args.yearly, args.scale, args.shardsPerExport, args.states, args.exportSeconds,
+                                args.bandwidthMB*MB, args.latency, outputMode=args.outputMode)
+    if args.stage != 'download':
+        for label, elapsed in timings:
+            print('{0:<15} {1:8.2f} s'.format(label, elapsed), flush=True)
+    if args.baseline:
+        timings = [(args.stage + '/' + label, elapsed) for label, elapsed in timings]
+        if args.saveBaseline:
+            with open(args.baseline, 'w') as f:
+                json.dump(dict(timings), f, indent=1, sort_keys=True)
+            return
+        with open(args.baseline) as f:
+            slower = regressions(timings, json.load(f), args.tolerance)
+        for line in slower:
+            print('regression ' + line, flush=True)
+        if slower:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
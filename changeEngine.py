@@ -0,0 +1,204 @@
+from __future__ import print_function
+import argparse, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from polygonizer import tileWindows
+
+# bands of the downloaded median composites, in band order, see latestChangeProducts.py -exportComposites,
+# and the value of their masked pixels
+COMPOSITE_BANDS = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']
+COMPOSITE_NODATA = -9999
+# change indices: normalized difference change of two bands (normDiffChange) or percent change of one (oneBandDiff)
+CHANGE_INDICES = OrderedDict([('SWIR', ('oneBand', ['swir2'])),
+                              ('NDMI', ('normDiff', ['nir', 'swir1'])),
+                              ('NDVI', ('normDiff', ['nir', 'red']))])
+# latest change products mask water, pixels of the current composite whose green/swir1 NDWI is above this
+WATER_THRESHOLD = 0
+DEFAULT_BLOCK_SIZE = 2048
+COG_OPTIONS = {'BIGTIFF': 'YES', 'COMPRESS': 'DEFLATE', 'PREDICTOR': 'YES', 'OVERVIEWS': 'AUTO', 'OVERVIEW_RESAMPLING': 'NEAREST'}
+
+# GEE's divide, answering 0 where the divisor is 0
+def divide(a, b):
+    import numpy as np
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b == 0, a.dtype.type(0), a/b)
+
+# GEE's normalizedDifference in float32, masked where either band is negative
+# @return (the normalized difference, its valid mask)
+def normalizedDifference(a, b):
+    import numpy as np
+    a, b = a.astype(np.float32), b.astype(np.float32)
+    return divide(a - b, a + b), (a >= 0) & (b >= 0)
+
+# force percent change into a 0-255 range so it is a true 8 bit image, like make255 in the product generators
+def make255(percent):
+    import numpy as np
+    return (np.clip(percent, -127, 127) + 128).astype(np.uint8)
+
+# normDiffChange of the product generators
+# @return (the 0-255 change, its valid mask)
+def normDiffChange(yearOne, yearTwo, band1, band2):
+    yearOneNormDiff, valid1 = normalizedDifference(yearOne[band1], yearOne[band2])
+    yearTwoNormDiff, valid2 = normalizedDifference(yearTwo[band1], yearTwo[band2])
+    percent = divide(yearTwoNormDiff - yearOneNormDiff, abs(yearOneNormDiff))*100
+    return make255(percent), valid1 & valid2
+
+# oneBandDiff of the product generators
+# @return (the 0-255 change, its valid mask)
+def oneBandDiff(yearOne, yearTwo, band1):
+    import numpy as np
+    dtype = np.result_type(yearOne[band1].dtype, np.float32)
+    yearOneImg, yearTwoImg = yearOne[band1].astype(dtype), yearTwo[band1].astype(dtype)
+    percent = divide(yearTwoImg - yearOneImg, abs(yearOneImg))*100
+    return make255(percent), None
+
+# answer the changes of one block of the composites; masked pixels are 0, as in the GEE exports
+# @param
+#     [yearOne], [yearTwo] - dicts of band name to (values, valid mask) of the baseline and current composite
+#     [indices] - names of CHANGE_INDICES
+#     [waterThreshold] - mask water by the NDWI of yearTwo, None for no water mask
+# @return dict of index to uint8 block
+def changeBlock(yearOne, yearTwo, indices, waterThreshold=WATER_THRESHOLD):
+    import numpy as np
+    values1 = dict((band, v) for band, (v, m) in yearOne.items())
+    values2 = dict((band, v) for band, (v, m) in yearTwo.items())
+    water = None
+    if waterThreshold is not None:
+        ndwi, ndwiValid = normalizedDifference(values2['green'], values2['swir1'])
+        water = ndwiValid & yearTwo['green'][1] & yearTwo['swir1'][1] & (ndwi <= waterThreshold)
+    changes = {}
+    for index in indices:
+        kind, bands = CHANGE_INDICES[index]
+        change, valid = normDiffChange(values1, values2, *bands) if kind == 'normDiff' else oneBandDiff(values1, values2, *bands)
+        mask = np.logical_and.reduce([yearOne[b][1] & yearTwo[b][1] for b in bands])
+        if valid is not None:
+            mask &= valid
+        if water is not None:
+            mask &= water
+        changes[index] = np.where(mask, change, np.uint8(0))
+    return changes
+
+# Change indices computed here from the two downloaded median composites, block by block across
+# a thread pool, so new or re-tuned indices need no new GEE export
+# @param
+#     [baseline], [current] - paths of the composites of the second and start year, bands in COMPOSITE_BANDS order
+#     [workers] - number of blocks computed at once, NumPy releases the GIL for the arithmetic
+#     [blockSize] - block width and height in pixels
+#     [waterThreshold] - see changeBlock
+#     [report] - callable receiving a line once the outputs are written
+class ChangeEngine(object):
+
+    def __init__(self, baseline, current, workers=None, blockSize=DEFAULT_BLOCK_SIZE, waterThreshold=WATER_THRESHOLD, report=print):
+        self.baseline = baseline
+        self.report = report
+        self.current = current
+        self.workers = workers or os.cpu_count() or 1
+        self.blockSize = blockSize
+        self.waterThreshold = waterThreshold
+        self.local = threading.local()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    # each worker thread reads through its own dataset handles
+    def _datasets(self):
+        import rasterio
+        if not hasattr(self.local, 'datasets'):
+            self.local.datasets = (rasterio.open(self.baseline), rasterio.open(self.current))
+            with self.lock:
+                self.opened.extend(self.local.datasets)
+        return self.local.datasets
+
+    def _read(self, src, bands, window):
+        from rasterio.windows import Window
+        w = Window(*window)
+        return dict((band, (src.read(COMPOSITE_BANDS.index(band) + 1, window=w),
+                            src.read_masks(COMPOSITE_BANDS.index(band) + 1, window=w) > 0)) for band in bands)
+
+    def _block(self, window, indices, bands):
+        yearOne, yearTwo = self._datasets()
+        return window, changeBlock(self._read(yearOne, bands, window), self._read(yearTwo, bands, window), indices, self.waterThreshold)
+
+    # write the change of every index to a COG
+    # @param
+    #     [outPaths] - dict of index to output path
+    # @return seconds taken
+    def run(self, outPaths):
+        import rasterio
+        from rasterio.shutil import copy
+        from rasterio.windows import Window
+        started = time.time()
+        indices = list(outPaths)
+        bands = sorted(set(b for index in indices for b in CHANGE_INDICES[index][1]) |
+                       (set(['green', 'swir1']) if self.waterThreshold is not None else set()))
+        with rasterio.open(self.current) as src:
+            profile = {'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 1, 'dtype': 'uint8',
+                       'crs': src.crs, 'transform': src.transform, 'tiled': True, 'blockxsize': 512, 'blockysize': 512,
+                       'BIGTIFF': 'YES'}
+        windows = tileWindows(profile['width'], profile['height'], self.blockSize)
+        staged = dict((index, path + '.blocks.tif') for index, path in outPaths.items())
+        outputs = dict((index, rasterio.open(path, 'w', **profile)) for index, path in staged.items())
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                # a few blocks ahead of the writer keeps memory bounded
+                for start in range(0, len(windows), 2*self.workers):
+                    for window, changes in pool.map(lambda w: self._block(w, indices, bands), windows[start:start + 2*self.workers]):
+                        for index, block in changes.items():
+                            outputs[index].write(block, 1, window=Window(*window))
+        finally:
+            for dataset in list(outputs.values()) + self.opened:
+                dataset.close()
+            self.opened = []
+            self.local = threading.local()
+        for index, path in outPaths.items():
+            copy(staged[index], path, driver='COG', **COG_OPTIONS)
+            os.remove(staged[index])
+        self.report('Computed {0} from {1} blocks in {2:.1f} s'.format(', '.join(indices), len(windows), time.time() - started))
+        return time.time() - started
+
+# compare a change raster computed here to the one GEE exported for the same composites
+# @return dict of pixels, differing pixels and the largest difference
+def compare(localPath, geePath, blockSize=DEFAULT_BLOCK_SIZE):
+    import numpy as np
+    import rasterio
+    from rasterio.windows import Window
+    pixels = differing = largest = 0
+    with rasterio.open(localPath) as local, rasterio.open(geePath) as gee:
+        if (local.width, local.height) != (gee.width, gee.height):
+            raise ValueError('{0} is {1}x{2} but {3} is {4}x{5}'.format(localPath, local.width, local.height, geePath, gee.width, gee.height))
+        for window in tileWindows(local.width, local.height, blockSize):
+            a = local.read(1, window=Window(*window)).astype(np.int16)
+            b = gee.read(1, window=Window(*window)).astype(np.int16)
+            diff = np.abs(a - b)
+            pixels += diff.size
+            differing += int(np.count_nonzero(diff))
+            largest = max(largest, int(diff.max()) if diff.size else 0)
+    return {'pixels': pixels, 'differing': differing, 'largest': largest}
+
+def parseCmdLine():
+    parser = argparse.ArgumentParser(description='Compute change indices locally from the downloaded baseline and current median composites.')
+    parser.add_argument('baseline', help="median composite of the second year, bands in the order " + ','.join(COMPOSITE_BANDS))
+    parser.add_argument('current', help="median composite of the start year, bands in the same order")
+    parser.add_argument('outPrefix', help="path prefix of the outputs, the index name and .tif are appended")
+    parser.add_argument('-indices', help="comma separated change indices, of " + ','.join(CHANGE_INDICES), default=','.join(CHANGE_INDICES))
+    parser.add_argument('-workers', help="number of blocks computed at once, all CPUs by default", type=int)
+    parser.add_argument('-blockSize', help="block width and height in pixels", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument('-noWaterMask', help="do not mask water, as for the yearly products whose water mask is an asset", action='store_true')
+    parser.add_argument('-verify', help="INDEX=path of a GEE export of the same change to compare with, repeatable", action='append', default=[])
+    return parser.parse_args()
+
+# @param
+#     [report] - callable receiving the lines of the run and of each comparison
+def main(report=print):
+    args = parseCmdLine()
+    outPaths = OrderedDict((index, args.outPrefix + index + '.tif') for index in args.indices.split(','))
+    ChangeEngine(args.baseline, args.current, args.workers, args.blockSize, None if args.noWaterMask else WATER_THRESHOLD, report).run(outPaths)
+    mismatched = False
+    for item in args.verify:
+        index, geePath = item.split('=', 1)
+        result = compare(outPaths[index], geePath, args.blockSize)
+        mismatched = mismatched or result['differing'] > 0
+        report('{0}: {differing} of {pixels} pixels differ from {1}, by at most {largest}'.format(index, geePath, **result))
+    return 1 if mismatched else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
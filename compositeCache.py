@@ -0,0 +1,96 @@
+from __future__ import print_function
+import re
+
+ASSET_ROOT = 'users/landsatfact/compositeCache'
+# bump to rebuild every cached composite, e.g. after changing how composites are made
+CACHE_VERSION = 2
+# grid a cached composite is exported on and read back on: EPSG:4326, the CRS GEE gives composites,
+# at its 30 m scale (30 m of equator in degrees) anchored at 0,0
+SCALE_30M_DEGREES = 30/111319.49079327357
+CACHE_GRID = {'crs': 'EPSG:4326', 'crsTransform': [SCALE_30M_DEGREES, 0, 0, 0, -SCALE_30M_DEGREES, 0]}
+# task states of an asset export still on its way
+PENDING_STATES = ('READY', 'RUNNING')
+
+# answer the cache key of a composite, usable as an asset name
+# @param
+#     [sensor] - the image collection, e.g. LANDSAT/LC08/C02/T1_L2
+#     [start], [end] - the date window as YYYY-MM-DD strings
+#     [maskName] - name of the cloud mask function applied before the median
+def cacheKey(sensor, start, end, maskName):
+    return _assetName('v{0}_{1}_{2}_{3}_{4}'.format(CACHE_VERSION, sensor, start, end, maskName))
+
+def _assetName(text):
+    return re.sub('[^A-Za-z0-9_-]', '_', text)
+
+# Median composites kept as EE assets so later runs read them instead of recomputing them
+# from the raw collection. A composite is exported to its asset the first time it is asked
+# for; that run and any run before the export finishes use the computed composite. Only cache
+# composites whose date window has closed, a key that changes every day is never read back.
+# The asset is exported on a pinned grid and both the asset and the computed composite are
+# answered on that grid, so the exports made from a hit and from a miss sample the same pixels.
+# @param
+#     [ee] - the ee module, or a stand-in with data.getAsset, data.createAsset, data.listAssets,
+#            data.deleteAsset, data.getTaskList, batch.Export.image.toAsset and Image
+#     [assetRoot] - folder holding the cached composites
+#     [report] - callable receiving one line per composite
+class CompositeCache(object):
+
+    def __init__(self, ee, assetRoot=ASSET_ROOT, report=print):
+        self.ee = ee
+        self.assetRoot = assetRoot
+        self.report = report
+
+    def assetId(self, key):
+        return '{0}/{1}'.format(self.assetRoot, key)
+
+    def _exists(self, assetId):
+        try:
+            return self.ee.data.getAsset(assetId) is not None
+        except self.ee.EEException:
+            return False
+
+    # answer True when an export to assetId was submitted and has not ended
+    def _exporting(self, assetId):
+        description = self._description(assetId)
+        return any(t.get('description') == description and t.get('state') in PENDING_STATES for t in self.ee.data.getTaskList())
+
+    def _description(self, assetId):
+        # task descriptions are limited to 100 characters
+        return ('compositeCache-' + assetId.rsplit('/', 1)[-1])[:100]
+
+    # remove the cached composites of the sensor and mask that key replaces, of any cache version
+    def _evict(self, sensor, maskName, key):
+        p = re.compile('v[0-9]+_' + re.escape(_assetName(sensor)) + '_.*' + re.escape(_assetName('_' + maskName)) + '$')
+        for asset in self.ee.data.listAssets({'parent': self.assetRoot}).get('assets', []):
+            name = asset.get('id', asset.get('name', '')).rsplit('/', 1)[-1]
+            if p.match(name) and name != key:
+                self.report('composite cache: removing {0}'.format(name))
+                self.ee.data.deleteAsset(asset.get('id', asset.get('name')))
+
+    def _ensureFolder(self):
+        if not self._exists(self.assetRoot):
+            self.ee.data.createAsset({'type': 'FOLDER'}, self.assetRoot)
+
+    # answer the composite for a key, read from its asset when cached
+    # @param
+    #     [sensor], [start], [end], [maskName] - the cache key, see cacheKey
+    #     [build] - callable answering the composite computed from the collection
+    #     [region] - geometry the asset covers
+    #     [grid] - crs and crsTransform the composite is exported on and answered on
+    def composite(self, sensor, start, end, maskName, build, region, grid=CACHE_GRID):
+        key = cacheKey(sensor, start, end, maskName)
+        assetId = self.assetId(key)
+        if self._exists(assetId):
+            self.report('composite cache: using {0}'.format(key))
+            return self.ee.Image(assetId).reproject(**grid)
+        image = build()
+        if self._exporting(assetId):
+            self.report('composite cache: {0} is still exporting, computing it this run'.format(key))
+            return image.reproject(**grid)
+        self._ensureFolder()
+        self._evict(sensor, maskName, key)
+        task = self.ee.batch.Export.image.toAsset(image=image, description=self._description(assetId), assetId=assetId,
+                                                  region=region, maxPixels=1e13, **grid)
+        task.start()
+        self.report('composite cache: exporting {0} for later runs'.format(key))
+        return image.reproject(**grid)
@@ -0,0 +1,226 @@
+from __future__ import print_function
+import hashlib, json, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+MB = 1024*1024
+# tuning defaults for multi-GB COG shards exported by GEE
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_SIZE = 64*MB
+DEFAULT_RANGE_THRESHOLD = 512*MB
+DEFAULT_RANGE_WORKERS = 4
+DEFAULT_RETRIES = 5
+# HTTP statuses worth retrying, anything else non-2xx is fatal
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+HASH_BLOCK = 8*MB
+
+# raised when a file cannot be fetched, after retries where they apply
+class DownloadError(Exception):
+    pass
+
+class _TransientError(Exception):
+    pass
+
+# Download engine for Drive exports
+# @param
+#     [serviceFactory] - callable answering a new Drive v3 service, called once per worker thread
+#                        so every worker owns its HTTP connection
+#     [downloadDir] - directory the files are written to
+#     [workers] - number of files downloaded at once
+#     [chunkSize] - bytes requested per ranged GET
+#     [rangeThreshold] - files at least this large are fetched as parallel ranges
+#     [rangeWorkers] - number of concurrent ranges for one large file
+#     [retries] - attempts per request before giving up
+#     [deleteAfter] - remove the file from Drive once it is safely on disk
+#     [onDownloaded] - callable receiving (item, path) as each file lands, before it is deleted from Drive
+#     [report] - callable receiving one line per file downloaded
+class DriveDownloader(object):
+
+    def __init__(self, serviceFactory, downloadDir, workers=DEFAULT_WORKERS, chunkSize=DEFAULT_CHUNK_SIZE,
+                 rangeThreshold=DEFAULT_RANGE_THRESHOLD, rangeWorkers=DEFAULT_RANGE_WORKERS,
+                 retries=DEFAULT_RETRIES, deleteAfter=True, onDownloaded=None, report=print):
+        self.serviceFactory = serviceFactory
+        self.downloadDir = downloadDir
+        self.workers = max(1, workers)
+        self.chunkSize = max(MB, chunkSize)
+        self.rangeThreshold = rangeThreshold
+        self.rangeWorkers = max(1, rangeWorkers)
+        self.retries = max(1, retries)
+        self.deleteAfter = deleteAfter
+        self.onDownloaded = onDownloaded
+        self.report = report
+        self._local = threading.local()
+        # name, bytes and seconds of every file downloaded
+        self.timings = []
+
+    # answer the Drive service owned by the calling thread
+    def _service(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self.serviceFactory()
+            self._local.service = service
+        return service
+
+    # answer the size in bytes and the md5 of a Drive file, using the listing when it has them
+    def _meta(self, item):
+        if item.get('size') is not None and item.get('md5Checksum') is not None:
+            return int(item['size']), item['md5Checksum']
+        meta = self._call(lambda: self._service().files().get(fileId=item['id'], fields='size, md5Checksum').execute())
+        return int(meta.get('size', 0)), meta.get('md5Checksum')
+
+    # run fn, retrying transient failures with exponential backoff
+    def _call(self, fn):
+        for attempt in range(self.retries):
+            try:
+                return fn()
+            except DownloadError:
+                raise
+            except Exception as e:
+                if attempt == self.retries - 1:
+                    raise DownloadError(str(e))
+                time.sleep(min(2 ** attempt, 60))
+
+    # fetch bytes [start, end] of a Drive file
+    def _fetch(self, fileId, start, end):
+        def get():
+            request = self._service().files().get_media(fileId=fileId)
+            headers = dict(request.headers)
+            headers['range'] = 'bytes={0}-{1}'.format(start, end)
+            resp, content = request.http.request(request.uri, method='GET', headers=headers)
+            status = int(resp.status)
+            if status in TRANSIENT_STATUSES:
+                raise _TransientError('HTTP {0} for {1}'.format(status, fileId))
+            if status == 200:
+                # the server ignored the range and sent the whole file
+                content = content[start:end+1]
+            elif status != 206:
+                raise DownloadError('HTTP {0} for {1}'.format(status, fileId))
+            if len(content) != end - start + 1:
+                raise _TransientError('short read for {0}'.format(fileId))
+            return content
+        return self._call(get)
+
+    # stream a file front to back, resuming from a partial file on disk; only called when no
+    # ranged fetch left a sidecar, so the partial file is a contiguous prefix
+    def _fetchSequential(self, fileId, partPath, size):
+        offset = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+        if offset > size:
+            offset = 0
+        with open(partPath, 'r+b' if offset else 'wb') as fh:
+            fh.seek(offset)
+            fh.truncate()
+            while offset < size:
+                end = min(offset + self.chunkSize, size) - 1
+                fh.write(self._fetch(fileId, offset, end))
+                offset = end + 1
+
+    # answer the pieces a ranged fetch recorded as done, or None when there is no sidecar;
+    # a sidecar written for another chunk size or file size is discarded with its partial file
+    def _progress(self, partPath, size):
+        progressPath = partPath + '.json'
+        if not os.path.exists(progressPath):
+            return None
+        try:
+            with open(progressPath) as f:
+                progress = json.load(f)
+            if progress['chunkSize'] == self.chunkSize and progress['size'] == size:
+                return set(progress['done'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        self._discard(partPath)
+        return None
+
+    # remove a partial file and its sidecar
+    def _discard(self, partPath):
+        for path in (partPath, partPath + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _saveProgress(self, partPath, size, done):
+        with open(partPath + '.json', 'w') as f:
+            json.dump({'chunkSize': self.chunkSize, 'size': size, 'done': sorted(done)}, f)
+
+    # fetch a large file as concurrent ranges; completed ranges are recorded in a
+    # sidecar so an interrupted download only refetches what is missing
+    def _fetchRanged(self, fileId, partPath, size, pool):
+        pieces = list(range(0, size, self.chunkSize))
+        done = self._progress(partPath, size)
+        if done is None:
+            # a partial file from a sequential fetch is a contiguous prefix
+            prefix = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+            done = set(p for p in pieces if min(p + self.chunkSize, size) <= prefix)
+        # the sidecar is written before the file is extended with holes
+        self._saveProgress(partPath, size, done)
+        with open(partPath, 'ab') as fh:
+            fh.truncate(size)
+        lock = threading.Lock()
+
+        def fetchPiece(start):
+            end = min(start + self.chunkSize, size) - 1
+            content = self._fetch(fileId, start, end)
+            with open(partPath, 'r+b') as fh:
+                fh.seek(start)
+                fh.write(content)
+            with lock:
+                done.add(start)
+                self._saveProgress(partPath, size, done)
+
+        futures = [pool.submit(fetchPiece, p) for p in pieces if p not in done]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise errors[0]
+        os.remove(partPath + '.json')
+
+    # check a fetched file against the md5 Drive holds for it, discarding it when they differ
+    def _check(self, name, partPath, md5Checksum):
+        if md5Checksum is None:
+            return
+        h = hashlib.md5()
+        with open(partPath, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                h.update(block)
+        if h.hexdigest() != md5Checksum:
+            self._discard(partPath)
+            raise DownloadError('{0} does not match its Drive md5Checksum, discarded'.format(name))
+
+    # download one Drive file described by a dict with id, name and optionally size
+    # @return the local path of the downloaded file
+    def downloadOne(self, item, rangePool=None):
+        fileId, name = item['id'], item['name']
+        path = os.path.join(os.path.expandvars(self.downloadDir), name)
+        partPath = path + '.part'
+        started = time.time()
+        size, md5Checksum = self._meta(item)
+        # a partial file a ranged fetch left behind has holes, so it is only resumed by a ranged fetch
+        if (size >= self.rangeThreshold and self.rangeWorkers > 1) or self._progress(partPath, size) is not None:
+            if rangePool is None:
+                with ThreadPoolExecutor(max_workers=self.rangeWorkers) as pool:
+                    self._fetchRanged(fileId, partPath, size, pool)
+            else:
+                self._fetchRanged(fileId, partPath, size, rangePool)
+        else:
+            self._fetchSequential(fileId, partPath, size)
+        self._check(name, partPath, md5Checksum)
+        os.replace(partPath, path)
+        if self.onDownloaded is not None:
+            self.onDownloaded(item, path)
+        if self.deleteAfter:
+            self._call(lambda: self._service().files().delete(fileId=fileId).execute())
+        elapsed = max(time.time() - started, 1e-6)
+        self.timings.append({'name': name, 'bytes': size, 'seconds': elapsed})
+        self.report('Downloaded {0} ({1:.1f} MB in {2:.1f} s, {3:.1f} MB/s)'.format(name, size/MB, elapsed, size/MB/elapsed))
+        return path
+
+    # download a list of Drive files on the worker pool; a file that fails does not stop the others
+    # @return (names of the downloaded files, list of (name, exception) of those that failed),
+    #         both in the order given
+    def downloadAll(self, items):
+        items = list(items)
+        if not items:
+            return [], []
+        # ranges run on their own pool so a file worker never waits on a slot it holds
+        with ThreadPoolExecutor(max_workers=self.workers*self.rangeWorkers) as rangePool:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [(item, pool.submit(self.downloadOne, item, rangePool)) for item in items]
+                downloaded = [item['name'] for item, f in futures if f.exception() is None]
+                errors = [(item['name'], f.exception()) for item, f in futures if f.exception() is not None]
+        return downloaded, errors
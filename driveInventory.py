@@ -0,0 +1,81 @@
+from __future__ import print_function
+import collections, re
+
+# names GEE gives our exports, e.g. SWIR1-Latest-Change-Between-2024-and-2023L8CONUS-0000000000-0000000000.tif,
+# SWIR-Custom-Change-Between-2019-and-2018scenesBeginL8.csv or SWIR-Custom-Change-Between-2019-and-2018GAL8.tif;
+# STACK exports hold the SWIR, NDVI and NDMI change as bands
+EXPORT_NAME = re.compile('(NDVI|SWIR|NDMI|STACK)([0-9]?)(-Latest|-Custom)-Change-Between-([0-9]{4})-and-([0-9]{4})'
+                         '(scenesBegin|scenesEnd|datesBegin|datesEnd|shapes)?([A-Z]{2})?(L8|S2)([A-Z]*)')
+# Drive accepts at most 100 calls in one batch request
+BATCH_SIZE = 100
+LIST_FIELDS = 'nextPageToken, files(id, name, size, md5Checksum)'
+
+ExportKey = collections.namedtuple('ExportKey', ['index', 'region', 'satellite', 'years', 'kind'])
+
+# parse an export name
+# @return an ExportKey, or None when the name is not one of our exports
+def parseExportName(name):
+    m = EXPORT_NAME.match(name)
+    if m is None:
+        return None
+    index, part, product, startYear, secondYear, kind, state, satellite, region = m.groups()
+    return ExportKey(index, state or region, satellite, (startYear, secondYear), kind or 'change')
+
+# Inventory of the files waiting on Drive, read with every page and minimal fields
+# and indexed by ExportKey
+# @param
+#     [service] - a Drive v3 service
+#     [pageSize] - files per page, Drive allows up to 1000
+#     [report] - callable receiving a line per file that could not be deleted
+class DriveInventory(object):
+
+    def __init__(self, service, pageSize=1000, report=print):
+        self.service = service
+        self.pageSize = pageSize
+        self.report = report
+        # ExportKey to the files of that export, as of the last refresh
+        self.index = collections.defaultdict(list)
+        # names of every export file listed so far, downloaded ones are deleted from Drive, and the refreshes made
+        self.seen = set()
+        self.refreshes = 0
+
+    # answer every file matching the query, following nextPageToken
+    def list(self, q, fields=LIST_FIELDS):
+        files, pageToken = [], None
+        while True:
+            results = self.service.files().list(pageSize=self.pageSize, q=q, fields=fields, pageToken=pageToken).execute()
+            files.extend(results.get('files', []))
+            pageToken = results.get('nextPageToken')
+            if not pageToken:
+                return files
+
+    # reread the files matching the query and rebuild the index, parsing each name once
+    # @return the index, ExportKey to the files of that export
+    def refresh(self, q="mimeType = 'image/tiff'"):
+        self.index = collections.defaultdict(list)
+        for item in self.list(q):
+            key = parseExportName(item['name'])
+            if key is not None:
+                self.index[key].append(item)
+                self.seen.add(item['name'])
+        self.refreshes += 1
+        return self.index
+
+    # delete files from Drive with batch requests
+    # @return the ids that could not be deleted
+    def delete(self, fileIds):
+        fileIds = list(fileIds)
+        failed = []
+
+        def deleted(requestId, response, exception):
+            # a file that is already gone needs no retry
+            if exception is not None and getattr(getattr(exception, 'resp', None), 'status', None) != 404:
+                self.report('deleting {0} from Drive failed: {1}'.format(requestId, exception))
+                failed.append(requestId)
+
+        for start in range(0, len(fileIds), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=deleted)
+            for fileId in fileIds[start:start+BATCH_SIZE]:
+                batch.add(self.service.files().delete(fileId=fileId), request_id=fileId)
+            batch.execute()
+        return failed
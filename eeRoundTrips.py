@@ -0,0 +1,58 @@
+from __future__ import print_function
+import functools, threading
+
+DEFAULT_BUDGET = 60
+# ee.data functions that each make requests, counted when the client has no single call path
+EE_CALLS = ['computeValue', 'getInfo', 'getList', 'getAsset', 'listAssets', 'createAsset', 'deleteAsset',
+            'getTaskList', 'listOperations', 'exportImage', 'exportTable', 'startProcessing']
+
+# raised when a run makes more Earth Engine requests than its budget allows
+class RoundTripBudgetExceeded(Exception):
+    pass
+
+# Counts the Earth Engine requests made while it is active, failing the run on the first
+# request over budget; use it as a context manager around a run
+# @param
+#     [ee] - the ee module
+#     [budget] - most requests allowed, None to only count
+#     [report] - callable receiving the count when the block ends
+class RoundTripCounter(object):
+
+    def __init__(self, ee, budget=DEFAULT_BUDGET, report=print):
+        self.ee = ee
+        self.budget = budget
+        self.report = report
+        self.count = 0
+        self.calls = {}
+        self.lock = threading.Lock()
+        self._patched = []
+
+    def _counted(self, name, fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            with self.lock:
+                self.count += 1
+                self.calls[name] = self.calls.get(name, 0) + 1
+                count = self.count
+            if self.budget is not None and count > self.budget:
+                raise RoundTripBudgetExceeded('{0} Earth Engine requests, over the budget of {1}; calls so far: {2}'.format(
+                    count, self.budget, ', '.join('{0} {1}'.format(n, c) for n, c in sorted(self.calls.items()))))
+            return fn(*args, **kwargs)
+        return call
+
+    def __enter__(self):
+        data = self.ee.data
+        # every request of the cloud API client goes through _execute_cloud_call
+        names = ['_execute_cloud_call'] if hasattr(data, '_execute_cloud_call') else [n for n in EE_CALLS if hasattr(data, n)]
+        for name in names:
+            original = getattr(data, name)
+            self._patched.append((name, original))
+            setattr(data, name, self._counted(name, original))
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        for name, original in self._patched:
+            setattr(self.ee.data, name, original)
+        self._patched = []
+        self.report('{0} Earth Engine requests{1}'.format(self.count, '' if self.budget is None else ' of a budget of {0}'.format(self.budget)))
+        return False
@@ -0,0 +1,76 @@
+from __future__ import print_function
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 8
+# index name of a stacked change export, and the change index held by each of its bands in order
+STACKED_INDEX = 'STACK'
+STACK_BANDS = ['SWIR', 'NDVI', 'NDMI']
+# settings shared by the image exports of the latest change products
+IMAGE_DEFAULTS = {'scale': 30,
+                  'maxPixels': 1e13,
+                  'shardSize': 256,
+                  'fileDimensions': [75264, 55808],
+                  'formatOptions': {'cloudOptimized': True}}
+
+# The exports of one run, built up front and submitted together
+# @param
+#     [batch] - the ee.batch module, or a stand-in with Export.image.toDrive and Export.table.toDrive
+#     [imageDefaults] - settings every image export starts from
+#     [workers] - number of tasks submitted to GEE at once
+#     [report] - callable receiving a line once the tasks are submitted
+class ExportPlan(object):
+
+    def __init__(self, batch, imageDefaults=IMAGE_DEFAULTS, workers=DEFAULT_WORKERS, report=print):
+        self.batch = batch
+        self.imageDefaults = dict(imageDefaults)
+        self.workers = max(1, workers)
+        self.report = report
+        self.exports = []
+
+    # add one export; kind is image or table
+    def add(self, kind, config):
+        self.exports.append((kind, config))
+
+    # add an image export for every region of a region table
+    # @param
+    #     [image] - the image to export
+    #     [regions] - list of (part, geometry, regionName, clipped) where part and regionName
+    #                 go into the description and clipped regions export the clipped image
+    #     [describe] - callable answering the description of an export from (part, regionName)
+    #     [clipTo] - collection the image is clipped to, once for all of the clipped regions
+    #     [settings] - settings of these exports replacing the defaults, e.g. formatOptions
+    def addImageRegions(self, image, regions, describe, clipTo=None, **settings):
+        clipped = image.clipToCollection(clipTo) if clipTo is not None and any(r[3] for r in regions) else image
+        for part, geometry, regionName, clip in regions:
+            config = dict(self.imageDefaults, **settings)
+            config.update({'image': clipped if clip else image, 'region': geometry, 'description': describe(part, regionName)})
+            self.add('image', config)
+
+    def _start(self, export):
+        kind, config = export
+        task = getattr(self.batch.Export, kind).toDrive(**config)
+        task.start()
+        return task.id
+
+    # submit every export, several at once, and write their ids in one go; when some fail to
+    # start, the ids of those that did are still written, so the pipeline tracks the tasks
+    # running on GEE, before the first failure is raised
+    # @param
+    #     [idsPath] - file the pipeline reads the task ids from, None to skip it
+    # @return the task ids, in the order the exports were added
+    def submit(self, idsPath=None):
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(self.exports)))) as pool:
+            futures = [pool.submit(self._start, export) for export in self.exports]
+            ids = [f.result() for f in futures if f.exception() is None]
+            errors = [(export, f.exception()) for export, f in zip(self.exports, futures) if f.exception() is not None]
+        if idsPath is not None:
+            with open(idsPath, 'w') as f:
+                f.write(''.join(',{0}'.format(taskId) for taskId in ids))
+        for (kind, config), e in errors:
+            self.report('export {0} failed to start: {1}'.format(config.get('description'), e))
+        self.report('submitted {0} of {1} exports in {2:.1f} s'.format(len(ids), len(self.exports), time.time() - started))
+        if errors:
+            raise errors[0][1]
+        return ids
@@ -0,0 +1,80 @@
+from __future__ import print_function
+import os, time
+
+MB = 1024*1024
+# GDAL settings shared by every in-process translate and warp of the pipeline
+GDAL_CONFIG = {
+    # the EFS workspace reports no useful free space; pipeline.py -stagingGB keeps the staged bytes in bounds
+    'CHECK_DISK_FREE_SPACE': 'FALSE',
+    'GDAL_NUM_THREADS': 'ALL_CPUS',
+    'GDAL_TIFF_INTERNAL_MASK': 'YES',
+    'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+}
+DEFAULT_CACHE_MB = 512
+# overviews of the 128-centered change scale keep real pixel values, see productDerivatives.OVERVIEW_RESAMPLINGS
+OVERVIEW_RESAMPLING = 'NEAREST'
+COG_OPTIONS = ['BIGTIFF=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=YES', 'OVERVIEWS=AUTO', 'OVERVIEW_RESAMPLING=' + OVERVIEW_RESAMPLING]
+
+# raised when GDAL cannot translate a raster
+class TranslateError(Exception):
+
+    def __init__(self, inRaster, outRasterPath, message):
+        Exception.__init__(self, 'translating {0} to {1}: {2}'.format(inRaster, outRasterPath, message))
+        self.inRaster = inRaster
+        self.outRasterPath = outRasterPath
+        self.message = message
+
+_configured = []
+
+# apply GDAL_CONFIG once per process
+# @param
+#     [cacheMB] - GDAL block cache in MB, None keeps what is set
+#     [options] - further config options, e.g. the /vsis3/ settings of a direct S3 write
+def configureGdal(cacheMB=None, options=None):
+    from osgeo import gdal
+    if not _configured:
+        gdal.UseExceptions()
+        for key, value in GDAL_CONFIG.items():
+            gdal.SetConfigOption(key, value)
+        gdal.SetCacheMax(DEFAULT_CACHE_MB*MB)
+        _configured.append(True)
+    if cacheMB is not None:
+        gdal.SetCacheMax(int(cacheMB)*MB)
+    for key, value in (options or {}).items():
+        gdal.SetConfigOption(key, value)
+
+# answer a GDAL progress callback printing every step percent of a named job
+def progressPrinter(name, step=10, report=print):
+    reported = [-step]
+    def callback(complete, message, data):
+        percent = int(complete*100)
+        if percent >= reported[0] + step:
+            reported[0] = percent - percent % step
+            report('{0}: {1}%'.format(name, reported[0]))
+        return 1
+    return callback
+
+# translate a raster to a cloud optimized GeoTIFF in this process
+# @param
+#     [inRaster] - path of the input raster
+#     [outRasterPath] - full path to the output COG
+#     [threads] - cores for compression, a number or ALL_CPUS
+#     [progress] - GDAL progress callback, None for none
+# @return seconds taken
+def translateToCOG(inRaster, outRasterPath, threads='ALL_CPUS', progress=None):
+    from osgeo import gdal
+    configureGdal()
+    started = time.time()
+    try:
+        ds = gdal.Translate(outRasterPath, inRaster, format='COG', callback=progress,
+                            creationOptions=COG_OPTIONS + ['NUM_THREADS={0}'.format(threads)])
+        message = None if ds is not None else gdal.GetLastErrorMsg() or 'no output'
+    except RuntimeError as e:
+        ds, message = None, str(e)
+    if message is not None:
+        # never leave a partial COG for a later step to pick up
+        if os.path.exists(outRasterPath):
+            os.remove(outRasterPath)
+        raise TranslateError(inRaster, outRasterPath, message)
+    ds = None
+    return time.time() - started
@@ -0,0 +1,108 @@
+from __future__ import print_function
+import contextlib, json, logging, logging.handlers, os, queue, threading, time
+
+LOGGER_NAME = 'southfact'
+logger = logging.getLogger(LOGGER_NAME)
+_listener = []
+
+# send the pipeline log through a queue to the console and a log file, so logging
+# never blocks a download or mosaic thread on file I/O
+# @param
+#     [logPath] - file the log is appended to, None for the console only
+def startLogging(logPath=None, level=logging.INFO):
+    if _listener:
+        return
+    records = queue.Queue(-1)
+    console = logging.StreamHandler()
+    handlers = [console]
+    if logPath:
+        handlers.append(logging.FileHandler(logPath))
+    formatter = logging.Formatter('%(asctime)s %(threadName)s %(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(level)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(records, *handlers)
+    listener.start()
+    _listener.append(listener)
+
+# flush the queued log lines and close the log file
+def stopLogging():
+    while _listener:
+        listener = _listener.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+# log a progress line
+def report(message):
+    logger.info(message)
+
+# Collects timings of the stages of one run and writes them as JSON lines at the end,
+# one line per measurement plus a summary line per stage
+# @param
+#     [runKey] - identifies the run in every line
+class Metrics(object):
+
+    def __init__(self, runKey=None):
+        self.runKey = runKey
+        self.started = time.time()
+        self.records = []
+        self.lock = threading.Lock()
+
+    # record one measurement of a stage, e.g. record('download', 12.5, name=..., bytes=...)
+    def record(self, stage, seconds, **fields):
+        fields.update({'stage': stage, 'seconds': seconds})
+        with self.lock:
+            self.records.append(fields)
+
+    # time the enclosed block as one measurement of a stage
+    @contextlib.contextmanager
+    def timer(self, stage, **fields):
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record(stage, time.time() - started, **fields)
+
+    # answer per stage the count, total seconds and total bytes of its measurements
+    def summary(self):
+        stages = {}
+        with self.lock:
+            for r in self.records:
+                s = stages.setdefault(r['stage'], {'stage': r['stage'], 'count': 0, 'seconds': 0.0, 'bytes': 0})
+                s['count'] += 1
+                s['seconds'] += r['seconds']
+                s['bytes'] += r.get('bytes', 0)
+        for s in stages.values():
+            if s['bytes'] and s['seconds']:
+                s['MBPerSecond'] = s['bytes']/1048576.0/s['seconds']
+        return [stages[k] for k in sorted(stages)]
+
+    # append the measurements and the summary of the run to a JSON-lines file
+    def write(self, path):
+        base = {'run': self.runKey, 'runStarted': self.started}
+        with self.lock:
+            records = list(self.records)
+        with open(path, 'a') as f:
+            for r in records:
+                f.write(json.dumps(dict(base, **r), sort_keys=True) + '\n')
+            for s in self.summary():
+                f.write(json.dumps(dict(base, summary=True, **s), sort_keys=True) + '\n')
+            f.write(json.dumps(dict(base, summary=True, stage='run', seconds=time.time() - self.started), sort_keys=True) + '\n')
+        report('metrics for {0} measurements written to {1}'.format(len(records), path))
+
+# answer the summary lines of every run in a metrics file as a dict of
+# (run, runStarted) to a dict of stage to summary, attempts of one run kept apart
+def loadSummaries(path):
+    runs = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                r = json.loads(line)
+                if r.get('summary'):
+                    runs.setdefault((r['run'], r['runStarted']), {})[r['stage']] = r
+    return runs
@@ -1,12 +1,21 @@
-import ee, time, datetime, argparse, pdb, pathlib, shutil, collections
-from userConfig import ids_file, geeService_account, geeServiceAccountCredentials
+import ee, time, datetime, argparse, pathlib, shutil, collections
+from exportPlan import ExportPlan, IMAGE_DEFAULTS, DEFAULT_WORKERS, STACKED_INDEX, STACK_BANDS
+from compositeCache import CompositeCache, ASSET_ROOT
+from eeRoundTrips import RoundTripCounter, DEFAULT_BUDGET
+from changeEngine import COMPOSITE_BANDS, COMPOSITE_NODATA
 
 def parseCmdLine():
     # Will parse the arguments provided on the command line.
     parser = argparse.ArgumentParser(description='Generate GEE latest change products.')
     parser.add_argument('-S2',help="Sentinel-2 latest change products. Default is for Landsat 8 change.", action='store_true')    
+    parser.add_argument('-stacked',help="export the SWIR, NDVI and NDMI change as the bands of one image per region; run the pipeline with -stacked too", action='store_true')
+    parser.add_argument('-compositeCache',help="EE folder caching the baseline composites of earlier runs", default=ASSET_ROOT)
+    parser.add_argument('-noCompositeCache',help="always compute the baseline composite from the collection", action='store_true')
+    parser.add_argument('-exportWorkers',help="number of export tasks submitted to GEE at once", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('-exportComposites',help="also export the baseline and current median composites, for checking changeEngine.py -verify against the change exports; their task ids are not written to the ids file, so the pipeline neither waits for nor downloads them and they are to be removed from Drive once checked", action='store_true')
+    parser.add_argument('-roundTripBudget',help="fail the run when it makes more EE requests than this, 0 for no limit", type=int, default=DEFAULT_BUDGET)
     ns = parser.parse_args()
-    return ns.S2
+    return ns
     
 # reference time.time
 # Return the current time in seconds since the Epoch.
@@ -123,210 +132,169 @@ def oneBandDiff(compositeYearOne, compositeYearTwo, band1):
   image255 = make255(YearOneYearTwoPercent, band1)
   return image255
 
-def exportRegionGeoTiff(image, indexName,startYear, secondYear):						 
-  task_config={'image':image.clipToCollection(boundary),
-               'region':conus1,
-               'description':indexName+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+'CONUS',
-               'scale':30,
-               'maxPixels':1e13,
-               'shardSize':256,
-               'fileDimensions': [75264,55808],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))
-																
-  task_config={'image':image.clipToCollection(boundary),
-               'region':conus2,
-               'description':indexName+'1'+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+'CONUS',
-               'scale':30,
-               'maxPixels':1e13,
-               'shardSize':256,
-               'fileDimensions': [75264,55808],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))
-  
-  task_config={'image':image.clipToCollection(boundary),
-               'region':conus3,
-               'description':indexName+'2'+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+'CONUS',
-               'scale':30,
-               'maxPixels':1e13,
-               'shardSize':256,
-               'fileDimensions': [75264,55808],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id)) 
-
-  task_config={'image':image.clipToCollection(boundary),
-               'region':conus4,
-               'description':indexName+'4'+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+'CONUS',
-               'scale':30,
-               'maxPixels':1e13,
-               'shardSize':256,
-               'fileDimensions': [75264,55808],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))  
-																	
-  task_config={'image':image,
-               'region':prvi,
-               'description':indexName+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+'PRVI',
-               'scale':30,
-               'maxPixels':1e13,
-               'shardSize':256,
-               'fileDimensions': [75264,55808],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))
- 
-def sceneFeatures(scene):
-  return ee.Feature(geometry, {'value': scene})
-  
-# clean up any posssible leftovers
-shutil.rmtree('/mnt/efs/fs1/GeoTIFF', ignore_errors=True)  
-shutil.rmtree('/mnt/efs/fs1/output', ignore_errors=True) 
-# create my workspaces
-path = pathlib.Path('/mnt/efs/fs1/GeoTIFF')    
-path.mkdir(parents=True, exist_ok=False)
-path = pathlib.Path('/mnt/efs/fs1/output')    
-path.mkdir(parents=True, exist_ok=False)
-
-credentials = ee.ServiceAccountCredentials(geeService_account,geeServiceAccountCredentials)
-collections.Callable = collections.abc.Callable
-ee.Initialize(credentials=credentials)
-boundary = ee.FeatureCollection("users/landsatfact/SGSFCONUSBoundary")
-states = ee.FeatureCollection("users/landsatfact/SGSF_states")
-prvi = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'PR'),(ee.Filter.eq('state_abbr', 'VI')))).geometry().bounds();
-conus1 = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'AL'),(ee.Filter.eq('state_abbr', 'MS')),(ee.Filter.eq('state_abbr', 'VA')),(ee.Filter.eq('state_abbr', 'TN')),(ee.Filter.eq('state_abbr', 'KY')))).geometry().bounds();
-conus2 = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'FL'),(ee.Filter.eq('state_abbr', 'GA')),(ee.Filter.eq('state_abbr', 'NC')),(ee.Filter.eq('state_abbr', 'SC')))).geometry().bounds()
-conus3 = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'OK'),(ee.Filter.eq('state_abbr', 'AR')),(ee.Filter.eq('state_abbr', 'LA')))).geometry().bounds()
-conus4 = states.filter(ee.Filter.eq('state_abbr', 'TX')).geometry().bounds();
-
-S2 = parseCmdLine() 
-
-ids_file = open(ids_file, "w")
-mstimeone = now_milliseconds()
-
-#convert to server-side datetime
-t2 = ee.Date(mstimeone)
-startYear = t2.get('year').getInfo()
-t3 = t2.advance(-1, 'year')
-secondYear = t3.get('year').getInfo()
-
-beginRangeEndDate = ee.Date.fromYMD(secondYear, 11, 1, 'America/New_York')
-endRangeEndDate = ee.Date.fromYMD(secondYear, 12, 31, 'America/New_York')
-
-t4 = t3.advance(-1, 'year')
-beginWinter = t4.get('year')
-endWinter =(t2.advance(+1, 'year').get('year'))
-endDate=t2
-endWinterDate=ee.Date.fromYMD(endWinter, 3, 31, 'America/New_York')
-lastWinterBeginDate=ee.Date.fromYMD(secondYear, 11, 1, 'America/New_York')
-lastWinterEndDate=ee.Date.fromYMD(startYear, 3, 31, 'America/New_York')
-curentYearBeginDate=ee.Date.fromYMD(startYear, 1, 1, 'America/New_York')
-waterThreshold = 0
-geometry = states.geometry().bounds()
-# set default bands and cloud mask
-if S2:
-    nir = 'B8'
-    red = 'B4'
-    blue = 'B2'
-    green = 'B3'
-    swir1 = 'B11'
-    swir2 = 'B12'
-    SATELLITE = 'COPERNICUS/S2_SR_HARMONIZED'
-    mask = maskS2CloudsQA60
-    dateID = 'DATATAKE_IDENTIFIER'
-    productName = 'S2'
-else:
-    nir = 'SR_B5'
-    red = 'SR_B4'
-    blue = 'SR_B2'
-    green = 'SR_B3'
-    swir1 = 'SR_B6'
-    swir2 = 'SR_B7'
-    SATELLITE = 'LANDSAT/LC08/C02/T1_L2'
-    mask = maskLandsatClouds
-    dateID = 'LANDSAT_SCENE_ID'
-    productName = 'L8'
-
-states = ee.FeatureCollection("users/landsatfact/SGSF_states")
-# Collect one year of changes over the start and second years, for a date range  
-# from the beginning of secondYear winter in secondYear - 1 to end of startYear winter in startYear + 1
-# early in the year (before 3/31) use at least 30 days of data 
-# e.g., 11/1 to 12/1 on Jan.1 of the current year
-# shouuld we, later in the year, restrict this range to the end of winter (3/31)
-# currently, after April, we begin to see greenup changes. 
-# Collect one year of changes over the start and second years, for a date range  
-# from the beginning of secondYear winter in secondYear - 1 to end of startYear winter in startYear + 1
-
-#for cloud masking with S2_CLOUD_PROBABILITY which is roughly 4 times slower
-'''
-if S2:
-    collectionRangeStart = maskedS2Collection(secondYear + beginDay, startYear + endDay).map(addDateBand)
-    collectionRangeEnd = maskedS2Collection(startYear + beginDay, endWinter + endDay).map(addDateBand)
-    compositeRangeStart = collectionRangeStart.median()
-    compositeRangeEnd = collectionRangeEnd.median()
-else:'''
-collectionRangeStart = ee.ImageCollection(SATELLITE).filterDate(lastWinterBeginDate,t2.advance(-30,'day')).filterDate(lastWinterBeginDate, lastWinterEndDate).map(addDateBand)
-collectionRangeEnd = ee.ImageCollection(SATELLITE).filterDate(curentYearBeginDate, endWinterDate).map(addDateBand)
-
-ag_array=collectionRangeStart.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
-fc = ee.FeatureCollection(ag_array.map(sceneFeatures))
-task_config={'collection': fc, 'description': 'SWIR-Latest-Change-Between-'+str(startYear)+'-and-'+str(secondYear)+'scenesBegin'+productName}	
-task = ee.batch.Export.table.toDrive(**task_config)
-task.start()
-ids_file.write(',{0}'.format(task.id))
-ag_array=collectionRangeEnd.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
-fc = ee.FeatureCollection(ag_array.map(sceneFeatures))
-task_config={'collection': fc, 'description': 'SWIR-Latest-Change-Between-'+str(startYear)+'-and-'+str(secondYear)+'scenesEnd'+productName}	
-task = ee.batch.Export.table.toDrive(**task_config)
-task.start()
-ids_file.write(',{0}'.format(task.id))
-
-compositeRangeStart = collectionRangeStart.map(mask).median()
-compositeRangeEnd = collectionRangeEnd.map(mask).median()
-
-compositeStartYear = compositeRangeEnd # Start Year average - "custom request"
-compositeSecondYear = compositeRangeStart # Second Year average - "custom request"
-
-# add the NDWI band to the image so we can get water masks
-ndwi = compositeStartYear.normalizedDifference([green, swir1]).rename('NDWI')
-
-# get pixels above the threshold
-water = ndwi.lte(waterThreshold)
-
-# update composites with water masks
-compositeStartYear = compositeStartYear.updateMask(water)
-compositeSecondYear = compositeSecondYear.updateMask(water)
-
-# make RGB images 
-RGBStartYear = compositeStartYear.select(red, green, blue)
-RGBSecondYear = compositeSecondYear.select(red, green, blue)
-
-# NDMI change
-NDMIChangeCustomRange = normDiffChange(compositeSecondYear, compositeStartYear, nir, swir1)
-
-# NDVI change
-NDVIChangeCustomRange = normDiffChange(compositeSecondYear, compositeStartYear, nir, red)
-
-# SWIR change
-SWIRChangeCustomRange = oneBandDiff(compositeSecondYear,compositeStartYear, swir2)
-                    
-#exportGeoTiff(RGBStartYear, 'RGB'+ startYear)
-#exportGeoTiff(RGBSecondYear, 'RGB'+ secondYear)
-
-exportRegionGeoTiff(NDVIChangeCustomRange,'NDVI',str(startYear),str(secondYear))
-exportRegionGeoTiff(SWIRChangeCustomRange,'SWIR',str(startYear),str(secondYear))
-exportRegionGeoTiff(NDMIChangeCustomRange,'NDMI',str(startYear),str(secondYear))
-
-#export datetimes used for pixel values in one year of changes over the start and second years. Ignore metadata for now due to speed and Drive space concerns
-#exportRegionGeoTiff(compositeStartYear.select(['system:time_start'], ['observationDate']), 'SWIR-Latest-Change-Between-'+str(startYear)+'-and-'+str(secondYear)+'datesBegin')
-#exportRegionGeoTiff(compositeSecondYear.select(['system:time_start'], ['observationDate']), 'SWIR-Latest-Change-Between-'+str(startYear)+'-and-'+str(secondYear)+'datesEnd')
-
-ids_file.close()
+# cloud mask, bands and names of each sensor
+SENSORS = {
+  'L8': {'nir': 'SR_B5', 'red': 'SR_B4', 'blue': 'SR_B2', 'green': 'SR_B3', 'swir1': 'SR_B6', 'swir2': 'SR_B7',
+         'SATELLITE': 'LANDSAT/LC08/C02/T1_L2', 'mask': maskLandsatClouds, 'dateID': 'LANDSAT_SCENE_ID', 'productName': 'L8'},
+  'S2': {'nir': 'B8', 'red': 'B4', 'blue': 'B2', 'green': 'B3', 'swir1': 'B11', 'swir2': 'B12',
+         'SATELLITE': 'COPERNICUS/S2_SR_HARMONIZED', 'mask': maskS2CloudsQA60, 'dateID': 'DATATAKE_IDENTIFIER', 'productName': 'S2'},
+}
+# bands of the baseline composite the change indices read; the NDWI water mask comes from the current composite
+BASELINE_BANDS = ['nir', 'red', 'swir1', 'swir2']
+WORKSPACES = ['/mnt/efs/fs1/GeoTIFF', '/mnt/efs/fs1/output']
+_initialized = []
+
+# initialize EE with the service account of userConfig, once per process
+def initialize():
+  if not _initialized:
+    from userConfig import geeService_account, geeServiceAccountCredentials
+    collections.Callable = collections.abc.Callable
+    ee.Initialize(credentials=ee.ServiceAccountCredentials(geeService_account, geeServiceAccountCredentials))
+    _initialized.append(True)
+
+# clean up any posssible leftovers of the last run and create the pipeline workspaces
+def resetWorkspaces():
+  for workspace in WORKSPACES:
+    shutil.rmtree(workspace, ignore_errors=True)
+    pathlib.Path(workspace).mkdir(parents=True, exist_ok=False)
+
+# answer the years and dates of a run, worked out here rather than with getInfo round trips
+# @param
+#     [now] - milliseconds since the Epoch the run is for, None for now
+# @return dict of now, startYear, secondYear and baselineEnd, the last day of the baseline window,
+#         and baselineClosed, True once baselineEnd is the end of winter and stops moving
+def changeDates(now=None):
+  now = now_milliseconds() if now is None else now
+  today = datetime.datetime.utcfromtimestamp(now/1000.0).date()
+  # the baseline window ends at the end of last winter or 30 days ago, whichever is earlier
+  endWinter = datetime.date(today.year, 3, 31)
+  baselineEnd = min(endWinter, today - datetime.timedelta(days=30))
+  return {'now': now, 'startYear': today.year, 'secondYear': today.year - 1,
+          'baselineEnd': baselineEnd, 'baselineClosed': baselineEnd == endWinter}
+
+# answer the export regions of every change index: (description part after the index, geometry, region, clipped to the boundary)
+def exportRegions(states):
+  def bounds(*abbrs):
+    return states.filter(ee.Filter.Or(*[ee.Filter.eq('state_abbr', abbr) for abbr in abbrs])).geometry().bounds()
+  return [('', bounds('AL', 'MS', 'VA', 'TN', 'KY'), 'CONUS', True), ('1', bounds('FL', 'GA', 'NC', 'SC'), 'CONUS', True),
+          ('2', bounds('OK', 'AR', 'LA'), 'CONUS', True), ('4', bounds('TX'), 'CONUS', True),
+          ('', bounds('PR', 'VI'), 'PRVI', False)]
+
+# add the exports of one change index, one per region, to the plan
+def exportRegionGeoTiff(plan, image, indexName, startYear, secondYear, productName, regions, boundary, **settings):
+  plan.addImageRegions(image, regions,
+                       lambda part, region: indexName+part+'-Latest-Change-Between-'+startYear+'-and-'+secondYear+productName+region,
+                       boundary, **settings)
+
+# add exports of the baseline and current median composites, before the water mask, with their bands
+# in changeEngine.COMPOSITE_BANDS order and masked pixels as COMPOSITE_NODATA, e.g.
+# BASELINE-Latest-Change-Between-2024-and-2023L8CONUS; they are on the grid of the change exports
+def exportComposites(plan, baseline, current, s, startYear, secondYear, regions, boundary):
+  bands = [s[band] for band in COMPOSITE_BANDS]
+  for name, image in [('BASELINE', baseline), ('CURRENT', current)]:
+    exportRegionGeoTiff(plan, image.select(bands), name, startYear, secondYear, s['productName'], regions, boundary,
+                        formatOptions=dict(IMAGE_DEFAULTS['formatOptions'], noData=COMPOSITE_NODATA))
+
+# answer a table of the scenes of a collection, one feature per scene id
+def sceneTable(collection, geometry, dateID):
+  scenes = collection.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
+  return ee.FeatureCollection(scenes.map(lambda scene: ee.Feature(geometry, {'value': scene})))
+
+# generate the latest change products: plan every export, then submit them at once
+# @param
+#     [sensor] - key of SENSORS, L8 or S2
+#     [dates] - see changeDates, None for a run of now
+#     [stacked] - export the SWIR, NDVI and NDMI change as the bands of one image per region
+#     [compositeCache] - EE folder caching the baseline composite, None to always compute it
+#     [exportWorkers] - number of export tasks submitted to GEE at once
+#     [idsPath] - file the task ids are written to, None to skip it
+#     [budget] - most EE requests the run may make, None for no limit
+#     [composites] - also export the median composites, see exportComposites; their tasks are left out of idsPath
+# @return the task ids written to idsPath
+def run(sensor='L8', dates=None, stacked=False, compositeCache=ASSET_ROOT, exportWorkers=DEFAULT_WORKERS, idsPath=None, budget=DEFAULT_BUDGET, composites=False):
+  s = SENSORS[sensor]
+  dates = changeDates() if dates is None else dates
+  startYear, secondYear = dates['startYear'], dates['secondYear']
+  initialize()
+  with RoundTripCounter(ee, budget):
+    # every export of the run is planned first, then submitted at once
+    plan = ExportPlan(ee.batch, workers=exportWorkers)
+    boundary = ee.FeatureCollection("users/landsatfact/SGSFCONUSBoundary")
+    states = ee.FeatureCollection("users/landsatfact/SGSF_states")
+    regions = exportRegions(states)
+    geometry = states.geometry().bounds()
+    waterThreshold = 0
+
+    endWinterDate=ee.Date.fromYMD(startYear + 1, 3, 31, 'America/New_York')
+    lastWinterBeginDate=ee.Date.fromYMD(secondYear, 11, 1, 'America/New_York')
+    lastWinterEndDate=ee.Date.fromYMD(startYear, 3, 31, 'America/New_York')
+    curentYearBeginDate=ee.Date.fromYMD(startYear, 1, 1, 'America/New_York')
+    # Collect one year of changes over the start and second years, for a date range  
+    # from the beginning of secondYear winter in secondYear - 1 to end of startYear winter in startYear + 1
+    # early in the year (before 3/31) use at least 30 days of data 
+    # e.g., 11/1 to 12/1 on Jan.1 of the current year
+    # shouuld we, later in the year, restrict this range to the end of winter (3/31)
+    # currently, after April, we begin to see greenup changes. 
+    collectionRangeStart = ee.ImageCollection(s['SATELLITE']).filterDate(lastWinterBeginDate,ee.Date(dates['now']).advance(-30,'day')).filterDate(lastWinterBeginDate, lastWinterEndDate).map(addDateBand)
+    collectionRangeEnd = ee.ImageCollection(s['SATELLITE']).filterDate(curentYearBeginDate, endWinterDate).map(addDateBand)
+
+    described = 'SWIR-Latest-Change-Between-'+str(startYear)+'-and-'+str(secondYear)
+    plan.add('table', {'collection': sceneTable(collectionRangeStart, geometry, s['dateID']), 'description': described+'scenesBegin'+s['productName']})
+    plan.add('table', {'collection': sceneTable(collectionRangeEnd, geometry, s['dateID']), 'description': described+'scenesEnd'+s['productName']})
+
+    # once its window closes at the end of winter the baseline composite no longer changes, so
+    # runs share it through an EE asset; until then its window moves daily and it is computed inline
+    buildMedian = lambda: collectionRangeStart.map(s['mask']).median()
+    buildBaseline = lambda: buildMedian().select([s[band] for band in BASELINE_BANDS])
+    if compositeCache is None or not dates['baselineClosed']:
+      compositeRangeStart = buildBaseline()
+    else:
+      compositeRangeStart = CompositeCache(ee, compositeCache).composite(s['SATELLITE'], '{0}-11-01'.format(secondYear), dates['baselineEnd'].isoformat(),
+                                                                         s['mask'].__name__, buildBaseline, geometry)
+    compositeRangeEnd = collectionRangeEnd.map(s['mask']).median()
+    # the composites are planned apart, their large float exports are no product of the pipeline
+    compositePlan = ExportPlan(ee.batch, workers=exportWorkers)
+    if composites:
+      # every band, so the baseline is computed here rather than read from the cache
+      exportComposites(compositePlan, buildMedian(), compositeRangeEnd, s, str(startYear), str(secondYear), regions, boundary)
+
+    compositeStartYear = compositeRangeEnd # Start Year average - "custom request"
+    compositeSecondYear = compositeRangeStart # Second Year average - "custom request"
+
+    # add the NDWI band to the image so we can get water masks
+    ndwi = compositeStartYear.normalizedDifference([s['green'], s['swir1']]).rename('NDWI')
+
+    # get pixels above the threshold
+    water = ndwi.lte(waterThreshold)
+
+    # update composites with water masks
+    compositeStartYear = compositeStartYear.updateMask(water)
+    compositeSecondYear = compositeSecondYear.updateMask(water)
+
+    changes = {'NDMI': normDiffChange(compositeSecondYear, compositeStartYear, s['nir'], s['swir1']),
+               'NDVI': normDiffChange(compositeSecondYear, compositeStartYear, s['nir'], s['red']),
+               'SWIR': oneBandDiff(compositeSecondYear, compositeStartYear, s['swir2'])}
+    if stacked:
+      # one three band export per region, GEE computes the composites once for all three indices
+      stack = ee.Image.cat([changes[index].rename(index) for index in STACK_BANDS])
+      exportRegionGeoTiff(plan, stack, STACKED_INDEX, str(startYear), str(secondYear), s['productName'], regions, boundary)
+    else:
+      for index in ['NDVI', 'SWIR', 'NDMI']:
+        exportRegionGeoTiff(plan, changes[index], index, str(startYear), str(secondYear), s['productName'], regions, boundary)
+
+    #export datetimes used for pixel values in one year of changes over the start and second years. Ignore metadata for now due to speed and Drive space concerns
+    ids = plan.submit(idsPath)
+    if composites:
+      compositePlan.submit()
+    return ids
+
+def main():
+  args = parseCmdLine()
+  from userConfig import ids_file
+  resetWorkspaces()
+  run('S2' if args.S2 else 'L8', stacked=args.stacked, compositeCache=None if args.noCompositeCache else args.compositeCache,
+      exportWorkers=args.exportWorkers, idsPath=ids_file, budget=args.roundTripBudget or None,
+      composites=args.exportComposites)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,236 @@
+from __future__ import print_function
+import math, multiprocessing, os, tempfile, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from gdalTranslate import configureGdal, OVERVIEW_RESAMPLING
+
+MB = 1024*1024
+# share of the instance RAM given to GDAL, the rest is left to downloads and the OS
+RAM_SHARE = 0.75
+MIN_WARP_MB = 256
+MIN_CACHE_MB = 128
+# a job never gets more than one core per this many input bytes, or more memory than twice its input
+BYTES_PER_THREAD = 256*MB
+
+# answer the number of CPUs and bytes of RAM of the instance
+def detectResources():
+    try:
+        ram = os.sysconf('SC_PAGE_SIZE')*os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        ram = 4096*MB
+    return os.cpu_count() or 1, ram
+
+# split cores and memory among concurrent jobs in proportion to their input sizes
+# @param
+#     [sizes] - bytes of input of each job
+#     [cpus] - cores to share
+#     [ramBytes] - bytes of memory to share
+# @return a (threads, warpMB, cacheMB) tuple per job; warp memory and block cache get half each
+def budget(sizes, cpus, ramBytes):
+    total = sum(sizes)
+    shares = [size/float(total) for size in sizes] if total else [1.0/len(sizes)]*len(sizes)
+    budgets = []
+    for size, share in zip(sizes, shares):
+        threads = min(max(1, int(round(cpus*share))), max(1, int(-(-size//BYTES_PER_THREAD))))
+        memMB = int(min(ramBytes*share, 2*size)/MB)
+        budgets.append((min(threads, cpus), max(MIN_WARP_MB, memMB//2), max(MIN_CACHE_MB, memMB//2)))
+    return budgets
+
+TARGET_SRS = 'EPSG:5070'
+# fraction of a pixel two grids may differ by and still be the same grid
+GRID_TOLERANCE = 1e-6
+
+# answer the grid of a dataset as (geotransform, band count, data type), None when it is rotated
+def _grid(ds):
+    gt = ds.GetGeoTransform()
+    if gt[2] or gt[4]:
+        return None
+    return gt, ds.RasterCount, ds.GetRasterBand(1).DataType
+
+# answer True when ds is in the target SRS on the same pixel grid as the reference grid
+def _onGrid(ds, reference, target):
+    from osgeo import osr
+    grid = _grid(ds)
+    srs = osr.SpatialReference(wkt=ds.GetProjection()) if ds.GetProjection() else None
+    if grid is None or srs is None or not srs.IsSame(target) or grid[1:] != reference[1:]:
+        return False
+    gt, ref = grid[0], reference[0]
+    for offset, res in ((gt[0] - ref[0], ref[1]), (gt[3] - ref[3], ref[5])):
+        steps = offset/res
+        if abs(steps - round(steps)) > GRID_TOLERANCE:
+            return False
+    return abs(gt[1] - ref[1]) <= GRID_TOLERANCE*abs(ref[1]) and abs(gt[5] - ref[5]) <= GRID_TOLERANCE*abs(ref[5])
+
+# split rasters into those already on a common grid in the target SRS and those needing a warp
+# @return (reference grid or None, aligned rasters, rasters to warp)
+def inspectGrid(inRasterList):
+    from osgeo import gdal, osr
+    target = osr.SpatialReference()
+    target.SetFromUserInput(TARGET_SRS)
+    reference, aligned, misaligned = None, [], []
+    for path in inRasterList:
+        ds = gdal.Open(path)
+        if reference is None:
+            grid = _grid(ds)
+            srs = osr.SpatialReference(wkt=ds.GetProjection()) if ds.GetProjection() else None
+            if grid is not None and srs is not None and srs.IsSame(target):
+                reference = grid
+        if reference is not None and _onGrid(ds, reference, target):
+            aligned.append(path)
+        else:
+            misaligned.append(path)
+        ds = None
+    return reference, aligned, misaligned
+
+# answer the grid line at or before value along one axis, or at or after it
+def _gridLine(value, origin, res, after):
+    steps = (value - origin)/res
+    steps = math.ceil(steps - GRID_TOLERANCE) if after else math.floor(steps + GRID_TOLERANCE)
+    return origin + steps*res
+
+# warp one raster to a VRT in the target SRS, snapped outward onto the reference grid
+def _warpToGrid(path, vrtPath, reference, threads, warpMB):
+    from osgeo import gdal
+    gt = reference[0]
+    loose = gdal.Warp('', path, format='VRT', dstSRS=TARGET_SRS, xRes=gt[1], yRes=-gt[5])
+    lgt, w, h = loose.GetGeoTransform(), loose.RasterXSize, loose.RasterYSize
+    loose = None
+    minX = _gridLine(lgt[0], gt[0], gt[1], False)
+    maxX = _gridLine(lgt[0] + w*lgt[1], gt[0], gt[1], True)
+    maxY = _gridLine(lgt[3], gt[3], gt[5], False)
+    minY = _gridLine(lgt[3] + h*lgt[5], gt[3], gt[5], True)
+    gdal.Warp(vrtPath, path, format='VRT', dstSRS=TARGET_SRS, xRes=gt[1], yRes=-gt[5], outputBounds=(minX, minY, maxX, maxY),
+              warpMemoryLimit=warpMB*MB, multithread=True, warpOptions=['NUM_THREADS={0}'.format(threads)])
+    return vrtPath
+
+# answer the path prefix of the temporary VRTs of an output; VRTs of an output written
+# to /vsis3/ live on local disk
+def _scratch(outRasterPath):
+    return os.path.join(tempfile.gettempdir(), os.path.basename(outRasterPath)) if outRasterPath.startswith('/vsi') else outRasterPath
+
+# mosaic rasters on the target grid by streaming a VRT through the COG driver, warping
+# only the rasters that are not on the grid; the COG driver builds the overviews on GDAL_NUM_THREADS
+def vrtMosaic(aligned, misaligned, reference, outRasterPath, threads='ALL_CPUS', warpMB=1296, overviews=OVERVIEW_RESAMPLING):
+    from osgeo import gdal
+    scratch = _scratch(outRasterPath)
+    temporary = [_warpToGrid(path, '{0}.{1}.vrt'.format(scratch, i), reference, threads, warpMB)
+                 for i, path in enumerate(misaligned)]
+    vrtPath = scratch + '.vrt'
+    try:
+        gdal.BuildVRT(vrtPath, aligned + temporary)
+        gdal.Translate(outRasterPath, vrtPath, format='COG',
+                       creationOptions=['BIGTIFF=YES', 'COMPRESS=DEFLATE', 'NUM_THREADS={0}'.format(threads),
+                                        'OVERVIEW_RESAMPLING={0}'.format(overviews)])
+    finally:
+        for path in temporary + [vrtPath]:
+            if os.path.exists(path):
+                os.remove(path)
+    return outRasterPath
+
+# answer VRTs exposing one band of each raster, kept on local disk beside scratch
+def _bandVrts(inRasterList, band, scratch):
+    from osgeo import gdal
+    paths = []
+    for i, path in enumerate(inRasterList):
+        paths.append('{0}.band{1}.{2}.vrt'.format(scratch, band, i))
+        gdal.BuildVRT(paths[-1], [path], bandList=[band])
+    return paths
+
+# mosaic and reproject a list of rasters to a COG in epsg:5070
+# @param
+#     [inRasterList] - a list of rasters
+#     [outRasterPath] - full path to the output raster
+#     [threads] - cores for warping and compression, a number or ALL_CPUS
+#     [warpMB] - warp memory in MB
+#     [cacheMB] - GDAL block cache in MB, None keeps the GDAL default
+#     [mode] - 'auto' concatenates rasters already on the target grid through a VRT and
+#              warps only the others, 'warp' always runs a full gdal.Warp
+#     [config] - further GDAL config options, e.g. for an outRasterPath under /vsis3/
+#     [band] - mosaic only this band of the rasters, e.g. one index of stacked change exports
+#     [overviews] - resampling of the overviews of the output
+def warp(inRasterList, outRasterPath, threads='ALL_CPUS', warpMB=1296, cacheMB=None, mode='auto', config=None, band=None, overviews=OVERVIEW_RESAMPLING):
+    from osgeo import gdal
+    configureGdal(cacheMB, config)
+    bandVrts = []
+    if band is not None:
+        bandVrts = inRasterList = _bandVrts(inRasterList, band, _scratch(outRasterPath))
+    try:
+        if mode == 'auto':
+            reference, aligned, misaligned = inspectGrid(inRasterList)
+            if aligned:
+                return vrtMosaic(aligned, misaligned, reference, outRasterPath, threads, warpMB, overviews)
+        gdal.Warp(outRasterPath, inRasterList, options='-of COG -overwrite -multi -wm {0} -wo NUM_THREADS={1} -t_srs EPSG:5070'
+                  ' -co TILED=YES -co BIGTIFF=YES -co COMPRESS=DEFLATE -co NUM_THREADS={1} -co COPY_SRC_OVERVIEWS=YES'
+                  ' -co OVERVIEW_RESAMPLING={2}'.format(warpMB, threads, overviews))
+        return outRasterPath
+    finally:
+        for path in bandVrts:
+            if os.path.exists(path):
+                os.remove(path)
+
+# run one warp in a worker process and answer its timing
+def _warpJob(inRasterList, outRasterPath, threads, warpMB, cacheMB, mode, config, band, overviews):
+    started = time.time()
+    warp(inRasterList, outRasterPath, threads, warpMB, cacheMB, mode, config, band, overviews)
+    return time.time() - started
+
+# Runs several warps at once in a process pool. Each job is given cores, warp memory
+# and block cache in proportion to its input size among the jobs running with it,
+# out of what the running jobs have not already taken.
+# @param
+#     [workers] - number of warps run at once
+#     [cpus], [ramBytes] - resources to share, detected from the instance by default
+#     [report] - callable receiving one line per finished job
+#     [mode] - mosaic mode passed to warp
+#     [config] - GDAL config options passed to warp, e.g. gdalS3Config() for /vsis3/ outputs
+#     [overviews] - resampling of the overviews of the outputs
+class MosaicExecutor(object):
+
+    def __init__(self, workers=3, cpus=None, ramBytes=None, report=print, mode='auto', config=None, overviews=OVERVIEW_RESAMPLING):
+        detectedCpus, detectedRam = detectResources()
+        self.cpus = cpus or detectedCpus
+        self.ramBytes = ramBytes or int(detectedRam*RAM_SHARE)
+        self.workers = max(1, workers)
+        self.report = report
+        self.mode = mode
+        self.config = config
+        self.overviews = overviews
+        # spawn, the pipeline forks from a process running download threads
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        self.lock = threading.Lock()
+        self.running = {}
+        self.timings = []
+
+    # answer the budget of a new job given the jobs already running
+    def _reserve(self, jobId, size):
+        with self.lock:
+            running = list(self.running.values())
+            sizes = [r['size'] for r in running] + [size]
+            threads, warpMB, cacheMB = budget(sizes, self.cpus, self.ramBytes)[-1]
+            freeCpus = self.cpus - sum(r['threads'] for r in running)
+            freeMB = self.ramBytes//MB - sum(r['warpMB'] + r['cacheMB'] for r in running)
+            threads = max(1, min(threads, freeCpus))
+            warpMB = max(MIN_WARP_MB, min(warpMB, freeMB//2))
+            cacheMB = max(MIN_CACHE_MB, min(cacheMB, freeMB//2))
+            self.running[jobId] = {'size': size, 'threads': threads, 'warpMB': warpMB, 'cacheMB': cacheMB}
+            return threads, warpMB, cacheMB
+
+    # mosaic inRasterList, or one band of it, to outRasterPath on the pool, blocking until it is written
+    # @return the output path
+    def mosaic(self, inRasterList, outRasterPath, band=None, bandCount=1):
+        # a job mosaicking one band of several reads about its share of the input
+        size = sum(os.path.getsize(f) for f in inRasterList)//max(1, bandCount)
+        jobId = object()
+        threads, warpMB, cacheMB = self._reserve(jobId, size)
+        try:
+            seconds = self.pool.submit(_warpJob, list(inRasterList), outRasterPath, threads, warpMB, cacheMB, self.mode, self.config, band, self.overviews).result()
+        finally:
+            with self.lock:
+                del self.running[jobId]
+        timing = {'output': os.path.basename(outRasterPath), 'inputs': len(inRasterList), 'inputMB': size/MB,
+                  'threads': threads, 'warpMB': warpMB, 'cacheMB': cacheMB, 'seconds': seconds}
+        self.timings.append(timing)
+        self.report('mosaic {output}: {inputs} inputs, {inputMB:.0f} MB, {threads} threads, -wm {warpMB}, cache {cacheMB} MB, {seconds:.1f} s'.format(**timing))
+        return outRasterPath
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
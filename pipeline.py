@@ -1,5 +1,5 @@
 from __future__ import print_function
-import logging, boto3, pickle, io, argparse, contextlib, json, re, threading, time, uuid, ee, subprocess, datetime, os, pdb, pathlib, shutil, collections
+import logging, boto3, pickle, io, argparse, contextlib, json, re, threading, time, uuid, ee, subprocess, datetime, os, pdb, pathlib, shutil, collections, hashlib
 from botocore.exceptions import ClientError
 from os import listdir
 from googleapiclient.discovery import build
@@ -12,6 +12,20 @@ from pathlib import Path
 from userConfig import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, downloadDir, outputGeoTIFFDir, ids_file, drive_key_file, credentials_file, geeService_account, geeServiceAccountCredentials
 from oauth2client.service_account import ServiceAccountCredentials
 from contextlib import redirect_stdout
+from driveDownloader import DriveDownloader, DEFAULT_WORKERS, DEFAULT_CHUNK_SIZE, DEFAULT_RANGE_WORKERS, MB
+from s3Publisher import S3Publisher, makeClient, gdalS3Config
+from taskTracker import TaskTracker
+from stageScheduler import StageScheduler
+from driveInventory import DriveInventory, parseExportName
+from runManifest import RunManifest
+from publishManifest import PublishManifest
+from stagingManager import StagingManager, StagingBudgetExceeded, GB
+from mosaicExecutor import MosaicExecutor, warp
+import polygonizer, stateShapes, instrumentation, productDerivatives, zonalStats
+from instrumentation import Metrics, report
+from taskTracker import FINISHED_STATES
+from exportPlan import STACKED_INDEX, STACK_BANDS
+from stateShapes import translateToGeoTIFF
 outputDir = outputGeoTIFFDir
 # Will parse the arguments provided on the command line.
 def parseCmdLine():
@@ -20,177 +34,372 @@ def parseCmdLine():
     parser.add_argument('-yearly',help="pipeline for yearly change products. Default is for latest change.", action='store_true')
     parser.add_argument('-year',help="in pipeline for yearly change products, the most recent year being processed. e.g., 2019")
     parser.add_argument('-bucket',help="in pipeline for yearly change products, the S3 bucket destination. e.g., 2019-2018/")
+    parser.add_argument('-downloadWorkers',help="number of Drive files downloaded at once", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('-rangeWorkers',help="number of concurrent ranged requests for one large Drive file", type=int, default=DEFAULT_RANGE_WORKERS)
+    parser.add_argument('-chunkMB',help="size in MB of each ranged Drive request", type=int, default=DEFAULT_CHUNK_SIZE//MB)
+    parser.add_argument('-uploadWorkers',help="number of files uploaded to S3 at once", type=int, default=4)
+    parser.add_argument('-mosaicWorkers',help="number of outputs mosaicked and uploaded at once", type=int, default=3)
+    parser.add_argument('-mosaicMode',help="auto concatenates shards already on the EPSG:5070 grid without warping, warp always reprojects", choices=['auto', 'warp'], default='auto')
+    parser.add_argument('-vectorFormat',help="format of the yearly change polygons: FlatGeobuf, GeoParquet or the legacy Shapefile", choices=list(polygonizer.VECTOR_FORMATS), default='fgb')
+    parser.add_argument('-stateWorkers',help="number of states translated and polygonized at once", type=int, default=4)
+    parser.add_argument('-stacked',help="latest change exports hold SWIR, NDVI and NDMI as bands of one image, see latestChangeProducts.py -stacked", action='store_true')
+    parser.add_argument('-outputMode',help="local stages mosaics in the output directory before uploading them, s3 writes them straight to the bucket", choices=['local', 's3'], default='local')
+    parser.add_argument('-s3Endpoint',help="S3 endpoint URL to use instead of AWS, e.g. a local moto server at http://127.0.0.1:5000")
+    parser.add_argument('-log',help="file the run log is appended to", default='/home/ec2-user/GitHub/southfact-data-v2/debug.log')
+    parser.add_argument('-metrics',help="JSON-lines file the stage timings of each run are appended to", default='/mnt/efs/fs1/runMetrics.jsonl')
+    parser.add_argument('-overviewResampling',help="resampling of the overviews of the products", choices=productDerivatives.OVERVIEW_RESAMPLINGS, default='NEAREST')
+    parser.add_argument('-noStats',help="skip the statistics and histogram sidecar of each product", action='store_true')
+    parser.add_argument('-tiles',help="also publish an XYZ PNG tile pyramid and TileJSON of each product, in -outputMode local", action='store_true')
+    parser.add_argument('-tileZoom',help="zoom levels of the tile pyramid", default=productDerivatives.DEFAULT_TILE_ZOOM)
+    parser.add_argument('-tileWorkers',help="processes rendering the tiles of one product, all CPUs by default", type=int)
+    parser.add_argument('-zones',help="publish per-zone change tables of each product from boundaries given as path:field, e.g. counties.shp:GEOID; repeatable, in -outputMode local", action='append', default=[])
+    parser.add_argument('-noPublishManifest',help="upload every output, even those the publish manifest in the bucket holds unchanged", action='store_true')
+    parser.add_argument('-stagingGB',help="most GB of shards and mosaics staged on the workspace at once; downloads wait on Drive and mosaics wait for room beyond it", type=float)
+    parser.add_argument('-scratchDir',help="fast local disk, e.g. instance NVMe, for the temporary files of GDAL")
+    parser.add_argument('-resume',help="resume a failed run, skipping the downloads, mosaics and uploads it completed", action='store_true')
+    parser.add_argument('-manifest',help="file recording the completed work of the run", default='/mnt/efs/fs1/runManifest.json')
     ns = parser.parse_args()
     if ('yearly' in vars(ns) and 'year' not in vars(ns) and 'bucket' not in vars(ns)):
         parser.error('The -yearly argument requires the -year and -bucket arguments')
-    return [ns.yearly, ns.year, ns.bucket]
-
-#Upload a file to an S3 bucket
-#:param file_name: File to upload
-#:param bucket: Bucket to upload to
-#:param object_name: S3 object name. If not specified then file_name is used
-#:return: True if file was uploaded, else False
-def upload_file(file_name, bucket, object_name=None):
-    # If S3 object_name was not specified, use file_name
-    if object_name is None:
-        object_name = file_name
-    # Upload the file
-    s3_client = boto3.client('s3',aws_access_key_id=AWS_ACCESS_KEY_ID,aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
-    try:
-        response = s3_client.upload_file(file_name, bucket, object_name, ExtraArgs={'ACL': 'public-read'})
-    except ClientError as e:
-        logging.error(e)
-        return False
-    return True
+    return ns
+
+# answer the S3 client shared by every upload in the run
+_s3Client = None
+def s3Client(workers=4, endpoint_url=None):
+    global _s3Client
+    if _s3Client is None:
+        _s3Client = makeClient(workers, aws_access_key_id=AWS_ACCESS_KEY_ID, aws_secret_access_key=AWS_SECRET_ACCESS_KEY, endpoint_url=endpoint_url)
+    return _s3Client
     
-# Utility function to mosaic a list of rasters
+# download any available yearly or latest change products, then remove them from Drive in batches
+# shards the manifest already holds intact on disk are not downloaded again; with staging only
+# the exports that fit its budget are downloaded, the others stay on Drive for a later pass. When
+# some downloads fail the others are still recorded and deleted from Drive before the first failure is raised
 # @param
-#     [inRasterList] - a list of rasters 
-#     [outRasterPath] - full path to the output raster in epsg:5070 projection
-# @return errcode
-def mosaic(inRasterList, outRasterPath):
+#     [exports] - dict of ExportKey to the Drive files of each export, see DriveInventory.refresh
+def downloadMultiple(exports, downloader, inventory=None, manifest=None, staging=None):
+    haveNames = set(d['name'] for items in exports.values() for d in items if manifest is not None and manifest.shardDone(d['name']))
+    toDownload = dict((key, [d for d in items if d['name'] not in haveNames]) for key, items in exports.items())
+    if staging is not None:
+        for name in haveNames:
+            staging.add('shards', downloadDir+name)
+        toDownload = staging.admit(toDownload, lambda d: downloadDir+d['name'])
+    toDownload = [d for items in toDownload.values() for d in items]
+    done, errors = downloader.downloadAll(toDownload)
+    downloadedFiles = done + sorted(haveNames)
+    if staging is not None:
+        # a failed download holds no room
+        for name, e in errors:
+            staging.discard(downloadDir+name)
+    if inventory is not None:
+        done = set(downloadedFiles)
+        failed = inventory.delete([d['id'] for items in exports.values() for d in items if d['name'] in done])
+        if failed:
+            report('could not delete {0} downloaded files from Drive: {1}'.format(len(failed), ', '.join(failed)))
+    for name, e in errors:
+        report('downloading {0} failed: {1}'.format(name, e))
+    if errors:
+        raise errors[0][1]
+    return downloadedFiles
+
+# count the shards an earlier attempt left intact on disk against the staging budget, so they are
+# deleted once mosaicked like the shards this attempt downloads
+def stageResumed(manifest, staging):
+    for name in manifest.shardNames(lambda n: n.endswith('.tif')):
+        if manifest.shardDone(name):
+            staging.add('shards', manifest.shardPath(name))
 
-    #pdb.set_trace()
-    gdal.SetConfigOption('CHECK_DISK_FREE_SPACE', 'FALSE')
-    gdal.Warp(outRasterPath, inRasterList, options= '-of COG' + " -overwrite -multi -wm 1296 -t_srs EPSG:5070 -co TILED=YES -co BIGTIFF=YES -co COMPRESS=DEFLATE -co NUM_THREADS=ALL_CPUS -co COPY_SRC_OVERVIEWS=YES")
-#
+# gather the timings kept by the stages of the run into metrics
+def collectMetrics(metrics, tracker=None, downloader=None, publisher=None, mosaics=None):
+    for task in (tracker.tasks.values() if tracker else []):
+        if task['state'] in FINISHED_STATES and 'creation_timestamp_ms' in task and 'update_timestamp_ms' in task:
+            queued = (task.get('start_timestamp_ms', task['update_timestamp_ms']) - task['creation_timestamp_ms'])/1000.0
+            metrics.record('export', (task['update_timestamp_ms'] - task['creation_timestamp_ms'])/1000.0,
+                           name=task.get('description', task['id']), state=task['state'], queued=queued)
+    for t in (downloader.timings if downloader else []):
+        metrics.record('download', t['seconds'], name=t['name'], bytes=t['bytes'])
+    for t in (publisher.timings if publisher else []):
+        metrics.record('upload', t['seconds'], name=t['key'], bytes=t['bytes'], direct=t.get('direct', False))
+    for t in (mosaics.timings if mosaics else []):
+        metrics.record('mosaic', t['seconds'], name=t['output'], bytes=int(t['inputMB']*MB), inputs=t['inputs'], threads=t['threads'])
 
-# Utility function to convert a TIFF to GeoTIFF
+# list the TIFFs waiting on Drive and download the latest change or yearly products among them
+def downloadAvailable(inventory, downloader, manifest=None, staging=None):
+    return downloadMultiple(inventory.refresh(), downloader, inventory, manifest, staging)
+
+# list Drive and start the outputs whose shards have landed on every tracker poll that saw a task
+# complete or finds an output settling or files deferred, then, once every task is final, keep
+# listing a poll delay apart until no output is settling
 # @param
-#     [inRaster] - a list of rasters
-#     [outRasterPath] - full path to the output GeoTIFF
-# @return errcode
-def translateToGeoTIFF(inRaster, outRasterPath):
-    """gdal_translate "D:/SouthFACT_products/latestChange/062320\latestChangeSWIR.tif" "H:\SPA_Secure\Geospatial\SouthFACT\GIS\LatestChange\geotiff\out.tif" -co TILED=YES -co COPY_SRC_OVERVIEWS=YES -co COMPRESS=DEFLATEgdal_translate "D:/SouthFACT_products/latestChange/062320\latestChangeNDVI.tif" "D:/SouthFACT_products/latestChange/062320/out.tif" -co TILED=YES -co COPY_SRC_OVERVIEWS=YES -co COMPRESS=DEFLATE  -co BIGTIFF=YES"""
-    codeIn = ['gdal_translate',inRaster,outRasterPath, '-co',  'TILED=YES', '-co', 'COPY_SRC_OVERVIEWS=YES', '-co', 'COMPRESS=DEFLATE', '-co', 'BIGTIFF=YES']
-    process = subprocess.Popen(codeIn,stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    out,err = process.communicate()
-    errcode = process.returncode
-    print (out, err)
-    # non-zero is error
-    return errcode
-
-#download a file from Drive
-def download(filename, fileId, service):
-    # download to disk and remove from drive
-    print(filename)    
-    request = service.files().get_media(fileId=fileId)
-    fh = io.FileIO(os.path.expandvars(downloadDir + filename), 'wb')
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-        with open('/home/ec2-user/GitHub/southfact-data-v2/debug.log', 'a') as f:
-            print("Download %d%%." % int(status.progress() * 100), file=f, flush=True)
-        print ("Download %d%%." % int(status.progress() * 100), flush=True)
-    file = service.files().delete(fileId=fileId).execute()
-
-# download any available yearly or latest change products
-def downloadMultiple(aListOfDicts, service):
-    downloadedFiles=[]
-    p = re.compile('(NDVI.?|SWIR.?|NDMI.?)(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}\w*(L8|S2)')           
-    for d in aListOfDicts:
-        i=d['id']
-        n=d['name']
-        #print(i,n)
-        if p.match(n):
-            download(n,i, service)
-            downloadedFiles.append(n)
-    return downloadedFiles
-    
-#answer the number of pending tasks in GEE     
-def pendingTasks(ids):
-    tasks = ee.data.getTaskList() 
-    myTasks = list(filter(lambda x: x['id'] in ids, tasks))     
-    myPendingTasks=list(filter(lambda x: x['state'] in ['RUNNING','READY'], myTasks))
-    outstandingPendingTasks=len(myPendingTasks)
-    with open('/home/ec2-user/GitHub/southfact-data-v2/debug.log', 'a') as f:
-        print('pending tasks: {0}'.format(outstandingPendingTasks), file=f, flush=True)
-    print('pending tasks: {0}'.format(outstandingPendingTasks), flush=True)
-    return outstandingPendingTasks
-
-#answer the number of tasks remaining in the pipeline           
-def completedTasksRemaining(ids):
-    tasks = ee.data.getTaskList() 
-    myTasks = list(filter(lambda x: x['id'] in ids, tasks))     
-    myCompletedTasks=list(filter(lambda x: x['state'] == 'COMPLETED', myTasks))
-    outstandingCompletedTasks=len(myCompletedTasks)
-    with open('/home/ec2-user/GitHub/southfact-data-v2/debug.log', 'a') as f:
-        print('completed tasks: {0}'.format(outstandingCompletedTasks), file=f, flush=True)
-    print('completed tasks: {0}'.format(outstandingCompletedTasks), flush=True)
-     
-    return outstandingCompletedTasks<len(ids)
-
-#create regionwide GeoTIFF
-def mosaicDownloadedToGeotiff(p,mosaicTiffName):
-    print('GeoTIFFs input: {0}'.format(downloadDir+mosaicTiffName))
-    print('GeoTIFFs output: {0}'.format(outputDir+mosaicTiffName))
+#     [landings] - the ShardLanding of every output, see scheduleProducts
+def downloadAsTasksComplete(tracker, scheduler, landings, inventory, downloader, manifest, staging=None):
+    settling = lambda: any(landing.settling() for landing in landings)
+    for completedTasks in tracker.iterPolls():
+        if completedTasks or settling() or (staging is not None and staging.deferred):
+            downloadAvailable(inventory, downloader, manifest, staging)
+            scheduler.update()
+    # pick up anything that landed on Drive after the last poll
+    downloadAvailable(inventory, downloader, manifest, staging)
+    scheduler.update()
+    while settling():
+        tracker.sleep(tracker.minDelay)
+        downloadAvailable(inventory, downloader, manifest, staging)
+        scheduler.update()
+
+# download the shards left on Drive for want of staging room once finished mosaics free room for
+# a whole export; a pass bringing nothing down waits the tracker's poll delay before listing Drive again
+def downloadDeferred(staging, scheduler, tracker, inventory, downloader, manifest):
+    while staging.deferred:
+        if not staging.waitForRoom(staging.smallestDeferred(), timeout=tracker.minDelay):
+            if not scheduler.busy():
+                raise StagingBudgetExceeded('{0} files on Drive do not fit -stagingGB with no mosaic left to free room'.format(len(staging.deferred)))
+        elif not downloadAvailable(inventory, downloader, manifest, staging):
+            tracker.sleep(tracker.minDelay)
+        scheduler.update()
+
+#create regionwide GeoTIFF, in outputDir unless another directory such as a /vsis3/ prefix is given,
+#from one band of the shards when band is given
+def mosaicDownloadedToGeotiff(p,mosaicTiffName,executor=None,outDir=None,band=None):
+    outDir = outDir or outputDir
+    report('GeoTIFFs input: {0}'.format(downloadDir+mosaicTiffName))
+    report('GeoTIFFs output: {0}'.format(outDir+mosaicTiffName))
     onlyfiles = [f for f in os.listdir(downloadDir) if isfile(join(downloadDir, f))]    
-    mosaic([s for s in onlyfiles if p.match(s)], outputDir+mosaicTiffName)
+    # absolute paths, other products are downloading and mosaicking alongside
+    inRasterList = [downloadDir+s for s in onlyfiles if p.match(s) and s.endswith('.tif')]
+    if executor is None:
+        warp(inRasterList, outDir+mosaicTiffName, threads='ALL_CPUS', warpMB=1296, band=band)
+    else:
+        executor.mosaic(inRasterList, outDir+mosaicTiffName, band, len(STACK_BANDS) if band else 1)
     #translateToGeoTIFF(downloadDir+mosaicTiffName, outputDir+mosaicTiffName)
+    return outDir+mosaicTiffName
+
+# empty the download and output directories, so a run that is not resumed never mosaics,
+# names its products after or publishes the files an earlier failed run left there
+def resetWorkspaces():
+    for workspace in sorted(set([downloadDir, outputDir])):
+        shutil.rmtree(workspace, ignore_errors=True)
+        pathlib.Path(workspace).mkdir(parents=True, exist_ok=True)
+
+# answer the (index, region) outputs of the yearly or latest change pipeline
+def changeProducts(yearly):
+    indices = ['SWIR'] if yearly else ['SWIR', 'NDMI', 'NDVI']
+    return [(index, region) for index in indices for region in ['CONUS', 'PRVI']]
+
+# answer the pattern matching the export tasks and Drive shards of one output; with stacked
+# exports every index of a region comes from the same shards
+def shardPattern(index, region, stacked=False):
+    index = STACKED_INDEX if stacked else index
+    return re.compile(index+'.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)'+region)
+
+# answer True once every export matching p completed
+def exportsCompleted(tracker, p):
+    if len(tracker.tasks) < len(tracker.ids):
+        return False
+    myTasks = [t for t in tracker.tasks.values() if p.match(t.get('description', ''))]
+    return bool(myTasks) and all(t['state'] == 'COMPLETED' for t in myTasks)
+
+# Decides when every shard of one output is on disk. Drive listings lag behind the files GEE
+# writes, so one listing after the exports complete may miss some; the shards have landed once
+# two Drive listings since the exports completed agree on them
+# @param
+#     [p] - the pattern of the output, see shardPattern
+class ShardLanding(object):
+
+    def __init__(self, tracker, inventory, manifest, p):
+        self.tracker = tracker
+        self.inventory = inventory
+        self.manifest = manifest
+        self.p = p
+        self.names = None
+        self.refreshes = None
+        self.landed = False
+
+    # the shards listed on Drive so far and those an earlier attempt downloaded
+    def _names(self):
+        names = set(n for n in self.inventory.seen if self.p.match(n) and n.endswith('.tif'))
+        return names | set(self.manifest.shardNames(lambda n: self.p.match(n) and n.endswith('.tif')))
+
+    # answer True once the shards have landed, checked at most once per Drive listing
+    def __call__(self):
+        if self.landed or not exportsCompleted(self.tracker, self.p) or self.refreshes == self.inventory.refreshes:
+            return self.landed
+        names = self._names()
+        self.landed = names == self.names
+        self.names, self.refreshes = names, self.inventory.refreshes
+        return self.landed
 
-#create change poly shapefiles for the states   
-def polygonize(inRaster, outShapePath):
-    tempfile = downloadDir+'/changePolys.tiff'
-
-    print("Begin polygonize at ", datetime.datetime.now())
-    with rasterio.Env():
-        with rasterio.open(inRaster, 'r') as src:
-            with rasterio.open(tempfile, 'w', **src.profile) as dst:
-                for ij, window in src.block_windows():
-                    array = src.read(window=window)
-                    array=array.astype(dtype=np.int16, copy=False)
-                    array -= 186
-                    result = np.clip(array, 0,1)
-                    dst.write(result.astype(dtype=np.uint8, copy=False), window=window)
-   
-        with rasterio.open(tempfile) as src:
-            image = src.read(1) # first band
-            print("Convert to shapes ", datetime.datetime.now())
-            results = (
-            {'properties': {'raster_val': v}, 'geometry': s, 'area': Polygon(s['coordinates'][0]).area}
-            for i, (s, v)
-            # assumes 
-                in enumerate(
-                shapes(image, mask=None, transform=src.transform))if Polygon(s['coordinates'][0]).area > 80936 and v >0)
-            polys=list(results)
-
-    print("Begin shapefile creation ", datetime.datetime.now())
-    # transform polygons from WGS84 to Albers Equal Area Conic
-    schemaNew={"geometry": 'Polygon', "properties": OrderedDict({'raster_val': 'float', 'area': 'float'})}
-    #schemaNew={"geometry": 'Polygon', "properties": OrderedDict({'raster_val': 'float'})}
-
-
-    with fiona.open(outShapePath, "w", driver="ESRI Shapefile",crs=from_epsg(5070), schema=schemaNew) as c:
-        #wgs84 = pyproj.CRS('EPSG:5070')
-        #utm = pyproj.CRS('EPSG:32618')
-        #project = pyproj.Transformer.from_crs(wgs84, utm, always_xy=True).transform
-        for feature in polys:
-            #print("Feature: ", feature)
-            poly=Polygon(feature['geometry']['coordinates'][0])
-            c.write({
-                 'geometry': mapping(poly),
-                 'properties': {'raster_val': feature['properties']['raster_val'], 'area' : feature['area']}
-    })          
-
-#convert individual states yeary change to GeoTIFF
-def downloadedToShape(p,rasterName):
+    # answer True while the exports completed but the listings have not yet agreed on the shards
+    def settling(self):
+        return not self.landed and exportsCompleted(self.tracker, self.p)
+
+# answer the satellite, L8 or S2, of the export tasks matching p; it names the outputs and is known
+# before their shards are downloaded and after they are deleted
+def exportSatellite(tracker, p):
+    return next(p.match(t['description']).group(2) for t in tracker.tasks.values() if p.match(t.get('description', '')))
+
+# answer the file name of one output, e.g. swirLatestChangeL8CONUS.tif; the yearly CONUS product
+# keeps the S3 key it has always been published under, which repeats the product and satellite,
+# e.g. swirYearlyChange2019L8YearlyChange2019L8CONUS.tif
+def productFileName(index, region, productName, satelliteName):
+    name = productName + satelliteName
+    if productName.startswith('YearlyChange') and region == 'CONUS':
+        name = name + name
+    return index.lower() + name + region + '.tif'
+
+# mosaic the downloaded shards of one output, splitting its band out of stacked shards
+def mosaicProduct(index, region, productName, satelliteName, executor=None, outDir=None, stacked=False):
+    band = STACK_BANDS.index(index) + 1 if stacked else None
+    return mosaicDownloadedToGeotiff(shardPattern(index, region, stacked), productFileName(index, region, productName, satelliteName), executor, outDir, band)
+
+# answer the bytes a mosaic of one output will take, about its share of its shards
+def mosaicBytes(index, region, stacked=False):
+    p = shardPattern(index, region, stacked)
+    size = sum(os.path.getsize(downloadDir+f) for f in os.listdir(downloadDir) if p.match(f) and f.endswith('.tif'))
+    return size//len(STACK_BANDS) if stacked else size
+
+# mosaic one output unless the manifest holds it from an earlier attempt; with staging the mosaic
+# waits for room for its output and the shards no other output needs are deleted once it is done
+# @return the path of the mosaic, None when an earlier attempt already published it
+def mosaicOnce(manifest, index, region, productName, satelliteName, executor=None, stacked=False, staging=None):
+    key = index + region
+    done = manifest.productDone(key)
+    path = None if done else manifest.mosaicDone(key)
+    if path is None and not done:
+        token = staging.reserve('mosaics', mosaicBytes(index, region, stacked)) if staging is not None else None
+        try:
+            path = mosaicProduct(index, region, productName, satelliteName, executor, stacked=stacked)
+        finally:
+            if staging is not None:
+                staging.release(token, path)
+        manifest.recordMosaic(key, path)
+    if staging is not None:
+        staging.consume((index, region))
+    return path
+
+# upload the files the manifest has not recorded as uploaded
+# @return True when every file is in S3
+def publishOnce(manifest, publisher, paths):
+    todo = [path for path in paths if not manifest.uploadDone(path, publisher.keyFor(path))]
+    results = publisher.publish(todo)
+    for path, result in zip(todo, results):
+        if result is not None:
+            manifest.recordUpload(path, publisher.bucket, result['key'])
+    return all(result is not None for result in results)
+
+# upload a mosaicked product and its sidecars; once all of them are in S3 the product is recorded
+# as published and its files are deleted, so they no longer count against the staging budget
+# @param
+#     [paths] - the mosaic and its sidecars, empty when an earlier attempt published the product
+# @return True when every file is in S3
+def publishProduct(manifest, publisher, key, paths, staging=None):
+    if not publishOnce(manifest, publisher, paths):
+        return False
+    manifest.recordProduct(key)
+    if staging is not None:
+        for path in paths:
+            staging.discard(path)
+    return True
+
+# mosaic one output straight into its S3 key, falling back to staging it in outputDir
+# and uploading it when the direct write fails
+# @return True when the output is in S3
+def mosaicToS3Once(manifest, publisher, index, region, productName, satelliteName, executor=None, stacked=False, staging=None):
+    name = productFileName(index, region, productName, satelliteName)
+    if manifest.directUploadDone(publisher.keyFor(name)) or manifest.productDone(index + region):
+        if staging is not None:
+            staging.consume((index, region))
+        return True
+    started = time.time()
+    try:
+        mosaicProduct(index, region, productName, satelliteName, executor, os.path.dirname(publisher.vsiPath(name)) + '/', stacked)
+        result = publisher.finishDirect(name, time.time() - started)
+    except Exception as e:
+        report('writing {0} to S3 failed ({1}), staging it locally'.format(name, e))
+        result = None
+    if result is None:
+        return publishProduct(manifest, publisher, index + region, [mosaicOnce(manifest, index, region, productName, satelliteName, executor, stacked, staging)], staging)
+    manifest.recordUpload(publisher.vsiPath(name), publisher.bucket, result['key'], result['bytes'])
+    if staging is not None:
+        staging.consume((index, region))
+    return True
+
+# write the statistics sidecar, the zonal change tables and the tile pyramid of a mosaicked product; the tiles
+# are many small files, so they are uploaded here and only their TileJSON is left to upload
+# @return the product and its sidecars
+def deriveProducts(manifest, publisher, path, stats=True, tiles=False, tileZoom=productDerivatives.DEFAULT_TILE_ZOOM, tileWorkers=None, resampling='NEAREST', zones=None):
+    paths = [path]
+    if stats:
+        paths.append(productDerivatives.writeStatistics(path, report))
+    if zones:
+        paths.extend(zonalStats.writeZonalStats(path, zones, report=report))
+    if tiles:
+        base = os.path.splitext(path)[0]
+        tileJson = base + '.tiles.json'
+        if not manifest.uploadDone(tileJson, publisher.keyFor(tileJson)):
+            tileKey = publisher.keyFor(base + '.tiles')
+            tileDir, tileJson = productDerivatives.renderTiles(path, publisher.urlFor(tileKey), tileZoom, tileWorkers, resampling, report)
+            if not all(result is not None for result in publisher.publishTree(tileDir, tileKey + '/')):
+                raise RuntimeError('uploading the tiles of {0} failed'.format(os.path.basename(path)))
+        paths.append(tileJson)
+    return paths
+
+# add a mosaic then upload job for every output of the run, or a single job writing
+# the mosaic straight to S3 when direct is set; with stacked exports the jobs of a region
+# all become ready when its stacked exports land. derive, when given, takes a mosaicked
+# product and answers it with its sidecars, see deriveProducts. With staging an output is only
+# ready once none of its shards wait on Drive for room, and its files are deleted once uploaded
+# @return the ShardLanding of every output
+def scheduleProducts(scheduler, tracker, inventory, publisher, manifest, executor, yearly, productName, direct=False, stacked=False, derive=None, staging=None):
+    stacked = stacked and not yearly
+    derive = derive or (lambda path: [path])
+    landings = []
+    for index, region in changeProducts(yearly):
+        p = shardPattern(index, region, stacked)
+        landings.append(ShardLanding(tracker, inventory, manifest, p))
+        if staging is not None:
+            staging.addConsumer((index, region), p)
+        if direct:
+            stages = [('mosaic to S3', lambda index=index, region=region, p=p: mosaicToS3Once(manifest, publisher, index, region, productName, exportSatellite(tracker, p), executor, stacked, staging))]
+        else:
+            stages = [('mosaic', lambda index=index, region=region, p=p: mosaicOnce(manifest, index, region, productName, exportSatellite(tracker, p), executor, stacked, staging)),
+                      ('derive', lambda path: [] if path is None else derive(path)),
+                      ('upload', lambda paths, key=index+region: publishProduct(manifest, publisher, key, paths, staging))]
+        scheduler.add((index, region), lambda p=p, landed=landings[-1]: landed() and not (staging is not None and staging.pending(p)), stages)
+    return landings
+
+#convert individual states yeary change to GeoTIFF and change polygons, states running concurrently
+# @return the files written to outputDir
+def downloadedToShape(p,rasterName,vectorFormat='shp',workers=4,metrics=None):
     onlyfiles = [f for f in os.listdir(downloadDir) if isfile(join(downloadDir, f))]   
-    gen  = (s for s in onlyfiles if p.match(s))    
-    for tiffName in gen:
-        stateName = re.search(p,downloadedFiles[0]).group(2)
-        baseName = rasterName+stateName
-        translateToGeoTIFF(downloadDir+tiffName, downloadDir+baseName+ '.tif')
-        polygonize(downloadDir+baseName+ '.tif',outputDir+baseName+ '.shp')
+    tiffNames = [s for s in onlyfiles if p.match(s) and s.endswith('.tif')]
+    timings = stateShapes.run(tiffNames, p, rasterName, downloadDir, outputDir, vectorFormat, workers, report)
+    for timing in (timings if metrics is not None else []):
+        metrics.record('translate', timing['translate'], name=timing['state'])
+        metrics.record('polygonize', timing['polygonize'], name=timing['state'], polygons=timing['polygons'])
+    return [path for timing in timings for path in timing['outputs']]
+
+# copy the state change polygons GEE exported as GeoJSON, see yearlyProducts.py -stateShapes,
+# to the output directory under the names of the polygons made here
+def exportedShapes(shapeNames, rasterName):
+    outputs = []
+    for name in shapeNames:
+        outPath = outputDir+rasterName+parseExportName(name).region+'.geojson'
+        shutil.copyfile(downloadDir+name, outPath)
+        outputs.append(outPath)
+    return outputs
 
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/drive']
 def main():
 
+    published = False
+    metrics = tracker = downloader = publisher = mosaics = staging = None
     try:
         """Using the Drive v3 API to download products from GEE for upload to S3."""
-        yearly, year, bucket = parseCmdLine()   
+        args = parseCmdLine()
+        instrumentation.startLogging(args.log)
+        yearly, year, bucket = args.yearly, args.year, args.bucket
         if yearly: 
             productName = 'YearlyChange' + year
             bucketName = bucket
@@ -213,72 +422,108 @@ def main():
         text_file = open(ids_file, "r")
         ids = text_file.read().split(',')
         ids = list(filter(None, ids))
-        tasks = ee.data.getTaskList() 
-        #print('ids ',ids)
-        tasks = ee.data.getTaskList()
-        
-        #print('tasks2 ', tasks)
-        myTasks = list(filter(lambda x: x['id'] in ids, tasks))     
-        print('Begin download at {0}'.format(datetime.datetime.now().strftime("%a, %d %B %Y %H:%M:%S")))
-        while True:
-            results = service.files().list(pageSize=100, q="mimeType = 'image/tiff'", fields="nextPageToken, files(id, name)").execute()      
-            # get the specifics of the items on drive for download 
-            items = results.get('files', [])
-            # get any completed tasks and download them
-            successfulDownloads = len(downloadMultiple(items,service))
-            # if there's nothing let to do, quit
-            if not (pendingTasks(ids) or completedTasksRemaining(ids) or successfulDownloads):
-                break
-            else:
-                with open('/home/ec2-user/GitHub/southfact-data-v2/debug.log', 'a') as f:
-                    print("Waiting for exports to complete.", file=f, flush=True)
-                print("Waiting for exports to complete.", flush=True)
-                time.sleep(5*60) # Delay for 5 minutes.
+        # the manifest of a run is keyed by its export tasks
+        manifest = RunManifest(args.manifest, hashlib.sha1(','.join(sorted(ids)).encode()).hexdigest(), args.resume, report)
+        if manifest.resumed:
+            report('resuming run recorded in {0}'.format(args.manifest))
+        else:
+            resetWorkspaces()
+        metrics = Metrics(manifest.data['runKey'])
+        # each download worker builds its own service so it owns its HTTP connection
+        downloader = DriveDownloader(lambda: build('drive', 'v3', credentials=driveCredentials, cache_discovery=False), downloadDir,
+            workers=args.downloadWorkers, chunkSize=args.chunkMB*MB, rangeWorkers=args.rangeWorkers, deleteAfter=False,
+            onDownloaded=lambda item, path: manifest.recordShard(item['name'], path), report=report)
+        # downloaded files are deleted from Drive in batches after each pass
+        inventory = DriveInventory(service, report=report)
+        tracker = TaskTracker(ids, ee.data.getTaskList, report=report)
+        # outputs identical to what the bucket already holds, e.g. the scenes CSVs and PRVI on most days, are not uploaded again
+        client = s3Client(args.uploadWorkers, args.s3Endpoint)
+        bucketManifest = None if args.noPublishManifest else PublishManifest(client, "data.southfact.com", bucketName, report)
+        publisher = S3Publisher("data.southfact.com", bucketName, client=client, workers=args.uploadWorkers, published=bucketManifest, report=report)
+        # each output is mosaicked and uploaded as soon as its shards are on disk
+        scheduler = StageScheduler(workers=args.mosaicWorkers, report=report)
+        # warps run in their own processes with cores and memory split among them
+        # in s3 output mode the warps write through GDAL's /vsis3/ with the same credentials
+        direct = args.outputMode == 's3'
+        gdalConfig = gdalS3Config(AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, args.s3Endpoint) if direct else None
+        if args.scratchDir:
+            # GDAL stages the COG it is writing, and the overviews of it, under CPL_TMPDIR
+            pathlib.Path(args.scratchDir).mkdir(parents=True, exist_ok=True)
+            gdalConfig = dict(gdalConfig or {}, CPL_TMPDIR=args.scratchDir)
+        mosaics = MosaicExecutor(workers=args.mosaicWorkers, report=report, mode=args.mosaicMode, config=gdalConfig, overviews=args.overviewResampling)
+        # statistics, zonal tables and tiles are made from the staged mosaics, so not in s3 output mode;
+        # the zone boundaries are read and reprojected once for every product
+        derive = None
+        zones = zonalStats.parseZones(args.zones)
+        if not args.noStats or args.tiles or zones:
+            derive = lambda path: deriveProducts(manifest, publisher, path, not args.noStats, args.tiles, args.tileZoom, args.tileWorkers, args.overviewResampling, zones)
+        # shards and mosaics on the workspace are kept under -stagingGB, shards deleted once mosaicked
+        staging = StagingManager(int(args.stagingGB*GB) if args.stagingGB else None, report)
+        if manifest.resumed:
+            stageResumed(manifest, staging)
+        landings = scheduleProducts(scheduler, tracker, inventory, publisher, manifest, mosaics, yearly, productName, direct, args.stacked, derive, staging)
+        report('Begin download at {0}'.format(datetime.datetime.now().strftime("%a, %d %B %Y %H:%M:%S")))
+        # download as soon as a task completes instead of waiting for the whole batch
+        with metrics.timer('phase', name='exports and downloads'):
+            downloadAsTasksComplete(tracker, scheduler, landings, inventory, downloader, manifest, staging)
+            downloadDeferred(staging, scheduler, tracker, inventory, downloader, manifest)
+        for task in tracker.failed():
+            report('export {0} ended {1}'.format(task.get('description', task['id']), task['state']))
         # find IDs for the scenesBegin and scenesEnd CSVs
         queryStr="mimeType != 'image/tiff' and name contains "+csvString  
-        results = service.files().list(pageSize=100, q=queryStr, fields="nextPageToken, files(id, name)").execute()
-        # get the fileIDs of the items download 
-        items = results.get('files', [])
         # get CSVs and download them
-        downloadedFiles = downloadMultiple(items,service)
+        downloadMultiple(inventory.refresh(queryStr),downloader,inventory,manifest)
+        # CSVs downloaded by an earlier attempt are already gone from Drive, so take them from the manifest
+        downloadedFiles = manifest.shardNames(lambda n: parseExportName(n).kind in ('scenesBegin', 'scenesEnd'))
         successfulDownloads=len(downloadedFiles)
-        #pdb.set_trace()  
-        p=re.compile('(NDVI.?|SWIR.?|NDMI.?)(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}\w*(L8|S2)')
-        satelliteName = re.search(p,downloadedFiles[0]).group(3)
-        if successfulDownloads == 2:
-            upload_file(downloadDir+downloadedFiles[0], "data.southfact.com", bucketName+downloadedFiles[0])
-            upload_file(downloadDir+downloadedFiles[1], "data.southfact.com", bucketName+downloadedFiles[1])
-        # Mainland Southern states and PR VI mosaics
-        print('Begin mosaic to geotiff at {0}'.format(datetime.datetime.now().strftime("%a, %d %B %Y %H:%M:%S")))
-        os.chdir(downloadDir)
+        csvsPublished = successfulDownloads == 2 and publishOnce(manifest, publisher, [downloadDir+downloadedFiles[0], downloadDir+downloadedFiles[1]])
         # no metadata for now
         #mosaicDownloadedToGeotiff(re.compile('SWIR(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}datesBegin(L8|S2)CONUS'), 'swirdatesBegin' + productName + satelliteName + 'CONUS.tif')
         #mosaicDownloadedToGeotiff(re.compile('SWIR(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}datesEnd(L8|S2)CONUS'), 'swirdatesEnd' + productName + satelliteName + 'CONUS.tif')
         #mosaicDownloadedToGeotiff(re.compile('SWIR(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}datesBegin(L8|S2)PRVI'), 'swirdatesBegin' + productName + satelliteName + 'PRVI.tif')
         #mosaicDownloadedToGeotiff(re.compile('SWIR(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}datesEnd(L8|S2)PRVI'), 'swirdatesEnd' + productName + satelliteName + 'PRVI.tif')
+        shapesPublished = True
         if yearly:
-            # for yearly statewide products produce a shapefile of change polys and a regional GeoTIFF
-            #pdb.set_trace()
-            mosaicDownloadedToGeotiff(re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)CONUS'), 'swir' + productName + satelliteName + productName + satelliteName + 'CONUS.tif')
-            mosaicDownloadedToGeotiff(re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)PRVI'), 'swir' + productName + satelliteName + 'PRVI.tif')
-            # no shapefile of change polys  for now            
-            #downloadedToShape(re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(LA|AR|MS|KY|TN|OK|VA|SC|NC|GA|AL|TX|FL|PR|VI)(L8|S2)', 'swir' + productName + satelliteName))
-        else:
-            mosaicDownloadedToGeotiff(re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)CONUS'), 'swir' + productName + satelliteName + 'CONUS.tif')
-            mosaicDownloadedToGeotiff(re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)PRVI'), 'swir' + productName + satelliteName + 'PRVI.tif')
-            mosaicDownloadedToGeotiff(re.compile('NDMI.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)CONUS'), 'ndmi' + productName + satelliteName + 'CONUS.tif')  
-            mosaicDownloadedToGeotiff(re.compile('NDMI.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)PRVI'), 'ndmi' + productName + satelliteName + 'PRVI.tif')  
-            mosaicDownloadedToGeotiff(re.compile('NDVI.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)CONUS'),'ndvi' + productName + satelliteName + 'CONUS.tif')  
-            mosaicDownloadedToGeotiff(re.compile('NDVI.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(L8|S2)PRVI'), 'ndvi' + productName + satelliteName + 'PRVI.tif')  
-        onlyfiles = [f for f in os.listdir(outputDir) if isfile(join(outputDir, f))]    
-        for file in onlyfiles:
-            upload_file(outputDir+file, "data.southfact.com", bucketName+file)
-    except Exception as e: print(e)
+            # for yearly statewide products produce a shapefile of change polys
+            statePattern = re.compile('SWIR.?(-Latest|-Custom)-Change-Between-[0-9]{4}-and-[0-9]{4}(LA|AR|MS|KY|TN|OK|VA|SC|NC|GA|AL|TX|FL|PR|VI)(L8|S2)')
+            satelliteName = parseExportName(downloadedFiles[0]).satellite
+            # state polygons exported by GEE came down with the CSVs
+            shapeNames = manifest.shardNames(lambda n: parseExportName(n).kind == 'shapes')
+            with metrics.timer('phase', name='state shapes'):
+                shapesPublished = publishOnce(manifest, publisher, downloadedToShape(statePattern, 'swir' + productName + satelliteName, args.vectorFormat, args.stateWorkers, metrics)
+                                              + exportedShapes(shapeNames, 'swir' + productName + satelliteName))
+        for job in scheduler.waiting():
+            report('no complete exports for {0}, skipped'.format(' '.join(job.key)))
+        with metrics.timer('phase', name='mosaics'):
+            results = scheduler.wait()
+            mosaics.shutdown()
+        # the workspace is only cleaned up once every output is verified in S3
+        with metrics.timer('phase', name='verify'):
+            missing = publisher.verify(manifest.uploads())
+        published = csvsPublished and shapesPublished and not scheduler.waiting() and all(results.values()) and not missing
+        if missing:
+            report('not in S3 as recorded: {0}'.format(', '.join(missing)))
+    except Exception as e: report('run failed: {0}'.format(e))
     finally:
-        #clean up my mess
-        shutil.rmtree('/mnt/efs/fs1/GeoTIFF', ignore_errors=True)  
-        shutil.rmtree('/mnt/efs/fs1/output', ignore_errors=True)  
-        print ('Finished at {0}'.format(datetime.datetime.now().strftime("%a, %d %B %Y %H:%M:%S")))
+        # the publish manifest is written once, with whatever this run uploaded
+        if publisher is not None and publisher.published is not None:
+            try:
+                publisher.published.save()
+            except Exception as e: report('saving the publish manifest failed: {0}'.format(e))
+        if metrics is not None and staging is not None:
+            metrics.record('staging', 0.0, name='peak', bytes=staging.peak)
+        if metrics is not None:
+            collectMetrics(metrics, tracker, downloader, publisher, mosaics)
+            metrics.write(args.metrics)
+        #clean up my mess, unless the run has to be resumed
+        if published:
+            shutil.rmtree('/mnt/efs/fs1/GeoTIFF', ignore_errors=True)  
+            shutil.rmtree('/mnt/efs/fs1/output', ignore_errors=True)  
+            manifest.finish()
+        else:
+            report('Run not fully published, keeping workspaces; rerun with -resume')
+        report('Finished at {0}'.format(datetime.datetime.now().strftime("%a, %d %B %Y %H:%M:%S")))
+        instrumentation.stopLogging()
 
 
 if __name__ == '__main__':
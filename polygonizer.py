@@ -0,0 +1,183 @@
+from __future__ import print_function
+import multiprocessing, os, time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+# change pixels are those above this value on the 128-centered change scale
+CHANGE_THRESHOLD = 186
+# polygons with an outer ring smaller than this many sq m are dropped
+MIN_AREA = 80936
+DEFAULT_TILE_SIZE = 4096
+
+# answer the windows tiling a width x height raster
+# @return a list of (col, row, width, height)
+def tileWindows(width, height, tileSize=DEFAULT_TILE_SIZE):
+    return [(col, row, min(tileSize, width - col), min(tileSize, height - row))
+            for row in range(0, height, tileSize) for col in range(0, width, tileSize)]
+
+# polygonize the change pixels of one tile; runs in a worker process
+# polygons touching an edge shared with another tile are returned whole for merging,
+# the others are filtered by area here
+# @return (WKB of kept polygons, their areas, WKB of seam polygons)
+def _polygonizeTile(inRaster, window, rasterSize, threshold, minArea):
+    import numpy as np
+    import rasterio
+    import shapely
+    from rasterio.features import shapes
+    from rasterio.windows import Window
+    from shapely.geometry import Polygon, shape
+    col, row, width, height = window
+    with rasterio.open(inRaster) as src:
+        data = src.read(1, window=Window(col, row, width, height))
+        transform = src.window_transform(Window(col, row, width, height))
+    change = (data > threshold).astype(np.uint8)
+    del data
+    # which tile edges are seams with a neighbouring tile: left, top, right, bottom
+    seams = (col > 0, row > 0, col + width < rasterSize[0], row + height < rasterSize[1])
+    kept, areas, seamPolys = [], [], []
+    for geom, value in shapes(change, mask=change.astype(bool), transform=transform):
+        pixels = [(~transform)*xy for xy in geom['coordinates'][0]]
+        xs, ys = [c for c, r in pixels], [r for c, r in pixels]
+        onSeam = (seams[0] and min(xs) <= 0.5) or (seams[1] and min(ys) <= 0.5) or \
+                 (seams[2] and max(xs) >= width - 0.5) or (seams[3] and max(ys) >= height - 0.5)
+        if onSeam:
+            seamPolys.append(shape(geom))
+            continue
+        # like the shapefiles so far, polygons are their outer ring
+        outer = Polygon(geom['coordinates'][0])
+        area = outer.area
+        if area > minArea:
+            kept.append(outer)
+            areas.append(area)
+    return list(shapely.to_wkb(kept)), areas, list(shapely.to_wkb(seamPolys))
+
+# merge polygons cut by tile seams
+# @param
+#     [openBelow] - y of the seam under the last row of tiles done, when rows below it are still to
+#                   come; merged polygons reaching it may continue there and are kept open
+# @return (WKB of merged polygons, their areas, WKB of polygons still open), filtered by area
+def mergeSeams(seamPolys, minArea=MIN_AREA, openBelow=None, pixelHeight=0):
+    import shapely
+    from shapely.geometry import Polygon
+    from shapely.ops import unary_union
+    if not seamPolys:
+        return [], [], []
+    merged = unary_union(shapely.from_wkb(seamPolys))
+    kept, areas, still = [], [], []
+    for poly in getattr(merged, 'geoms', [merged]):
+        if openBelow is not None and poly.bounds[1] <= openBelow + pixelHeight/2.0:
+            still.append(poly)
+            continue
+        outer = Polygon(poly.exterior)
+        area = outer.area
+        if area > minArea:
+            kept.append(outer)
+            areas.append(area)
+    return list(shapely.to_wkb(kept)), areas, list(shapely.to_wkb(still))
+
+# answer the change polygon batches as an arrow stream of geometry (WKB), raster_val and area
+def _arrowBatches(batches):
+    import pyarrow as pa
+    schema = pa.schema([('geometry', pa.binary()), ('raster_val', pa.float64()), ('area', pa.float64())])
+    def gen():
+        for wkbs, areas in batches:
+            if wkbs:
+                yield pa.record_batch([pa.array(wkbs, pa.binary()), pa.array([1.0]*len(wkbs)), pa.array(areas, pa.float64())], schema=schema)
+    return schema, gen()
+
+# write change polygons to a shapefile in epsg:5070, one feature at a time
+# @param
+#     [batches] - iterable of (WKB list, area list)
+def writeShapefile(batches, outPath):
+    import fiona, shapely
+    from fiona.crs import from_epsg
+    from shapely.geometry import mapping
+    schema = {"geometry": 'Polygon', "properties": OrderedDict({'raster_val': 'float', 'area': 'float'})}
+    count = 0
+    with fiona.open(outPath, "w", driver="ESRI Shapefile", crs=from_epsg(5070), schema=schema) as c:
+        for wkbs, areas in batches:
+            for geometry, area in zip(shapely.from_wkb(wkbs), areas):
+                c.write({'geometry': mapping(geometry), 'properties': {'raster_val': 1.0, 'area': area}})
+                count += 1
+    return count
+
+# write change polygons to FlatGeobuf with its packed spatial index, a batch at a time
+def writeFlatGeobuf(batches, outPath):
+    import pyarrow as pa
+    import pyogrio
+    schema, gen = _arrowBatches(batches)
+    counted = []
+    def counting():
+        for batch in gen:
+            counted.append(batch.num_rows)
+            yield batch
+    pyogrio.write_arrow(pa.RecordBatchReader.from_batches(schema, counting()), outPath, driver='FlatGeobuf',
+                        geometry_name='geometry', geometry_type='Polygon', crs='EPSG:5070', layer_options={'SPATIAL_INDEX': 'YES'})
+    return sum(counted)
+
+# write change polygons to GeoParquet 1.0 with WKB geometries, a batch at a time
+def writeGeoParquet(batches, outPath):
+    import json
+    import pyarrow.parquet as pq
+    from pyproj import CRS
+    schema, gen = _arrowBatches(batches)
+    geo = {'version': '1.0.0', 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['Polygon'], 'crs': CRS.from_epsg(5070).to_json_dict()}}}
+    schema = schema.with_metadata({b'geo': json.dumps(geo).encode()})
+    count = 0
+    with pq.ParquetWriter(outPath, schema, compression='zstd') as writer:
+        for batch in gen:
+            writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+            count += batch.num_rows
+    return count
+
+# output formats for change polygons: file extension and writer
+VECTOR_FORMATS = OrderedDict([('fgb', ('.fgb', writeFlatGeobuf)), ('parquet', ('.parquet', writeGeoParquet)), ('shp', ('.shp', writeShapefile))])
+# files making up one output of each format
+VECTOR_SIDECARS = {'fgb': ['.fgb'], 'parquet': ['.parquet'], 'shp': ['.shp', '.shx', '.dbf', '.prj', '.cpg']}
+
+# create change polygons for a change raster, tile by tile across a process pool; peak memory
+# per worker is bounded by the tile size, and the polygons cut by seams are merged a row of tiles
+# at a time, so only those reaching the row below are held, bounded by the raster width
+# @param
+#     [inRaster] - a 128-centered north-up change raster
+#     [outPath] - full path to the output
+#     [tileSize] - tile width and height in pixels
+#     [workers] - number of worker processes, all CPUs by default
+#     [vectorFormat] - one of VECTOR_FORMATS, shp is the legacy format
+#     [report] - callable receiving a line once the polygons are written
+# @return the number of polygons written
+def polygonize(inRaster, outPath, threshold=CHANGE_THRESHOLD, minArea=MIN_AREA, tileSize=DEFAULT_TILE_SIZE, workers=None, vectorFormat='shp', report=print):
+    import rasterio
+    started = time.time()
+    with rasterio.open(inRaster) as src:
+        rasterSize = (src.width, src.height)
+        transform = src.transform
+    windows = tileWindows(rasterSize[0], rasterSize[1], tileSize)
+    workers = workers or os.cpu_count() or 1
+
+    def batches():
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            # at most two tiles per worker are in flight or waiting for the writer, so
+            # memory is bounded by the tile size rather than by the raster
+            pending, queued = deque(windows), deque()
+            # seam polygons of the row of tiles in progress, with those left open by the rows above
+            seamPolys, row = [], 0
+            while pending or queued:
+                while pending and len(queued) < 2*workers:
+                    window = pending.popleft()
+                    queued.append((window, pool.submit(_polygonizeTile, inRaster, window, rasterSize, threshold, minArea)))
+                window, future = queued.popleft()
+                if window[1] != row:
+                    # the row above is done: polygons not reaching its bottom seam are whole
+                    kept, areas, seamPolys = mergeSeams(seamPolys, minArea, (transform*(0, window[1]))[1], -transform.e)
+                    row = window[1]
+                    yield kept, areas
+                kept, areas, seams = future.result()
+                seamPolys.extend(seams)
+                yield kept, areas
+        yield mergeSeams(seamPolys, minArea)[:2]
+
+    count = VECTOR_FORMATS[vectorFormat][1](batches(), outPath)
+    report('Polygonized {0}: {1} polygons from {2} tiles in {3:.1f} s'.format(os.path.basename(inRaster), count, len(windows), time.time() - started))
+    return count
@@ -0,0 +1,73 @@
+from __future__ import print_function
+import json, os, time
+
+# the change scale is centered on 128 with 0 for masked pixels, so overviews and tiles take
+# the nearest pixel; averaging or cubic would blend gains, losses and the masked 0s into
+# change values no pixel of the product has
+OVERVIEW_RESAMPLINGS = ['NEAREST', 'MODE', 'AVERAGE']
+DEFAULT_TILE_ZOOM = '0-10'
+STATS_BLOCK = 4096
+
+# answer the statistics and histogram of every band of an 8 bit change product; 0 is the
+# masked value and is left out, except from the pixel counts
+# @return dict of the band number to count, valid, min, max, mean, std and a 256 bucket histogram
+def bandStatistics(path, blockSize=STATS_BLOCK):
+    import numpy as np
+    import rasterio
+    from rasterio.windows import Window
+    from polygonizer import tileWindows
+    stats = {}
+    with rasterio.open(path) as src:
+        windows = tileWindows(src.width, src.height, blockSize)
+        for band in range(1, src.count + 1):
+            histogram = np.zeros(256, dtype=np.int64)
+            for window in windows:
+                histogram += np.bincount(src.read(band, window=Window(*window)).ravel(), minlength=256)[:256]
+            values = np.arange(256)
+            valid = int(histogram[1:].sum())
+            mean = float((histogram[1:]*values[1:]).sum())/valid if valid else None
+            stats[band] = {'count': int(histogram.sum()), 'valid': valid,
+                           'min': int(values[1:][histogram[1:] > 0].min()) if valid else None,
+                           'max': int(values[1:][histogram[1:] > 0].max()) if valid else None,
+                           'mean': mean,
+                           'std': float(np.sqrt((histogram[1:]*(values[1:] - mean)**2).sum()/valid)) if valid else None,
+                           'histogram': histogram.tolist()}
+    return stats
+
+# write the band statistics of a product to a JSON sidecar beside it, e.g. swirLatestChangeL8CONUS.stats.json,
+# and a line to report
+# @return path of the sidecar
+def writeStatistics(path, report=print):
+    started = time.time()
+    outPath = os.path.splitext(path)[0] + '.stats.json'
+    with open(outPath, 'w') as f:
+        json.dump({'file': os.path.basename(path), 'nodata': 0, 'bands': bandStatistics(path)}, f, sort_keys=True)
+    report('Statistics of {0} in {1:.1f} s'.format(os.path.basename(path), time.time() - started))
+    return outPath
+
+# render an XYZ web mercator PNG pyramid of a product with gdal2tiles, whose --processes
+# renders the tiles in a process pool, and describe it in a TileJSON beside it
+# @param
+#     [path] - the product COG
+#     [tileUrl] - URL the tile directory will be served from, the {z}/{x}/{y}.png template is appended
+#     [zoom] - zoom levels rendered, e.g. 0-10
+#     [processes] - worker processes, all CPUs by default
+#     [resampling] - one of OVERVIEW_RESAMPLINGS
+#     [report] - callable receiving a line once the tiles are rendered
+# @return (directory of the tiles, path of the TileJSON)
+def renderTiles(path, tileUrl, zoom=DEFAULT_TILE_ZOOM, processes=None, resampling='NEAREST', report=print):
+    from osgeo_utils import gdal2tiles
+    started = time.time()
+    base = os.path.splitext(path)[0]
+    tileDir = base + '.tiles'
+    gdal2tiles.main(['gdal2tiles', '--xyz', '--zoom={0}'.format(zoom), '--processes={0}'.format(processes or os.cpu_count() or 1),
+                     '--resampling={0}'.format({'NEAREST': 'near', 'MODE': 'mode', 'AVERAGE': 'average'}[resampling]),
+                     '--srcnodata=0', '--webviewer=none', path, tileDir])
+    minZoom, maxZoom = [int(z) for z in zoom.split('-')] if '-' in zoom else (int(zoom), int(zoom))
+    tileJson = base + '.tiles.json'
+    with open(tileJson, 'w') as f:
+        json.dump({'tilejson': '2.2.0', 'name': os.path.basename(base), 'scheme': 'xyz', 'minzoom': minZoom, 'maxzoom': maxZoom,
+                   'tiles': [tileUrl.rstrip('/') + '/{z}/{x}/{y}.png']}, f, sort_keys=True)
+    report('Tiles of {0} for zoom {1} in {2:.1f} s'.format(os.path.basename(path), zoom, time.time() - started))
+    return tileDir, tileJson
+
@@ -0,0 +1,91 @@
+from __future__ import print_function
+import json, os, threading, time
+from botocore.exceptions import ClientError
+from runManifest import fileHash
+
+MANIFEST_NAME = 'publishManifest.json'
+
+# Record kept in the bucket, beside the products, of the size and sha256 of every object
+# published under a prefix, so a run skips uploading files identical to what is already there.
+# It is read once at the start of a run and written back in one PUT at the end.
+# @param
+#     [client] - an S3 client
+#     [bucket] - the bucket of the products
+#     [prefix] - key prefix of the products, the manifest is prefix + MANIFEST_NAME
+#     [report] - callable receiving a line once the manifest is saved or when it cannot be read
+class PublishManifest(object):
+
+    def __init__(self, client, bucket, prefix='', report=print):
+        self.client = client
+        self.bucket = bucket
+        self.key = (prefix or '') + MANIFEST_NAME
+        self.report = report
+        self.lock = threading.Lock()
+        self.hashes = {}
+        self.changed = False
+        self.objects = self._load()
+
+    def _load(self):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self.key)['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                self.report('reading s3://{0}/{1} failed, publishing every file: {2}'.format(self.bucket, self.key, e))
+            return {}
+        return json.loads(body.decode('utf-8')).get('objects', {})
+
+    # answer the sha256 of a local file, hashed once per run
+    def hashOf(self, path):
+        with self.lock:
+            sha256 = self.hashes.get(path)
+        if sha256 is None:
+            sha256 = fileHash(path)
+            with self.lock:
+                self.hashes[path] = sha256
+        return sha256
+
+    # answer True when key already holds the content of path: the manifest records the
+    # same size and hash and the object is still there with that size
+    def unchanged(self, path, key):
+        entry = self.objects.get(key)
+        size = os.path.getsize(path)
+        if entry is None or entry['size'] != size or entry.get('sha256') != self.hashOf(path):
+            return False
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength'] == size
+        except ClientError:
+            return False
+
+    # record that key now holds the content of path
+    def record(self, path, key):
+        entry = {'size': os.path.getsize(path), 'sha256': self.hashOf(path), 'published': time.time()}
+        with self.lock:
+            self.objects[key] = entry
+            self.changed = True
+
+    # record that the keys under keyPrefix hold a tree of files, e.g. a tile pyramid, as one entry
+    def recordTree(self, keyPrefix, files, size):
+        entry = {'size': size, 'files': files, 'published': time.time()}
+        with self.lock:
+            self.objects[keyPrefix] = entry
+            self.changed = True
+
+    # forget key, e.g. after it was written without a local copy to hash
+    def forget(self, key):
+        with self.lock:
+            if self.objects.pop(key, None) is not None:
+                self.changed = True
+
+    # write the manifest back in one PUT, which S3 applies atomically
+    def save(self):
+        with self.lock:
+            if not self.changed:
+                return
+            body = json.dumps({'objects': self.objects, 'saved': time.time()}, indent=1, sort_keys=True)
+            self.changed = False
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=self.key, Body=body.encode('utf-8'), ContentType='application/json')
+        except ClientError:
+            self.changed = True
+            raise
+        self.report('Saved s3://{0}/{1} with {2} objects'.format(self.bucket, self.key, len(self.objects)))
@@ -0,0 +1,127 @@
+from __future__ import print_function
+import hashlib, json, os, threading, time
+
+HASH_BLOCK = 8*1024*1024
+
+# answer the sha256 of a file, read in blocks
+def fileHash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            h.update(block)
+    return h.hexdigest()
+
+# Record of the work a pipeline run has completed, saved after every change so a
+# failed run can be resumed without exporting and downloading again
+# @param
+#     [path] - JSON file holding the manifest, kept outside the workspaces it describes
+#     [runKey] - identifies the run, e.g. a digest of the GEE task ids
+#     [resume] - keep the work recorded by an earlier attempt of the same run
+#     [report] - callable receiving a line when the manifest found belongs to another run
+class RunManifest(object):
+
+    def __init__(self, path, runKey, resume=False, report=print):
+        self.path = path
+        self.report = report
+        self.lock = threading.Lock()
+        self.verified = set()
+        data = None
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('runKey') != runKey:
+                self.report('manifest {0} is for another run, starting over'.format(path))
+                data = None
+        self.resumed = data is not None
+        self.data = data or {'runKey': runKey, 'started': time.time(), 'shards': {}, 'mosaics': {}, 'uploads': {}, 'products': {}}
+        self.save()
+
+    # write the manifest atomically
+    def save(self):
+        with self.lock:
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    # record a downloaded shard with its size and hash
+    def recordShard(self, name, path):
+        entry = {'path': path, 'size': os.path.getsize(path), 'sha256': fileHash(path)}
+        with self.lock:
+            self.data['shards'][name] = entry
+            self.verified.add(path)
+        self.save()
+
+    # answer True when a shard was downloaded and is still intact on disk
+    def shardDone(self, name):
+        entry = self.data['shards'].get(name)
+        if entry is None:
+            return False
+        return self._intact(entry['path'], entry['size'], entry['sha256'])
+
+    # answer the recorded shards whose names satisfy test
+    def shardNames(self, test=lambda name: True):
+        return sorted(name for name in self.data['shards'] if test(name))
+
+    def _intact(self, path, size, sha256=None):
+        if path in self.verified:
+            return os.path.exists(path)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return False
+        if sha256 is not None and fileHash(path) != sha256:
+            return False
+        self.verified.add(path)
+        return True
+
+    # record a finished mosaic, keyed by its output name
+    def recordMosaic(self, key, path):
+        with self.lock:
+            self.data['mosaics'][key] = {'path': path, 'size': os.path.getsize(path)}
+        self.save()
+
+    # answer the path of a finished mosaic still on disk, or None
+    def mosaicDone(self, key):
+        entry = self.data['mosaics'].get(key)
+        if entry is not None and self._intact(entry['path'], entry['size']):
+            return entry['path']
+        return None
+
+    # record a product whose files are all in S3, so a resumed run neither mosaics nor uploads it again
+    def recordProduct(self, key):
+        with self.lock:
+            self.data.setdefault('products', {})[key] = time.time()
+        self.save()
+
+    # answer True when every file of a product was uploaded by an earlier attempt
+    def productDone(self, key):
+        return key in self.data.get('products', {})
+
+    # answer the local path of a recorded shard
+    def shardPath(self, name):
+        return self.data['shards'][name]['path']
+
+    # record an uploaded object; size is needed for objects written straight to S3
+    def recordUpload(self, path, bucket, key, size=None):
+        with self.lock:
+            self.data['uploads'][key] = {'path': path, 'bucket': bucket, 'size': os.path.getsize(path) if size is None else size}
+        self.save()
+
+    # answer True when the local file was already uploaded under key
+    def uploadDone(self, path, key):
+        entry = self.data['uploads'].get(key)
+        return entry is not None and os.path.exists(path) and entry['size'] == os.path.getsize(path)
+
+    # answer True when key was written straight to S3 by an earlier attempt
+    def directUploadDone(self, key):
+        entry = self.data['uploads'].get(key)
+        return entry is not None and entry['path'].startswith('/vsis3/')
+
+    # answer the recorded uploads as (bucket, key, size)
+    def uploads(self):
+        return [(e['bucket'], key, e['size']) for key, e in sorted(self.data['uploads'].items())]
+
+    # remove the manifest once the run is published
+    def finish(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,186 @@
+from __future__ import print_function
+import math, os, tempfile, time, boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+MB = 1024*1024
+DEFAULT_WORKERS = 4
+DEFAULT_OBJECT_CONCURRENCY = 8
+# S3 allows at most 10000 parts, each at least 5 MB
+MIN_PART_SIZE = 8*MB
+MAX_PARTS = 10000
+PUBLIC_READ = {'ACL': 'public-read'}
+
+# answer the multipart settings for an object of size bytes: parts grow with the
+# object so huge mosaics stay under the part limit, and small files go in one PUT
+def transferConfigFor(size, maxConcurrency=DEFAULT_OBJECT_CONCURRENCY):
+    partSize = max(MIN_PART_SIZE, int(math.ceil(size/float(MAX_PARTS)/MB))*MB)
+    # on large objects use bigger parts, up to 64 MB, to cut per-request overhead
+    while partSize < 64*MB and size/partSize > 4*maxConcurrency*4:
+        partSize *= 2
+    parts = max(1, int(math.ceil(size/float(partSize))))
+    return TransferConfig(multipart_threshold=partSize, multipart_chunksize=partSize,
+                          max_concurrency=max(1, min(maxConcurrency, parts)), use_threads=True)
+
+# answer an S3 client whose connection pool covers workers objects of objectConcurrency parts each
+def makeClient(workers=DEFAULT_WORKERS, objectConcurrency=DEFAULT_OBJECT_CONCURRENCY, aws_access_key_id=None, aws_secret_access_key=None, endpoint_url=None):
+    config = Config(max_pool_connections=max(1, workers)*max(1, objectConcurrency), retries={'max_attempts': 10, 'mode': 'adaptive'})
+    return boto3.client('s3', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key,
+                        endpoint_url=endpoint_url, config=config)
+
+# answer the GDAL config options writing through /vsis3/ with the given credentials;
+# an endpoint such as http://127.0.0.1:5000 points GDAL at a local S3 stand-in like moto
+def gdalS3Config(aws_access_key_id=None, aws_secret_access_key=None, endpoint_url=None):
+    config = {
+        # the COG writer stages its intermediate file on local disk, not beside the output
+        'CPL_TMPDIR': tempfile.gettempdir(),
+        'CPL_VSIL_USE_TEMP_FILE_FOR_RANDOM_WRITE': 'YES',
+        # 64 MB parts keep objects up to 640 GB under the part limit
+        'VSIS3_CHUNK_SIZE': '64',
+    }
+    if aws_access_key_id:
+        config['AWS_ACCESS_KEY_ID'] = aws_access_key_id
+        config['AWS_SECRET_ACCESS_KEY'] = aws_secret_access_key
+    if endpoint_url:
+        scheme, host = endpoint_url.split('://', 1)
+        config.update({'AWS_S3_ENDPOINT': host.rstrip('/'), 'AWS_HTTPS': 'YES' if scheme == 'https' else 'NO',
+                       'AWS_VIRTUAL_HOSTING': 'FALSE'})
+    return config
+
+# Publishes files to S3 through one shared client and connection pool
+# @param
+#     [bucket] - destination bucket, e.g. data.southfact.com
+#     [prefix] - key prefix, e.g. current-year-to-date/
+#     [client] - an S3 client to use instead of building one, e.g. a moto client
+#     [workers] - number of objects uploaded at once
+#     [objectConcurrency] - upper bound on concurrent parts per object
+#     [published] - a publishManifest.PublishManifest; files it holds unchanged are not uploaded again
+#     [report] - callable receiving one line per object published or refused
+class S3Publisher(object):
+
+    def __init__(self, bucket, prefix='', client=None, workers=DEFAULT_WORKERS, objectConcurrency=DEFAULT_OBJECT_CONCURRENCY,
+                 aws_access_key_id=None, aws_secret_access_key=None, endpoint_url=None, published=None, report=print):
+        self.bucket = bucket
+        self.prefix = prefix or ''
+        self.workers = max(1, workers)
+        self.objectConcurrency = max(1, objectConcurrency)
+        if client is None:
+            client = makeClient(self.workers, self.objectConcurrency, aws_access_key_id, aws_secret_access_key, endpoint_url)
+        self.client = client
+        self.published = published
+        self.report = report
+        # the result of every object published
+        self.timings = []
+
+    # answer the S3 key for a local file, keeping the bucketName+file layout
+    def keyFor(self, path):
+        return self.prefix + os.path.basename(path)
+
+    # upload one file, unless the publish manifest shows the object already holds it
+    # @return a dict with the key, size, seconds and bytes/s, skipped set when not uploaded, or None if S3 refused it
+    def uploadOne(self, path, key=None, verbose=True):
+        key = key or self.keyFor(path)
+        size = os.path.getsize(path)
+        if self.published is not None and self.published.unchanged(path, key):
+            if verbose:
+                self.report('Unchanged s3://{0}/{1} ({2:.1f} MB), not uploaded'.format(self.bucket, key, size/MB))
+            return {'key': key, 'bytes': size, 'seconds': 0.0, 'bytesPerSecond': 0.0, 'skipped': True}
+        started = time.time()
+        try:
+            self.client.upload_file(path, self.bucket, key, ExtraArgs=PUBLIC_READ, Config=transferConfigFor(size, self.objectConcurrency))
+        # upload_file wraps the ClientError of a failed PUT or part in S3UploadFailedError
+        except (ClientError, S3UploadFailedError) as e:
+            self.report('Uploading s3://{0}/{1} failed: {2}'.format(self.bucket, key, e))
+            return None
+        elapsed = max(time.time() - started, 1e-6)
+        if verbose:
+            self.report('Uploaded s3://{0}/{1} ({2:.1f} MB in {3:.1f} s, {4:.1f} MB/s)'.format(self.bucket, key, size/MB, elapsed, size/MB/elapsed))
+        result = {'key': key, 'bytes': size, 'seconds': elapsed, 'bytesPerSecond': size/elapsed}
+        self.timings.append(result)
+        if self.published is not None:
+            self.published.record(path, key)
+        return result
+
+    # answer the path-style URL of an object
+    def urlFor(self, key):
+        return '{0}/{1}/{2}'.format(self.client.meta.endpoint_url.rstrip('/'), self.bucket, key)
+
+    # answer the GDAL path writing a file straight to its S3 key
+    def vsiPath(self, name):
+        return '/vsis3/{0}/{1}'.format(self.bucket, self.keyFor(name))
+
+    # make an object GDAL wrote through /vsis3/ public, as uploadOne does
+    # @return a dict like uploadOne's, or None if S3 refused it
+    def finishDirect(self, name, seconds):
+        key = self.keyFor(name)
+        # there is no local copy to hash, so the next run uploads this key whatever it holds
+        if self.published is not None:
+            self.published.forget(key)
+        try:
+            self.client.put_object_acl(Bucket=self.bucket, Key=key, **PUBLIC_READ)
+            size = self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+        except ClientError as e:
+            self.report('Finishing s3://{0}/{1} failed: {2}'.format(self.bucket, key, e))
+            return None
+        seconds = max(seconds, 1e-6)
+        self.report('Wrote s3://{0}/{1} ({2:.1f} MB in {3:.1f} s)'.format(self.bucket, key, size/MB, seconds))
+        result = {'key': key, 'bytes': size, 'seconds': seconds, 'bytesPerSecond': size/seconds, 'direct': True}
+        self.timings.append(result)
+        return result
+
+    # check uploaded objects against their expected sizes
+    # @param
+    #     [uploads] - list of (bucket, key, size)
+    # @return the keys that are missing or differ in size
+    def verify(self, uploads):
+        bad = []
+        for bucket, key, size in uploads:
+            try:
+                if self.client.head_object(Bucket=bucket, Key=key)['ContentLength'] != size:
+                    bad.append(key)
+            except ClientError as e:
+                self.report('Checking s3://{0}/{1} failed: {2}'.format(bucket, key, e))
+                bad.append(key)
+        return bad
+
+    # upload several files at once
+    # @return the result of uploadOne for every file, in the order given
+    def publish(self, paths):
+        paths = list(paths)
+        if not paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(paths))) as pool:
+            return list(pool.map(self.uploadOne, paths))
+
+    # upload one file of a tree as it is, without the publish manifest
+    # @return a dict with the key and size, or None if S3 refused it
+    def _uploadPlain(self, path, key):
+        size = os.path.getsize(path)
+        try:
+            self.client.upload_file(path, self.bucket, key, ExtraArgs=PUBLIC_READ, Config=transferConfigFor(size, self.objectConcurrency))
+        except (ClientError, S3UploadFailedError) as e:
+            self.report('Uploading s3://{0}/{1} failed: {2}'.format(self.bucket, key, e))
+            return None
+        return {'key': key, 'bytes': size}
+
+    # upload every file below a directory, e.g. a tile pyramid, keyed by keyPrefix and its path in the directory;
+    # the files are many and small, so they skip the publish manifest, which records one entry for the tree
+    # @return a dict with the key and size of every file, None for those S3 refused
+    def publishTree(self, root, keyPrefix):
+        files = [(os.path.join(d, name), keyPrefix + os.path.relpath(os.path.join(d, name), root).replace(os.sep, '/'))
+                 for d, dirs, names in os.walk(root) for name in names]
+        if not files:
+            return []
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(files))) as pool:
+            results = list(pool.map(lambda f: self._uploadPlain(*f), files))
+        elapsed = max(time.time() - started, 1e-6)
+        size = sum(r['bytes'] for r in results if r is not None)
+        self.timings.append({'key': keyPrefix, 'bytes': size, 'seconds': elapsed, 'bytesPerSecond': size/elapsed})
+        if self.published is not None and all(r is not None for r in results):
+            self.published.recordTree(keyPrefix, len(files), size)
+        self.report('Uploaded {0} files to s3://{1}/{2} in {3:.1f} s'.format(len(files), self.bucket, keyPrefix, elapsed))
+        return results
@@ -0,0 +1,77 @@
+from __future__ import print_function
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# A job runs its stages in order, each stage receiving the result of the one before
+# @param
+#     [key] - identifies the job, e.g. ('SWIR', 'CONUS')
+#     [isReady] - callable answering True once every input of the job is on disk
+#     [stages] - list of (name, callable) run in order; the first callable takes no argument
+class Job(object):
+
+    def __init__(self, key, isReady, stages):
+        self.key = key
+        self.isReady = isReady
+        self.stages = stages
+        self.timings = []
+        self.future = None
+
+    def run(self):
+        result = None
+        for i, (name, stage) in enumerate(self.stages):
+            started = time.time()
+            result = stage() if i == 0 else stage(result)
+            self.timings.append((name, time.time() - started))
+        return result
+
+# Starts each job on a worker pool as soon as its inputs are ready, so the stages
+# of one product overlap with downloads and stages of other products still in progress
+# @param
+#     [workers] - number of jobs run at once
+#     [report] - callable receiving one line per started or finished job
+class StageScheduler(object):
+
+    def __init__(self, workers=3, report=print):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.report = report
+        self.jobs = []
+
+    def add(self, key, isReady, stages):
+        job = Job(key, isReady, stages)
+        self.jobs.append(job)
+        return job
+
+    # start every waiting job whose inputs are ready
+    # @return the jobs started
+    def update(self):
+        started = []
+        for job in self.jobs:
+            if job.future is None and job.isReady():
+                self.report('starting {0}'.format(' '.join(job.key)))
+                job.future = self.pool.submit(job.run)
+                job.future.add_done_callback(lambda f, job=job: self._finished(job))
+                started.append(job)
+        return started
+
+    def _finished(self, job):
+        if job.future.exception() is not None:
+            self.report('{0} failed: {1}'.format(' '.join(job.key), job.future.exception()))
+        else:
+            self.report('finished {0}: {1}'.format(' '.join(job.key), ', '.join('{0} {1:.1f} s'.format(n, s) for n, s in job.timings)))
+
+    # answer True while a started job has not finished
+    def busy(self):
+        return any(job.future is not None and not job.future.done() for job in self.jobs)
+
+    # answer the jobs that never became ready
+    def waiting(self):
+        return [job for job in self.jobs if job.future is None]
+
+    # wait for every started job, raising the first failure once all are done
+    # @return a dict of job key to the result of its last stage
+    def wait(self):
+        self.pool.shutdown(wait=True)
+        errors = [job.future.exception() for job in self.jobs if job.future is not None and job.future.exception() is not None]
+        if errors:
+            raise errors[0]
+        return dict((job.key, job.future.result()) for job in self.jobs if job.future is not None)
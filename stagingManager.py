@@ -0,0 +1,152 @@
+from __future__ import print_function
+import os, threading
+
+GB = 1024*1024*1024
+
+# raised when work cannot fit the staging budget even once everything else has finished
+class StagingBudgetExceeded(Exception):
+    pass
+
+# Keeps the bytes staged on the workspace under a budget. Downloads are admitted a whole
+# export at a time while they fit, mosaics reserve room for their output before they start,
+# and each shard is deleted once every product mosaicked from it has finished.
+# @param
+#     [budgetBytes] - most bytes staged at once, None for no limit
+#     [report] - callable receiving a line per eviction and deferral
+class StagingManager(object):
+
+    def __init__(self, budgetBytes=None, report=print):
+        self.budgetBytes = budgetBytes
+        self.report = report
+        self.condition = threading.Condition()
+        # path to (stage, bytes) of the files staged, and token to (stage, bytes) of reserved room
+        self.files = {}
+        self.reserved = {}
+        # product key to the pattern of its shards, and the products whose mosaics have finished
+        self.consumers = {}
+        self.consumed = set()
+        # name to bytes of the files left on Drive for want of room, and export to bytes of their exports
+        self.deferred = {}
+        self.deferredGroups = {}
+        self.peak = 0
+
+    # answer the bytes staged and reserved per stage
+    def usage(self):
+        with self.condition:
+            stages = {}
+            for stage, size in list(self.files.values()) + list(self.reserved.values()):
+                stages[stage] = stages.get(stage, 0) + size
+            return stages
+
+    def _total(self):
+        return sum(size for stage, size in self.files.values()) + sum(size for stage, size in self.reserved.values())
+
+    def _fits(self, size):
+        return self.budgetBytes is None or self._total() + size <= self.budgetBytes
+
+    def _changed(self):
+        self.peak = max(self.peak, self._total())
+        self.condition.notify_all()
+
+    # count a file on disk, or about to be, against a stage
+    def add(self, stage, path, size=None):
+        with self.condition:
+            self.files[path] = (stage, os.path.getsize(path) if size is None else size)
+            self._changed()
+
+    # delete a staged file and free its room
+    def discard(self, path):
+        with self.condition:
+            self.files.pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+            self._changed()
+
+    # admit the downloads that fit, a whole export at a time; the others stay on Drive and
+    # are deferred until room is freed
+    # @param
+    #     [groups] - dict of export to its Drive files, with name and size
+    #     [pathFor] - callable answering the local path of an item
+    # @return dict of export to the items admitted, already counted as staged shards
+    def admit(self, groups, pathFor):
+        admitted, deferred, deferredGroups = {}, {}, {}
+        with self.condition:
+            for key, group in groups.items():
+                size = sum(int(item.get('size', 0)) for item in group)
+                if self._fits(size):
+                    for item in group:
+                        self.files[pathFor(item)] = ('shards', int(item.get('size', 0)))
+                    admitted[key] = group
+                else:
+                    deferred.update((item['name'], int(item.get('size', 0))) for item in group)
+                    deferredGroups[key] = size
+            if deferred and len(deferred) != len(self.deferred):
+                self.report('staging: {0} files wait on Drive for room, {1:.1f} of {2:.1f} GB staged'.format(
+                    len(deferred), self._total()/float(GB), self.budgetBytes/float(GB)))
+            self.deferred = deferred
+            self.deferredGroups = deferredGroups
+            self._changed()
+        return admitted
+
+    # answer True while files of the pattern wait on Drive, so its products are not mosaicked without them
+    def pending(self, p):
+        with self.condition:
+            return any(p.match(name) for name in self.deferred)
+
+    # answer the bytes of the smallest export waiting on Drive, the room the next admission needs
+    def smallestDeferred(self):
+        with self.condition:
+            return min(self.deferredGroups.values()) if self.deferredGroups else 0
+
+    # wait until size bytes fit or timeout seconds pass
+    # @return True when they fit
+    def waitForRoom(self, size, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self._fits(size), timeout)
+
+    # reserve room for the output of a stage, waiting while other reservations may free some
+    # @return a token for release
+    def reserve(self, stage, size):
+        token = object()
+        with self.condition:
+            while not self._fits(size):
+                if not self.reserved:
+                    raise StagingBudgetExceeded('{0} needs {1:.1f} GB, {2:.1f} of {3:.1f} GB are staged'.format(
+                        stage, size/float(GB), self._total()/float(GB), self.budgetBytes/float(GB)))
+                self.condition.wait()
+            self.reserved[token] = (stage, size)
+            self._changed()
+        return token
+
+    # give back a reservation, counting the output written in its place when there is one
+    def release(self, token, path=None):
+        with self.condition:
+            stage, size = self.reserved.pop(token)
+            if path is not None and os.path.exists(path):
+                self.files[path] = (stage, os.path.getsize(path))
+            self._changed()
+
+    # declare a product mosaicked from the shards matching a pattern
+    def addConsumer(self, key, p):
+        with self.condition:
+            self.consumers[key] = p
+
+    # mark a product's mosaic finished and delete the shards no unfinished product needs
+    # @return the paths deleted
+    def consume(self, key):
+        with self.condition:
+            self.consumed.add(key)
+            evict = []
+            for path, (stage, size) in self.files.items():
+                name = os.path.basename(path)
+                needers = [k for k, p in self.consumers.items() if p.match(name)]
+                if stage == 'shards' and name.endswith('.tif') and needers and all(k in self.consumed for k in needers):
+                    evict.append(path)
+            for path in evict:
+                self.files.pop(path)
+                if os.path.exists(path):
+                    os.remove(path)
+            if evict:
+                self.report('staging: deleted {0} shards of {1}'.format(len(evict), ' '.join(key)))
+            self._changed()
+        return evict
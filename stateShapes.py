@@ -0,0 +1,59 @@
+from __future__ import print_function
+import multiprocessing, os, re, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import polygonizer
+from gdalTranslate import translateToCOG, progressPrinter
+
+# the SGSF states with yearly state rasters
+SGSF_STATES = ['LA', 'AR', 'MS', 'KY', 'TN', 'OK', 'VA', 'SC', 'NC', 'GA', 'AL', 'TX', 'FL', 'PR', 'VI']
+
+# Utility function to convert a TIFF to a cloud optimized GeoTIFF, in this process
+# @param
+#     [inRaster] - path of the input raster
+#     [outRasterPath] - full path to the output GeoTIFF
+# @return seconds taken, raises gdalTranslate.TranslateError on failure
+def translateToGeoTIFF(inRaster, outRasterPath, threads='ALL_CPUS'):
+    return translateToCOG(inRaster, outRasterPath, threads,
+                          progressPrinter(os.path.basename(outRasterPath), step=25))
+
+# translate and polygonize one state raster; runs in a worker process
+# @return the timing breakdown of the state and the files it wrote
+def stateJob(tiffName, p, rasterName, downloadDir, outputDir, vectorFormat, polygonWorkers):
+    # the state comes from this job's own file name
+    stateName = re.search(p, tiffName).group(2)
+    baseName = rasterName+stateName
+    started = time.time()
+    translateToGeoTIFF(downloadDir+tiffName, downloadDir+baseName+'.tif', polygonWorkers)
+    translated = time.time()
+    polygons = polygonizer.polygonize(downloadDir+baseName+'.tif', outputDir+baseName+polygonizer.VECTOR_FORMATS[vectorFormat][0],
+                                      threshold=polygonizer.CHANGE_THRESHOLD, minArea=polygonizer.MIN_AREA,
+                                      workers=polygonWorkers, vectorFormat=vectorFormat)
+    outputs = [outputDir+baseName+ext for ext in polygonizer.VECTOR_SIDECARS[vectorFormat] if os.path.exists(outputDir+baseName+ext)]
+    return {'state': stateName, 'translate': translated - started, 'polygonize': time.time() - translated,
+            'polygons': polygons, 'outputs': outputs}
+
+# run the state jobs concurrently in a process pool, splitting the cores among them
+# for the tile workers of each polygonize
+# @param
+#     [tiffNames] - state rasters in downloadDir
+#     [p] - pattern whose group 2 is the state abbreviation
+#     [workers] - number of states processed at once
+#     [report] - callable receiving one line per state and a summary
+# @return the timing breakdown of every state
+def run(tiffNames, p, rasterName, downloadDir, outputDir, vectorFormat='shp', workers=4, report=print):
+    if not tiffNames:
+        return []
+    started = time.time()
+    workers = max(1, min(workers, len(tiffNames)))
+    polygonWorkers = max(1, (os.cpu_count() or 1)//workers)
+    timings = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(stateJob, tiffName, p, rasterName, downloadDir, outputDir, vectorFormat, polygonWorkers)
+                   for tiffName in tiffNames]
+        for future in as_completed(futures):
+            timing = future.result()
+            timings.append(timing)
+            report('state {state}: translate {translate:.1f} s, polygonize {polygonize:.1f} s, {polygons} polygons'.format(**timing))
+    report('{0} states in {1:.1f} s, {2:.1f} s of state work'.format(len(timings), time.time() - started,
+           sum(t['translate'] + t['polygonize'] for t in timings)))
+    return sorted(timings, key=lambda t: t['state'])
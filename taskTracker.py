@@ -0,0 +1,113 @@
+from __future__ import print_function
+import time
+
+# GEE task states
+FINISHED_STATES = ('COMPLETED', 'FAILED', 'CANCELLED')
+# a running task is near completion once it has run this share of the typical runtime
+NEAR_COMPLETION = 0.75
+
+# Tracks our GEE export tasks with one task list fetch per polling cycle
+# @param
+#     [ids] - ids of the tasks we submitted
+#     [fetch] - callable answering the account task list, e.g. ee.data.getTaskList
+#     [minDelay] - seconds between polls while tasks are finishing
+#     [maxDelay] - seconds between polls while tasks only sit in the queue
+#     [report] - callable receiving one line of status per poll
+class TaskTracker(object):
+
+    def __init__(self, ids, fetch, minDelay=30, maxDelay=5*60, report=print, clock=time.time, sleep=time.sleep):
+        self.ids = set(filter(None, ids))
+        self.fetch = fetch
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.report = report
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = {}
+        self.transitions = []
+        self.delay = minDelay
+        self._changed = False
+
+    # answer the state of a task, None until it shows up in the task list
+    def state(self, taskId):
+        task = self.tasks.get(taskId)
+        return task['state'] if task else None
+
+    def _count(self, states):
+        return sum(1 for i in self.ids if self.state(i) in states)
+
+    # answer the number of our tasks still queued or running
+    def pending(self):
+        return self._count(('READY', 'RUNNING'))
+
+    # answer the number of our tasks that completed
+    def completed(self):
+        return self._count(('COMPLETED',))
+
+    # answer our tasks that failed or were cancelled
+    def failed(self):
+        return [self.tasks[i] for i in self.ids if self.state(i) in ('FAILED', 'CANCELLED')]
+
+    # answer True once every task reached a final state
+    def finished(self):
+        return self._count(FINISHED_STATES) == len(self.ids)
+
+    # fetch the task list once and record state transitions of our tasks
+    # @return the tasks that became COMPLETED since the previous poll
+    def poll(self):
+        now = self.clock()
+        newlyCompleted = []
+        self._changed = False
+        for task in self.fetch():
+            taskId = task.get('id')
+            if taskId not in self.ids:
+                continue
+            old = self.state(taskId)
+            self.tasks[taskId] = task
+            if task['state'] != old:
+                self._changed = True
+                self.transitions.append((now, taskId, old, task['state']))
+                if task['state'] == 'COMPLETED':
+                    newlyCompleted.append(task)
+        self.report('pending tasks: {0}, completed tasks: {1} of {2}'.format(self.pending(), self.completed(), len(self.ids)))
+        for task in newlyCompleted:
+            self.report('completed task: {0}'.format(task.get('description', task['id'])))
+        return newlyCompleted
+
+    # answer the typical runtime in ms of our completed tasks, None before any completes
+    def _typicalRuntime(self):
+        runtimes = sorted(t['update_timestamp_ms'] - t['start_timestamp_ms'] for t in self.tasks.values()
+                          if t['state'] == 'COMPLETED' and 'start_timestamp_ms' in t and 'update_timestamp_ms' in t)
+        return runtimes[len(runtimes)//2] if runtimes else None
+
+    # answer True when a running task is likely to finish soon
+    def _nearCompletion(self):
+        typical = self._typicalRuntime()
+        nowMs = self.clock()*1000
+        for t in self.tasks.values():
+            if t['state'] != 'RUNNING':
+                continue
+            if t.get('progress', 0) >= NEAR_COMPLETION:
+                return True
+            if typical and 'start_timestamp_ms' in t and nowMs - t['start_timestamp_ms'] >= NEAR_COMPLETION*typical:
+                return True
+        return False
+
+    # answer the seconds to wait before the next poll: quick while tasks change state or
+    # are close to finishing, backing off while they run, slow while they are only queued
+    def nextDelay(self):
+        if self._changed or self._nearCompletion():
+            self.delay = self.minDelay
+        elif self._count(('RUNNING',)):
+            self.delay = min(self.delay*2, self.maxDelay)
+        else:
+            self.delay = self.maxDelay
+        return self.delay
+
+    # poll until every task is final, yielding the tasks each poll saw complete, empty when none did
+    def iterPolls(self):
+        while True:
+            yield self.poll()
+            if self.finished():
+                break
+            self.sleep(self.nextDelay())
@@ -0,0 +1,70 @@
+from __future__ import print_function
+import os
+import numpy as np
+import pytest
+from changeEngine import COMPOSITE_BANDS, COMPOSITE_NODATA, ChangeEngine, changeBlock, divide, make255, normalizedDifference
+
+# fixtures are binary fractions, so every value below is exact in float32 and computed by hand
+
+def bands(**values):
+    return dict((band, (np.array(v, dtype=np.float64), np.ones(len(v), dtype=bool))) for band, v in values.items())
+
+# GEE's divide answers 0 where the divisor is 0
+def test_divideByZeroIsZero():
+    assert divide(np.array([1.0, 3.0, -2.0]), np.array([0.0, 4.0, 0.0])).tolist() == [0.0, 0.75, 0.0]
+
+# GEE's normalizedDifference masks a pixel where either band is negative
+def test_negativeBandIsMasked():
+    nd, valid = normalizedDifference(np.array([0.75, -0.25, 0.5]), np.array([0.25, 0.25, -0.5]))
+    assert nd[0] == 0.5
+    assert valid.tolist() == [True, False, False]
+
+# the float to uint8 cast of make255 truncates toward zero, it does not round
+def test_castTruncates():
+    assert make255(np.array([10.9, -10.9, 0.5, -0.5])).tolist() == [138, 117, 128, 127]
+
+# percent change is clamped to -127..127 before the 128 offset
+def test_valuesClampTo255():
+    assert make255(np.array([127.0, 500.0, -127.0, -500.0])).tolist() == [255, 255, 1, 1]
+
+# yearOne NDMI (0.75-0.25)/(0.75+0.25) = 0.5, yearTwo NDMI 0, change (0-0.5)/0.5 = -100% -> 28;
+# SWIR 0.5 -> 0.625 is +25% -> 153; a 0 yearOne SWIR divides by zero, 0% -> 128
+def test_changeBlockByHand():
+    yearOne = bands(nir=[0.75, 0.75], swir1=[0.25, 0.25], red=[0.25, 0.25], swir2=[0.5, 0.0], green=[0.125, 0.125])
+    yearTwo = bands(nir=[0.5, 0.5], swir1=[0.5, 0.5], red=[0.25, 0.25], swir2=[0.625, 0.625], green=[0.125, 0.125])
+    changes = changeBlock(yearOne, yearTwo, ['NDMI', 'SWIR'])
+    assert changes['NDMI'].tolist() == [28, 28]
+    assert changes['SWIR'].tolist() == [153, 128]
+
+# water, where the green/swir1 NDWI of yearTwo is above 0, and a negative band come out as the masked 0
+def test_changeBlockMasks():
+    yearOne = bands(nir=[0.75, 0.75], swir1=[0.25, 0.25], red=[-0.25, 0.25], swir2=[0.5, 0.5], green=[0.125, 0.125])
+    yearTwo = bands(nir=[0.5, 0.5], swir1=[0.5, 0.125], red=[0.25, 0.25], swir2=[0.625, 0.625], green=[0.125, 0.5])
+    changes = changeBlock(yearOne, yearTwo, ['NDVI', 'SWIR'])
+    assert changes['NDVI'].tolist() == [0, 0]
+    assert changes['SWIR'].tolist() == [153, 0]
+    assert changeBlock(yearOne, yearTwo, ['SWIR'], waterThreshold=None)['SWIR'].tolist() == [153, 153]
+
+# the engine reads composites in COMPOSITE_BANDS order, honours their nodata and writes the change COGs
+def test_engineWritesChangeCOGs(tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    from rasterio.transform import from_origin
+    yearOne = dict(blue=0.125, green=0.125, red=0.25, nir=0.75, swir1=0.25, swir2=0.5)
+    yearTwo = dict(blue=0.125, green=0.125, red=0.25, nir=0.5, swir1=0.5, swir2=0.625)
+    paths = []
+    for name, values in [('baseline', yearOne), ('current', yearTwo)]:
+        path = str(tmp_path / (name + '.tif'))
+        data = np.array([np.full((40, 40), values[band]) for band in COMPOSITE_BANDS])
+        data[:, 0, 0] = COMPOSITE_NODATA
+        with rasterio.open(path, 'w', driver='GTiff', width=40, height=40, count=len(COMPOSITE_BANDS), dtype='float64',
+                           crs='EPSG:4326', transform=from_origin(-90, 35, 0.00027, 0.00027), nodata=COMPOSITE_NODATA) as dst:
+            dst.write(data)
+        paths.append(path)
+    outPaths = dict((index, str(tmp_path / (index + '.tif'))) for index in ['SWIR', 'NDMI'])
+    ChangeEngine(paths[0], paths[1], workers=2, blockSize=16).run(outPaths)
+    for index, expected in [('SWIR', 153), ('NDMI', 28)]:
+        with rasterio.open(outPaths[index]) as src:
+            change = src.read(1)
+        assert change[0, 0] == 0
+        assert (change.ravel()[1:] == expected).all()
+        assert not os.path.exists(outPaths[index] + '.blocks.tif')
@@ -0,0 +1,115 @@
+from __future__ import print_function
+import datetime, importlib, sys, types
+import pytest
+from compositeCache import CACHE_GRID, CACHE_VERSION, CompositeCache, cacheKey
+
+ROOT = 'users/test/compositeCache'
+
+class EEException(Exception):
+    pass
+
+# stand-in for an ee.Image, recording the grid it was reprojected to
+class FakeImage(object):
+
+    def __init__(self, source, grid=None):
+        self.source = source
+        self.grid = grid
+
+    def reproject(self, crs, crsTransform):
+        return FakeImage(self.source, {'crs': crs, 'crsTransform': crsTransform})
+
+class FakeTask(object):
+
+    def __init__(self, ee, config):
+        self.ee = ee
+        self.config = config
+
+    def start(self):
+        self.ee.exports.append(self.config)
+        self.ee.taskList.append({'description': self.config['description'], 'state': 'READY'})
+
+# stand-in for the ee module, holding the assets of one folder and the exports started
+class FakeEE(object):
+    EEException = EEException
+
+    def __init__(self, assets=()):
+        self.assets = set(assets)
+        self.exports = []
+        self.taskList = []
+        self.data = types.SimpleNamespace(getAsset=self._getAsset, createAsset=lambda value, path: self.assets.add(path),
+                                          listAssets=self._listAssets, deleteAsset=self.assets.remove, getTaskList=lambda: self.taskList)
+        self.batch = types.SimpleNamespace(Export=types.SimpleNamespace(image=types.SimpleNamespace(toAsset=lambda **config: FakeTask(self, config))))
+
+    def _getAsset(self, assetId):
+        if assetId not in self.assets:
+            raise EEException('Asset {0} not found.'.format(assetId))
+        return {'id': assetId}
+
+    def _listAssets(self, params):
+        return {'assets': [{'id': a} for a in sorted(self.assets) if a.startswith(params['parent'] + '/')]}
+
+    def Image(self, assetId):
+        return FakeImage(assetId)
+
+def composite(ee, end='2024-03-31', reports=None):
+    cache = CompositeCache(ee, ROOT, (reports if reports is not None else []).append)
+    return cache.composite('LANDSAT/LC08/C02/T1_L2', '2023-11-01', end, 'maskLandsatClouds', lambda: FakeImage('computed'), 'region')
+
+def test_cacheKeyIsVersioned():
+    key = cacheKey('LANDSAT/LC08/C02/T1_L2', '2023-11-01', '2024-03-31', 'maskLandsatClouds')
+    assert key == 'v{0}_LANDSAT_LC08_C02_T1_L2_2023-11-01_2024-03-31_maskLandsatClouds'.format(CACHE_VERSION)
+
+# a miss computes the composite, exports it on the cache grid and evicts the assets it replaces,
+# those of an earlier cache version and of an earlier window of the same sensor and mask
+def test_missExportsAndEvictsOlderVersions():
+    key = cacheKey('LANDSAT/LC08/C02/T1_L2', '2023-11-01', '2024-03-31', 'maskLandsatClouds')
+    older = ROOT + '/' + key.replace('v{0}_'.format(CACHE_VERSION), 'v{0}_'.format(CACHE_VERSION - 1))
+    earlier = ROOT + '/' + cacheKey('LANDSAT/LC08/C02/T1_L2', '2022-11-01', '2023-03-31', 'maskLandsatClouds')
+    other = ROOT + '/' + cacheKey('COPERNICUS/S2_SR_HARMONIZED', '2023-11-01', '2024-03-31', 'maskS2CloudsQA60')
+    ee = FakeEE([ROOT, older, earlier, other])
+    image = composite(ee)
+    assert image.source == 'computed' and image.grid == CACHE_GRID
+    assert ee.assets == set([ROOT, other])
+    assert len(ee.exports) == 1
+    export = ee.exports[0]
+    assert export['assetId'] == ROOT + '/' + key
+    assert (export['crs'], export['crsTransform']) == (CACHE_GRID['crs'], CACHE_GRID['crsTransform'])
+    assert 'scale' not in export
+
+# a hit reads the asset on the cache grid and exports nothing
+def test_hitReadsAssetOnCacheGrid():
+    assetId = ROOT + '/' + cacheKey('LANDSAT/LC08/C02/T1_L2', '2023-11-01', '2024-03-31', 'maskLandsatClouds')
+    ee = FakeEE([ROOT, assetId])
+    image = composite(ee)
+    assert image.source == assetId and image.grid == CACHE_GRID
+    assert ee.exports == []
+
+# a run while the export of its key is still going computes the composite without exporting again
+def test_pendingExportIsNotRepeated():
+    ee = FakeEE([ROOT])
+    composite(ee)
+    image = composite(ee)
+    assert image.source == 'computed' and image.grid == CACHE_GRID
+    assert len(ee.exports) == 1
+
+@pytest.fixture
+def latestChangeProducts(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'ee', types.ModuleType('ee'))
+    monkeypatch.delitem(sys.modules, 'latestChangeProducts', raising=False)
+    return importlib.import_module('latestChangeProducts')
+
+def ms(year, month, day):
+    return int((datetime.datetime(year, month, day) - datetime.datetime(1970, 1, 1)).total_seconds()*1000)
+
+# until 30 days after the end of winter the baseline window ends 30 days ago and moves daily, so it is
+# not cached; from then on it ends on March 31 and is
+@pytest.mark.parametrize('now, baselineEnd, closed', [
+    (ms(2024, 1, 15), datetime.date(2023, 12, 16), False),
+    (ms(2024, 4, 29), datetime.date(2024, 3, 30), False),
+    (ms(2024, 4, 30), datetime.date(2024, 3, 31), True),
+    (ms(2024, 10, 1), datetime.date(2024, 3, 31), True),
+])
+def test_baselineClosesAtEndOfWinter(latestChangeProducts, now, baselineEnd, closed):
+    dates = latestChangeProducts.changeDates(now)
+    assert (dates['baselineEnd'], dates['baselineClosed']) == (baselineEnd, closed)
+    assert (dates['startYear'], dates['secondYear']) == (2024, 2023)
@@ -0,0 +1,55 @@
+from __future__ import print_function
+import types
+import pytest
+from exportPlan import ExportPlan
+
+class FakeTask(object):
+
+    def __init__(self, batch, config):
+        self.batch = batch
+        self.config = config
+        self.id = 'TASK-' + config['description']
+
+    def start(self):
+        if self.config['description'] in self.batch.refused:
+            raise RuntimeError('Too many tasks already in the queue')
+        self.batch.started.append(self.id)
+
+# stand-in for ee.batch, refusing to start the exports whose descriptions are given
+class FakeBatch(object):
+
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.started = []
+        exports = types.SimpleNamespace(toDrive=lambda **config: FakeTask(self, config))
+        self.Export = types.SimpleNamespace(image=exports, table=exports)
+
+def plan(batch, lines):
+    plan = ExportPlan(batch, {'scale': 30}, workers=2, report=lines.append)
+    for name in ['SWIR', 'NDVI', 'NDMI']:
+        plan.add('image', {'description': name})
+    plan.add('table', {'description': 'scenesBegin'})
+    return plan
+
+def test_submitWritesIdsInOrder(tmp_path):
+    ids = plan(FakeBatch(), []).submit(str(tmp_path/'ids.txt'))
+    assert ids == ['TASK-SWIR', 'TASK-NDVI', 'TASK-NDMI', 'TASK-scenesBegin']
+    assert (tmp_path/'ids.txt').read_text() == ',TASK-SWIR,TASK-NDVI,TASK-NDMI,TASK-scenesBegin'
+
+# the tasks that started are running on GEE, so their ids are written before the failure is raised
+def test_submitWritesStartedIdsThenRaises(tmp_path):
+    batch, lines = FakeBatch(refused=['NDVI']), []
+    with pytest.raises(RuntimeError, match='Too many tasks'):
+        plan(batch, lines).submit(str(tmp_path/'ids.txt'))
+    assert (tmp_path/'ids.txt').read_text() == ',TASK-SWIR,TASK-NDMI,TASK-scenesBegin'
+    assert sorted(batch.started) == ['TASK-NDMI', 'TASK-SWIR', 'TASK-scenesBegin']
+    assert lines[0] == 'export NDVI failed to start: Too many tasks already in the queue'
+    assert lines[1].startswith('submitted 3 of 4 exports')
+
+def test_addImageRegionsAppliesSettings():
+    p = ExportPlan(FakeBatch(), {'scale': 30, 'formatOptions': {'cloudOptimized': True}})
+    clipped = types.SimpleNamespace(clipToCollection=lambda boundary: 'clipped')
+    p.addImageRegions(clipped, [('', 'east', 'CONUS', True), ('', 'islands', 'PRVI', False)],
+                      lambda part, region: 'SWIR' + part + region, 'boundary', formatOptions={'noData': -1})
+    assert [(c['description'], c['image'], c['region'], c['scale'], c['formatOptions']) for kind, c in p.exports] == [
+        ('SWIRCONUS', 'clipped', 'east', 30, {'noData': -1}), ('SWIRPRVI', clipped, 'islands', 30, {'noData': -1})]
@@ -0,0 +1,91 @@
+from __future__ import print_function
+import boto3
+import pytest
+from moto import mock_aws
+from publishManifest import PublishManifest
+from s3Publisher import S3Publisher
+
+BUCKET = 'data.southfact.test'
+PREFIX = 'current-year-to-date/'
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+def publisher(client, lines):
+    published = PublishManifest(client, BUCKET, PREFIX, lines.append)
+    return S3Publisher(BUCKET, PREFIX, client=client, workers=2, published=published, report=lines.append)
+
+# a file the publish manifest of an earlier run holds unchanged is not uploaded again
+def test_uploadOneSkipsUnchangedObject(client, tmp_path):
+    path = tmp_path/'swirLatestChangeL8PRVI.tif'
+    path.write_bytes(b'change' * 100)
+    first = publisher(client, [])
+    assert first.uploadOne(str(path))['key'] == PREFIX + 'swirLatestChangeL8PRVI.tif'
+    first.published.save()
+    lines = []
+    second = publisher(client, lines)
+    result = second.uploadOne(str(path))
+    assert result['skipped'] and result['bytes'] == 600
+    assert second.timings == []
+    assert lines == ['Unchanged s3://{0}/{1}swirLatestChangeL8PRVI.tif (0.0 MB), not uploaded'.format(BUCKET, PREFIX)]
+
+# a file whose content changed is uploaded again although its size did not
+def test_uploadOneUploadsChangedObject(client, tmp_path):
+    path = tmp_path/'swirLatestChangeL8PRVI.tif'
+    path.write_bytes(b'a' * 100)
+    first = publisher(client, [])
+    first.uploadOne(str(path))
+    first.published.save()
+    path.write_bytes(b'b' * 100)
+    second = publisher(client, [])
+    assert 'skipped' not in second.uploadOne(str(path))
+    assert client.get_object(Bucket=BUCKET, Key=PREFIX + 'swirLatestChangeL8PRVI.tif')['Body'].read() == b'b' * 100
+
+def test_uploadOneAnswersNoneWhenRefused(client, tmp_path):
+    path = tmp_path/'a.tif'
+    path.write_bytes(b'a')
+    assert S3Publisher('missing-bucket', client=client, report=lambda line: None).uploadOne(str(path)) is None
+
+# verify flags objects whose size differs from the one recorded, and missing objects
+def test_verifyFlagsSizeMismatch(client):
+    client.put_object(Bucket=BUCKET, Key='good.tif', Body=b'x' * 10)
+    client.put_object(Bucket=BUCKET, Key='short.tif', Body=b'x' * 9)
+    p = S3Publisher(BUCKET, client=client, report=lambda line: None)
+    assert p.verify([(BUCKET, 'good.tif', 10), (BUCKET, 'short.tif', 10), (BUCKET, 'gone.tif', 10)]) == ['short.tif', 'gone.tif']
+
+# an object GDAL wrote through /vsis3/ is made public, and the publish manifest forgets it as there
+# is no local copy to hash
+def test_finishDirectMakesObjectPublic(client, tmp_path):
+    path = tmp_path/'swirLatestChangeL8CONUS.tif'
+    path.write_bytes(b'old')
+    first = publisher(client, [])
+    first.uploadOne(str(path))
+    first.published.save()
+    client.put_object(Bucket=BUCKET, Key=PREFIX + 'swirLatestChangeL8CONUS.tif', Body=b'written by GDAL')
+    lines = []
+    second = publisher(client, lines)
+    result = second.finishDirect('swirLatestChangeL8CONUS.tif', 2.0)
+    assert (result['key'], result['bytes'], result['direct']) == (PREFIX + 'swirLatestChangeL8CONUS.tif', 15, True)
+    grants = client.get_object_acl(Bucket=BUCKET, Key=PREFIX + 'swirLatestChangeL8CONUS.tif')['Grants']
+    assert any(g['Grantee'].get('URI', '').endswith('/AllUsers') and g['Permission'] == 'READ' for g in grants)
+    assert PREFIX + 'swirLatestChangeL8CONUS.tif' not in second.published.objects
+    assert second.verify([(BUCKET, result['key'], result['bytes'])]) == []
+
+# the tiles of a pyramid go up without a manifest entry each, the tree is recorded once
+def test_publishTreeRecordsOneEntry(client, tmp_path):
+    for z, x, y in [(0, 0, 0), (1, 0, 1), (1, 1, 1)]:
+        (tmp_path/str(z)/str(x)).mkdir(parents=True, exist_ok=True)
+        (tmp_path/str(z)/str(x)/'{0}.png'.format(y)).write_bytes(b'png')
+    p = publisher(client, [])
+    results = p.publishTree(str(tmp_path), PREFIX + 'swirLatestChangeL8CONUS.tiles/')
+    assert sorted(r['key'] for r in results) == [PREFIX + 'swirLatestChangeL8CONUS.tiles/' + k for k in ['0/0/0.png', '1/0/1.png', '1/1/1.png']]
+    assert client.get_object(Bucket=BUCKET, Key=PREFIX + 'swirLatestChangeL8CONUS.tiles/1/1/1.png')['Body'].read() == b'png'
+    assert list(p.published.objects) == [PREFIX + 'swirLatestChangeL8CONUS.tiles/']
+    assert (p.published.objects[PREFIX + 'swirLatestChangeL8CONUS.tiles/']['files'], p.published.objects[PREFIX + 'swirLatestChangeL8CONUS.tiles/']['size']) == (3, 9)
+    assert [t['key'] for t in p.timings] == [PREFIX + 'swirLatestChangeL8CONUS.tiles/']
@@ -1,18 +1,20 @@
-import ee, datetime, argparse, pdb, collections
-from userConfig import ids_file
-service_account = 'aws-southfact-product-generati@awsproductgeneration.iam.gserviceaccount.com'
-credentials = ee.ServiceAccountCredentials(service_account, '../keys/awsproductgeneration-8463a020b9aa.json')
-collections.Callable = collections.abc.Callable
-ee.Initialize(credentials)
-
+import ee, datetime, argparse, collections
+from exportPlan import ExportPlan, IMAGE_DEFAULTS, DEFAULT_WORKERS
+from eeRoundTrips import RoundTripCounter, DEFAULT_BUDGET
+from stateShapes import SGSF_STATES
+SERVICE_ACCOUNT = 'aws-southfact-product-generati@awsproductgeneration.iam.gserviceaccount.com'
+KEY_FILE = '../keys/awsproductgeneration-8463a020b9aa.json'
 
 def parseCmdLine():
     # Will parse the arguments provided on the command line.
     parser = argparse.ArgumentParser(description='Generate statewide products for SGSF region.')
     parser.add_argument("startYear", help="string, the current year")
     parser.add_argument('-S2',help="Sentinel-2 yearly change products. Default is for Landsat 8 change.", action='store_true')    
+    parser.add_argument('-stateShapes',help="also export the change polygons of every state as GeoJSON, made on the server", action='store_true')
+    parser.add_argument('-exportWorkers',help="number of export tasks submitted to GEE at once", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('-roundTripBudget',help="fail the run when it makes more EE requests than this, 0 for no limit", type=int, default=DEFAULT_BUDGET)
     ns = parser.parse_args()
-    return [ns.S2, ns.startYear]
+    return ns
 
 # add band to identify unix time of every pixel used in the composite
 def addDateBand(image): 
@@ -114,173 +116,123 @@ def oneBandDiff(compositeYearOne, compositeYearTwo, band1):
   YearOneYearTwoPercent = YearOneYearTwoDivide.multiply(100)
   image255 = make255(YearOneYearTwoPercent, band1)
   return image255
-def getGeometry(feature):
-  # Keep this list of properties.
-  keepProperties = ['state_abbr']
-  # Get the centroid of the feature's geometry.
-  geom = feature.geometry().bounds()
-  # Return a new Feature, copying properties from the old Feature.
-  return ee.Feature(geom).copyProperties(feature, keepProperties)
- 
+
+# change polygons smaller than this many sq m are dropped
+MIN_CHANGE_AREA = 40468
+# side in m of the grid cells each state's change polygons are found in
+SHAPE_GRID = 250000
+
 def addArea(feature) :
     return feature.set('area', feature.geometry().area(1));
 
-
-def createStateShapes(feature, image) : 
-    # create the changeShapes for each grid cell
+# answer the large change polygons of a region, computed on the server
+def changeShapes(image, region) : 
     changeShapes= image.gt(186).reduceToVectors(
         reducer = ee.Reducer.countEvery(),
-        geometry = feature.geometry(1),
+        geometry = region,
         scale = 30,
         maxPixels = 1e13,
         tileScale = 16,
         eightConnected = False); 
     changeShapes = changeShapes.map(addArea);
-    largeChanges = changeShapes.filter(ee.Filter.gt('area', 40468));
-    return largeChanges.getInfo();
-
-dir
-
-
-
-
-
-
-# exports to Google Drive
-def exportSHP(image, exportName,productName):
-  geometries=states.map(getGeometry).getInfo().get('features')
-  # loop on client side
-  #https://gis.stackexchange.com/questions/236707/how-can-i-export-a-set-of-images-from-google-earth-engine/237065#237065
-  for geom in geometries:
-    feature=ee.Feature(geom);
-    grids=(feature.geometry(1).coveringGrid(feature.geometry(1).projection(),250000));
-    abbr = feature.get('state_abbr').getInfo();
-    region = ee.Geometry(geometry).intersection(feature.geometry(),1).bounds();
-    print(abbr+' geometry', region.getInfo());
-    #https://gis.stackexchange.com/questions/326131/error-in-export-image-from-google-earth-engine-from-python-api
-    fc =grids.map(createStateShapes(feature, image))
-    fc =fc.flatten()
-    task_config={'collection': fc, 'description': 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear+'shapes'+productName}
-    task = ee.batch.Export.image.toDrive(**task_config)
-    task.start()
-    ids_file.write(',{0}'.format(task.id))
-
-# exports image to Google Drive for a larger area than states
-def exportRegionGeoTiff(image, exportName, productName):
-  conus = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'PR'),(ee.Filter.eq('state_abbr', 'VI'))).Not()).geometry().bounds();
-  prvi = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'PR'),(ee.Filter.eq('state_abbr', 'VI')))).geometry().bounds();
-  task_config={'image':image.clipToCollection(boundary),
-               'region':conus,
-               'description':exportName+productName+'CONUS',
-               'scale':30,
-               'maxPixels':1e13,
-               'fileDimensions': [35840,56320],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))
-  task_config={'image':image.clipToCollection(boundary),
-               'region':prvi,
-               'description':exportName+productName+'PRVI',
-               'scale':30,
-               'maxPixels':1e13,
-#               'shardSize': 10*256,
-               'fileDimensions': [35840,56320],
-               'formatOptions': {'cloudOptimized': True}}
-  task = ee.batch.Export.image.toDrive(**task_config)
-  task.start()
-  ids_file.write(',{0}'.format(task.id))
- 
-
-
-def sceneFeatures(scene):
-  return ee.Feature(geometry, {'value': scene})
- 
-boundary = ee.FeatureCollection("users/landsatfact/clipSGSFCONUS")
-states = ee.FeatureCollection("users/landsatfact/SGSF_states")
-water = ee.Image("users/landsatfact/sgsfWaterMask")
-S2, startYear = parseCmdLine() 
-pdb.set_trace()
-ids_file = open(ids_file, "w+")
-LANDSAT8 = 'LANDSAT/LC08/C02/T1_L2'
-Sentinel2 = 'COPERNICUS/S2_SR_HARMONIZED'
+    return changeShapes.filter(ee.Filter.gt('area', MIN_CHANGE_AREA));
+
+# settings shared by the yearly image exports, in fewer and larger files than the latest change products
+YEARLY_IMAGE_DEFAULTS = dict(IMAGE_DEFAULTS, fileDimensions=[35840,56320])
+del YEARLY_IMAGE_DEFAULTS['shardSize']
+# cloud mask, bands and names of each sensor
+SENSORS = {
+  'L8': {'swir2': 'SR_B7', 'SATELLITE': 'LANDSAT/LC08/C02/T1_L2', 'mask': maskLandsatClouds, 'dateID': 'LANDSAT_SCENE_ID', 'productName': 'L8'},
+  'S2': {'swir2': 'B12', 'SATELLITE': 'COPERNICUS/S2_SR_HARMONIZED', 'mask': maskS2CloudsQA60, 'dateID': 'DATATAKE_IDENTIFIER', 'productName': 'S2'},
+}
 beginDay='-11-01'
 endDay='-03-31'
-secondYear = str(int(startYear)-1)
-beginWinter = str(int(secondYear)-1)
-endWinter = str(int(startYear)+1)
-#waterThreshold = 0
-geometry = states.geometry().bounds()
-
-# set default bands and cloud mask
-if S2:
-    nir = 'B8'
-    red = 'B4'
-    blue = 'B2'
-    green = 'B3'
-    swir1 = 'B11'
-    swir2 = 'B12'
-    SATELLITE = 'COPERNICUS/S2_SR_HARMONIZED'
-    mask = maskS2CloudsQA60
-    dateID = 'DATATAKE_IDENTIFIER'
-    productName = 'S2'
-else:
-    nir = 'SR_B5'
-    red = 'SR_B4'
-    blue = 'SR_B2'
-    green = 'SR_B3'
-    swir1 = 'SR_B6'
-    swir2 = 'SR_B7'
-    SATELLITE = 'LANDSAT/LC08/C02/T1_L2'
-    mask = maskLandsatClouds
-    dateID = 'LANDSAT_SCENE_ID'
-    productName = 'L8'
-#pdb.set_trace()
-# Collect one year of changes over the start and second years, for a date range  
-# from the beginning of secondYear winter in secondYear - 1 to end of startYear winter in startYear + 1
-
-#for cloud masking with S2_CLOUD_PROBABILITY which is roughly 4 times slower
-'''
-if S2:
-    collectionRangeStart = maskedS2Collection(secondYear + beginDay, startYear + endDay).map(addDateBand)
-    collectionRangeEnd = maskedS2Collection(startYear + beginDay, endWinter + endDay).map(addDateBand)
-    compositeRangeStart = collectionRangeStart.median()
-    compositeRangeEnd = collectionRangeEnd.median()
-else:'''
-collectionRangeStart = ee.ImageCollection(SATELLITE).filter(ee.Filter.date(secondYear + beginDay, startYear + endDay)).map(addDateBand)
-collectionRangeEnd = ee.ImageCollection(SATELLITE).filter(ee.Filter.date(startYear + beginDay, endWinter + endDay)).map(addDateBand)
-compositeRangeStart = collectionRangeStart.map(mask).median()
-compositeRangeEnd = collectionRangeEnd.map(mask).median()
-
-compositeStartYear = compositeRangeEnd # Start Year average - "custom request"
-compositeSecondYear = compositeRangeStart # Second Year average - "custom request"
-
-# add the NDWI band to the image so we can get water masks
-#ndwi = compositeStartYear.normalizedDifference([green, swir1]).rename('NDWI')
-
-# update composites with water masks
-compositeStartYear = compositeStartYear.updateMask(water.select('b1').neq(1))
-compositeSecondYear = compositeSecondYear.updateMask(water.select('b1').neq(1))
-
-# SWIR change
-SWIRChangeCustomRange = oneBandDiff(compositeSecondYear,compositeStartYear, swir2)
-
-# First export the set of imagery sources for each pixel comparison used in building SWIRChangeCustomRange
-#exportRegionGeoTiff(compositeStartYear.select(['system:time_start'], ['observationDate']), 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear+'datesBegin',productName)
-#exportRegionGeoTiff(compositeSecondYear.select(['system:time_start'], ['observationDate']), 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear+'datesEnd',productName)
-# Then the set of scenes used in building the images
-ag_array=collectionRangeStart.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
-fc = ee.FeatureCollection(ag_array.map(sceneFeatures))
-task_config={'collection': fc, 'description': 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear+'scenesBegin'+productName}	
-task = ee.batch.Export.table.toDrive(**task_config)
-task.start()
-ids_file.write(',{0}'.format(task.id))
-ag_array=collectionRangeEnd.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
-fc = ee.FeatureCollection(ag_array.map(sceneFeatures))
-task_config={'collection': fc, 'description': 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear+'scenesEnd'+productName}	
-task = ee.batch.Export.table.toDrive(**task_config)
-task.start()
-ids_file.write(',{0}'.format(task.id))
-#Lastly export the yearly product
-exportRegionGeoTiff(SWIRChangeCustomRange, 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear,productName)
-
+_initialized = []
+
+# initialize EE with the product generation service account, once per process
+def initialize():
+  if not _initialized:
+    collections.Callable = collections.abc.Callable
+    ee.Initialize(ee.ServiceAccountCredentials(SERVICE_ACCOUNT, KEY_FILE))
+    _initialized.append(True)
+
+# add one table export of the change polygons per state to the plan; the polygons of each cell of
+# a state's grid are found and filtered on the server, so nothing is pulled through getInfo
+# @param
+#     [exportName] - start of the description, the state and product name follow
+#     [stateAbbrs] - the states exported, each to its own GeoJSON file on Drive
+def exportSHP(plan, image, states, exportName, productName, stateAbbrs=SGSF_STATES):
+  for abbr in stateAbbrs:
+    state = states.filter(ee.Filter.eq('state_abbr', abbr)).geometry(1)
+    grids = state.coveringGrid(ee.Projection('EPSG:5070'), SHAPE_GRID)
+    fc = grids.map(lambda cell: changeShapes(image, cell.geometry().intersection(state, 1))).flatten()
+    plan.add('table', {'collection': fc, 'description': exportName+'shapes'+abbr+productName, 'fileFormat': 'GeoJSON'})
+
+# add the exports of an image for a larger area than states, CONUS and PRVI, to the plan
+def exportRegionGeoTiff(plan, image, exportName, productName, states, boundary):
+  conus = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'PR'),(ee.Filter.eq('state_abbr', 'VI'))).Not()).geometry().bounds();
+  prvi = states.filter(ee.Filter.Or(ee.Filter.eq('state_abbr', 'PR'),(ee.Filter.eq('state_abbr', 'VI')))).geometry().bounds();
+  plan.addImageRegions(image, [('', conus, 'CONUS', True), ('', prvi, 'PRVI', True)],
+                       lambda part, region: exportName+productName+region, boundary)
+
+# answer a table of the scenes of a collection, one feature per scene id
+def sceneTable(collection, geometry, dateID):
+  scenes = collection.filterBounds(geometry).distinct(dateID).aggregate_array(dateID)
+  return ee.FeatureCollection(scenes.map(lambda scene: ee.Feature(geometry, {'value': scene})))
+
+# generate the yearly products of startYear: plan every export, then submit them at once
+# @param
+#     [sensor] - key of SENSORS, L8 or S2
+#     [startYear] - string, the current year; the change is against the year before
+#     [stateShapes] - also export the change polygons of every state
+#     [exportWorkers] - number of export tasks submitted to GEE at once
+#     [idsPath] - file the task ids are written to, None to skip it
+#     [budget] - most EE requests the run may make, None for no limit
+# @return the task ids
+def run(sensor, startYear, stateShapes=False, exportWorkers=DEFAULT_WORKERS, idsPath=None, budget=DEFAULT_BUDGET):
+  s = SENSORS[sensor]
+  startYear = str(startYear)
+  secondYear = str(int(startYear)-1)
+  endWinter = str(int(startYear)+1)
+  initialize()
+  with RoundTripCounter(ee, budget):
+    plan = ExportPlan(ee.batch, YEARLY_IMAGE_DEFAULTS, exportWorkers)
+    boundary = ee.FeatureCollection("users/landsatfact/clipSGSFCONUS")
+    states = ee.FeatureCollection("users/landsatfact/SGSF_states")
+    water = ee.Image("users/landsatfact/sgsfWaterMask")
+    geometry = states.geometry().bounds()
+
+    # Collect one year of changes over the start and second years, for a date range  
+    # from the beginning of secondYear winter in secondYear - 1 to end of startYear winter in startYear + 1
+    collectionRangeStart = ee.ImageCollection(s['SATELLITE']).filter(ee.Filter.date(secondYear + beginDay, startYear + endDay)).map(addDateBand)
+    collectionRangeEnd = ee.ImageCollection(s['SATELLITE']).filter(ee.Filter.date(startYear + beginDay, endWinter + endDay)).map(addDateBand)
+    compositeRangeStart = collectionRangeStart.map(s['mask']).median()
+    compositeRangeEnd = collectionRangeEnd.map(s['mask']).median()
+
+    compositeStartYear = compositeRangeEnd # Start Year average - "custom request"
+    compositeSecondYear = compositeRangeStart # Second Year average - "custom request"
+
+    # update composites with water masks
+    compositeStartYear = compositeStartYear.updateMask(water.select('b1').neq(1))
+    compositeSecondYear = compositeSecondYear.updateMask(water.select('b1').neq(1))
+
+    # SWIR change
+    SWIRChangeCustomRange = oneBandDiff(compositeSecondYear,compositeStartYear, s['swir2'])
+
+    # First the set of scenes used in building the images
+    described = 'SWIR-Custom-Change-Between-'+startYear+'-and-'+secondYear
+    plan.add('table', {'collection': sceneTable(collectionRangeStart, geometry, s['dateID']), 'description': described+'scenesBegin'+s['productName']})
+    plan.add('table', {'collection': sceneTable(collectionRangeEnd, geometry, s['dateID']), 'description': described+'scenesEnd'+s['productName']})
+    #Lastly export the yearly product
+    exportRegionGeoTiff(plan, SWIRChangeCustomRange, described, s['productName'], states, boundary)
+    if stateShapes:
+      exportSHP(plan, SWIRChangeCustomRange, states, described, s['productName'])
+    return plan.submit(idsPath)
+
+def main():
+  args = parseCmdLine()
+  from userConfig import ids_file
+  run('S2' if args.S2 else 'L8', args.startYear, args.stateShapes, args.exportWorkers, ids_file, args.roundTripBudget or None)
+
+if __name__ == '__main__':
+  main()
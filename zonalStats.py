@@ -0,0 +1,120 @@
+from __future__ import print_function
+import argparse, csv, json, os, time
+from polygonizer import tileWindows, CHANGE_THRESHOLD
+
+ZONE_BLOCK = 4096
+TABLE_FIELDS = ['zone', 'pixels', 'validPixels', 'changePixels', 'changeHectares', 'percentChanged']
+
+# Zones of a boundary layer, e.g. the SGSF states or counties, reprojected once to the grid
+# CRS of the products and kept in a spatial index so each block rasterizes only the zones it touches
+# @param
+#     [path] - a vector file of the boundaries
+#     [field] - the attribute naming each zone, features sharing a value form one zone
+#     [crs] - CRS of the products
+class ZoneLayer(object):
+
+    def __init__(self, path, field, crs='EPSG:5070'):
+        import fiona, shapely
+        from rasterio.warp import transform_geom
+        from shapely.geometry import shape
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.zones = []
+        geometries, ids, index = [], [], {}
+        with fiona.open(path) as src:
+            for feature in src:
+                zone = str(feature['properties'][field])
+                if zone not in index:
+                    self.zones.append(zone)
+                    # raster value of the zone, 0 is outside every zone
+                    index[zone] = len(self.zones)
+                geometries.append(shape(transform_geom(src.crs, crs, feature['geometry'])))
+                ids.append(index[zone])
+        self.geometries = geometries
+        self.ids = ids
+        self.tree = shapely.STRtree(geometries)
+
+    # answer the zone of every pixel of a block, 0 outside the zones
+    def rasterize(self, shape, transform):
+        import numpy as np
+        from rasterio.features import rasterize
+        from shapely.geometry import box
+        height, width = shape
+        bounds = box(*(transform*(0, height)), *(transform*(width, 0)))
+        hits = self.tree.query(bounds)
+        if not len(hits):
+            return np.zeros(shape, dtype=np.int32)
+        return rasterize([(self.geometries[i], self.ids[i]) for i in hits], out_shape=shape, transform=transform, fill=0, dtype='int32')
+
+# answer per zone of every layer the 256 bucket histogram of a change product, reading it once block by block
+# @return (dict of layer name to an int64 array of shape (zones + 1, 256), row 0 being outside every zone,
+#          area of a pixel in sq m)
+def zoneHistograms(path, layers, blockSize=ZONE_BLOCK):
+    import numpy as np
+    import rasterio
+    from rasterio.windows import Window
+    histograms = dict((layer.name, np.zeros((len(layer.zones) + 1)*256, dtype=np.int64)) for layer in layers)
+    with rasterio.open(path) as src:
+        for window in tileWindows(src.width, src.height, blockSize):
+            w = Window(*window)
+            values = src.read(1, window=w).ravel().astype(np.int64)
+            transform = src.window_transform(w)
+            for layer in layers:
+                zones = layer.rasterize((window[3], window[2]), transform).ravel()
+                histograms[layer.name] += np.bincount(zones*256 + values, minlength=histograms[layer.name].size)
+        pixelArea = abs(src.transform.a*src.transform.e)
+    return dict((name, h.reshape(-1, 256)) for name, h in histograms.items()), pixelArea
+
+# answer the summary rows of one layer from its histograms; 0 is the masked value and change
+# pixels are those above threshold, counted without the area cut of the change polygons
+def zoneRows(layer, histogram, pixelArea, threshold=CHANGE_THRESHOLD):
+    rows = []
+    for i, zone in enumerate(layer.zones):
+        h = histogram[i + 1]
+        valid, change = int(h[1:].sum()), int(h[threshold + 1:].sum())
+        rows.append({'zone': zone, 'pixels': int(h.sum()), 'validPixels': valid, 'changePixels': change,
+                     'changeHectares': round(change*pixelArea/10000.0, 2),
+                     'percentChanged': round(100.0*change/valid, 4) if valid else 0.0})
+    return rows
+
+# write the zonal change tables of a product beside it, e.g. swirLatestChangeL8CONUS.zonal.counties.csv,
+# with the zone histograms in a .json of the same name, and a line to report
+# @return the paths written
+def writeZonalStats(path, layers, threshold=CHANGE_THRESHOLD, blockSize=ZONE_BLOCK, report=print):
+    started = time.time()
+    histograms, pixelArea = zoneHistograms(path, layers, blockSize)
+    outputs = []
+    for layer in layers:
+        base = '{0}.zonal.{1}'.format(os.path.splitext(path)[0], layer.name)
+        with open(base + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=TABLE_FIELDS)
+            writer.writeheader()
+            writer.writerows(zoneRows(layer, histograms[layer.name], pixelArea, threshold))
+        with open(base + '.json', 'w') as f:
+            json.dump({'file': os.path.basename(path), 'threshold': threshold, 'pixelArea': pixelArea,
+                       'histograms': dict((zone, histograms[layer.name][i + 1].tolist()) for i, zone in enumerate(layer.zones)
+                                          if histograms[layer.name][i + 1].any())}, f, sort_keys=True)
+        outputs.extend([base + '.csv', base + '.json'])
+    report('Zonal statistics of {0} for {1} in {2:.1f} s'.format(os.path.basename(path), ', '.join(l.name for l in layers), time.time() - started))
+    return outputs
+
+# answer the zone layers of -zones arguments given as path:field
+def parseZones(specs, crs='EPSG:5070'):
+    return [ZoneLayer(*spec.rsplit(':', 1), crs=crs) for spec in specs]
+
+def parseCmdLine():
+    parser = argparse.ArgumentParser(description='Summarize the change of a product per state, county or other zone.')
+    parser.add_argument('product', help="a change product COG")
+    parser.add_argument('-zones', help="boundaries as path:field, e.g. counties.shp:GEOID, repeatable", action='append', required=True)
+    parser.add_argument('-threshold', help="change pixels are those above this value", type=int, default=CHANGE_THRESHOLD)
+    parser.add_argument('-blockSize', help="block width and height in pixels", type=int, default=ZONE_BLOCK)
+    return parser.parse_args()
+
+def main():
+    import rasterio
+    args = parseCmdLine()
+    with rasterio.open(args.product) as src:
+        crs = src.crs
+    writeZonalStats(args.product, parseZones(args.zones, crs), args.threshold, args.blockSize)
+
+if __name__ == '__main__':
+    main()